@@ -1,17 +1,23 @@
 from tools_agent_email.gmail_tools import GmailTools
 
-from agents import Agent
+from agents import Agent, ModelSettings
 
 from dotenv import load_dotenv
 
 from styleAgent import get_style_agent_tool
 
+from style_stage import AgentReply
+
+import os
+
 
 load_dotenv(override=True)
 
 # הגדרת הסוכן
 
-instructions = """
+STYLE_MODE = os.getenv("STYLE_MODE", "post").lower()
+
+instructions_intro = """
 
 You are an intelligent email assistant agent.
 
@@ -23,14 +29,19 @@ Your role is to manage email-related workflows for the user, such as:
 - Composing and sending new emails.
 
 
-CRITICAL: You do NOT perform any text styling or language refinement yourself.  
+"""
+
+# מצב "tool": כל תשובה עוברת דרך style_agent_tool בתוך הריצה (ההתנהגות הקודמת)
+style_tool_rules = """CRITICAL: You do NOT perform any text styling or language refinement yourself.  
 
 ALL messages returned to the user MUST first be processed through the tool 'style_agent_tool'.
 
 You MUST call style_agent_tool(input="your response text") before returning any text to the user.
 
 
-1. Workflow Modes
+"""
+
+instructions_workflow = """1. Workflow Modes
 
    You operate in one of the following modes:
 
@@ -56,6 +67,16 @@ You MUST call style_agent_tool(input="your response text") before returning any
 
      - delete_email_message(msg_id) (only if explicitly allowed)
 
+     - batch_delete_email_messages(msg_ids) (only if explicitly allowed; use it for more than one message instead of looping over delete_email_message)
+
+     - batch_modify_email_messages(msg_ids, action) with action "archive", "mark_read", "mark_unread", "star" or "unstar"
+
+     - search_local_emails(query, max_results) (if available: try it first for free-text searches, then fall back to search_emails)
+
+
+   When you need several independent calls (e.g. reading the details of five emails),
+   request them together in the same turn instead of one after another; they run in parallel.
+
 
    Example user intents:
 
@@ -105,7 +126,9 @@ You MUST call style_agent_tool(input="your response text") before returning any
    - After sending or cancelling the email, return to neutral mode.
 
 
-5. Using the Style Tool
+"""
+
+style_tool_section = """5. Using the Style Tool
 
    - Before sending any text to the user, you MUST call the tool 'style_agent_tool' with the parameter 'input' containing the text you want to send.
 
@@ -118,7 +141,9 @@ You MUST call style_agent_tool(input="your response text") before returning any
    - This is MANDATORY for ALL responses to the user.
 
 
-6. Output Format
+"""
+
+style_tool_output_section = """6. Output Format
 
    For email data, always return structured JSON/dict objects:
 
@@ -147,7 +172,37 @@ You MUST call style_agent_tool(input="your response text") before returning any
 }
 
 
-7. Security
+"""
+
+# מצב "post": הסוכן מחזיר AgentReply מובנה, והעיצוב נעשה אחרי הריצה ב-style_stage
+structured_output_section = """5. Styling
+
+   - Do not style, translate or rephrase your reply for the user; the wording is
+     handled after you finish.
+
+
+6. Output Format
+
+   Your final output is an AgentReply object:
+
+   - Search results → kind "email_list" with the emails (msg_id, subject, sender, date, snippet).
+
+   - The user asked to read an email → kind "email" with that email, including its body.
+
+   - An email draft is complete and needs confirmation → kind "draft" with to, subject and body.
+
+   - A draft field is missing → kind "missing" with missing_field.
+
+   - An action succeeded → kind "confirmation" with action (and to for sent emails, count for bulk actions).
+
+   - An action failed → kind "error" with error.
+
+   - Anything else → kind "text" with your reply in text.
+
+
+"""
+
+instructions_security = """7. Security
 
    - Never share tokens, keys, credentials, or private user information.
 
@@ -156,24 +211,54 @@ You MUST call style_agent_tool(input="your response text") before returning any
    - If the access token expires, request refresh or reauthorization.
 """
 
+if STYLE_MODE == "tool":
+    instructions = (
+        instructions_intro
+        + style_tool_rules
+        + instructions_workflow
+        + style_tool_section
+        + style_tool_output_section
+        + instructions_security
+    )
+else:
+    instructions = (
+        instructions_intro
+        + instructions_workflow
+        + structured_output_section
+        + instructions_security
+    )
+
 
 # אתחול
 
 
-def init_agent(user_id: str):
-    gmail_tool = GmailTools(user_id)
+def init_agent(user_id: str, gmail_tool: GmailTools | None = None):
+    if gmail_tool is None:
+        gmail_tool = GmailTools(user_id)
 
     tools = gmail_tool.get_tools()
 
-    # יצירת הכלי style_agent_tool בתוך הפונקציה, בדומה לדוגמה שעובדת
+    if STYLE_MODE == "tool":
+        # יצירת הכלי style_agent_tool בתוך הפונקציה, בדומה לדוגמה שעובדת
+
+        style_agent_tool = get_style_agent_tool()
 
-    style_agent_tool = get_style_agent_tool()
+        tools.append(style_agent_tool)
 
-    tools.append(style_agent_tool)
+        output_type = None
+    else:
+        # העיצוב נעשה אחרי הריצה (style_stage), בלי ריצת LLM מקוננת
+        output_type = AgentReply
 
     print("tools: ", tools)
 
     mail_agent = Agent(
-        name="Gmail_Agent", instructions=instructions, model="gpt-4o-mini", tools=tools
+        name="Gmail_Agent",
+        instructions=instructions,
+        model="gpt-4o-mini",
+        tools=tools,
+        output_type=output_type,
+        # כמה קריאות כלים באותו תור רצות במקביל
+        model_settings=ModelSettings(parallel_tool_calls=True),
     )
     return mail_agent
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import os
@@ -10,9 +11,35 @@ from routers.OAuth_Callback_Router import routerOAuthCallback
 from routers.Users_Router import routerUsers
 from routers.Auth_signin_Router import routerAuthSignin
 from routers.Telegram_Router import routerTelegram
+from tools_agent_email.google_apis import GoogleApis
+from tools_agent_email.async_gmail_client import AsyncGmailClient
+from tools_agent_email.gmail_tools import GmailTools
+from message_writer import message_writer
+from controllers.agent_controller import finish_background_runs
+from controllers.Telegram_Controller import telegram_updates
+from telegram_sender import telegram_sender
 # from supabase_client import supabase
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # רענון טוקנים ברקע למשתמשים פעילים, לפני שהם פגים
+    if os.getenv("GMAIL_TOKEN_BACKGROUND_REFRESH", "true").lower() == "true":
+        GoogleApis.token_refresher.start()
+    message_writer.start()
+    telegram_updates.start()
+    yield
+    await telegram_updates.stop()
+    await telegram_sender.aclose()
+    await finish_background_runs()
+    # הודעות שעוד בתור נכתבות לפני הכיבוי
+    await message_writer.stop()
+    await GoogleApis.token_refresher.stop()
+    await AsyncGmailClient.aclose_shared()
+    GmailTools.shutdown_tool_executor()
+
+
+app = FastAPI(lifespan=lifespan)
 # origins = [
 #     "http://localhost:5173",
 #     "http://localhost:5174",
@@ -28,6 +55,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # הדפדפן חושף ל-JS רק headers שמופיעים כאן
+    expose_headers=["ETag", "X-Next-Cursor", "X-Since-Cursor"],
 )
 
 
@@ -0,0 +1,81 @@
+"""
+בנצ'מרק: כמה שיחות מקבילות worker אחד מחזיק - כלי Gmail חוסמים מול אסינכרוניים.
+
+כל "שיחה" מריצה search_emails (20 הודעות, metadata) מתוך לולאת asyncio אחת,
+כמו קריאת כלי של הסוכן בתוך handler של FastAPI. הכלי החוסם מריץ את
+googleapiclient על ה-event loop, והאסינכרוני משתמש ב-AsyncGmailClient.
+השרת המזויף רץ בתהליך נפרד כדי שלא יתחרה על ה-GIL.
+
+הרצה (מהתיקייה הראשית):
+    uv run python -m benchmarks.bench_async_concurrency
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_ROLE_KEY", "benchmark")
+
+from google.oauth2.credentials import Credentials  # noqa: E402
+
+from benchmarks.fake_gmail import fake_gmail_process, gmail_service  # noqa: E402
+from tools_agent_email.async_gmail_client import AsyncGmailClient  # noqa: E402
+from tools_agent_email.gmail_tools import GmailTools  # noqa: E402
+
+
+CONCURRENCY = [1, 10, 50, 100]
+
+MAX_RESULTS = 20
+
+
+def make_tools(url: str, index: int) -> GmailTools:
+    expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+    creds = Credentials(token="benchmark", expiry=expiry)
+    gmail = GmailTools(
+        f"user-{index}",
+        service=gmail_service(url),
+        async_client=AsyncGmailClient(f"user-{index}", creds, root_url=url),
+    )
+    gmail.message_cache.clear()
+    return gmail
+
+
+async def chat(gmail: GmailTools, use_async: bool) -> None:
+    if use_async:
+        result = await gmail.search_emails_async(max_results=MAX_RESULTS, label="ALL")
+    else:
+        # כלי סינכרוני רץ ישירות על ה-event loop
+        result = gmail.search_emails(max_results=MAX_RESULTS, label="ALL")
+    assert result.count == MAX_RESULTS
+    # תווים שאינם ASCII חייבים לשרוד את פענוח ה-batch
+    assert all(m.snippet.startswith("שלום עולם") for m in result.messages)
+
+
+async def run(url: str, concurrency: int, use_async: bool) -> float:
+    tools = [make_tools(url, index) for index in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(chat(gmail, use_async) for gmail in tools))
+    return time.perf_counter() - start
+
+
+async def main_async(url: str) -> None:
+    print(f"{'chats':>6} | {'mode':>8} | {'wall (s)':>8} | {'chats/s':>8}")
+    for concurrency in CONCURRENCY:
+        for use_async in (False, True):
+            elapsed = await run(url, concurrency, use_async)
+            mode = "async" if use_async else "blocking"
+            print(
+                f"{concurrency:>6} | {mode:>8} | {elapsed:>8.3f} | {concurrency / elapsed:>8.1f}"
+            )
+    await AsyncGmailClient.aclose_shared()
+
+
+def main():
+    with fake_gmail_process(message_count=100, latency=0.05) as url:
+        asyncio.run(main_async(url))
+
+
+if __name__ == "__main__":
+    main()
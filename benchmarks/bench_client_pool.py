@@ -0,0 +1,64 @@
+"""
+בנצ'מרק: לקוח Gmail חדש לכל בקשה מול לקוח מה-GmailClientPool.
+
+כל "בקשה" בונה GmailTools ומריצה search_emails. השרת המזויף מוסיף השהיה
+לכל חיבור חדש במקום TLS handshake, וסופר כמה חיבורים נפתחו.
+
+הרצה (מהתיקייה הראשית):
+    uv run python -m benchmarks.bench_client_pool
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+REQUESTS = 50
+
+USERS = 5
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_ROLE_KEY", "benchmark")
+os.environ.setdefault(
+    "GOOGLE_CLIENT_SECRET_JSON",
+    json.dumps({"web": {"client_id": "benchmark", "client_secret": "benchmark"}}),
+)
+
+from benchmarks.fake_gmail import FakeGmail  # noqa: E402
+from tools_agent_email.client_pool import GmailClientPool  # noqa: E402
+from tools_agent_email.gmail_tools import GmailTools  # noqa: E402
+from tools_agent_email.google_apis import GoogleApis  # noqa: E402
+
+
+def run(fake: FakeGmail, use_client_pool: bool):
+    fake.reset()
+    start = time.perf_counter()
+    for i in range(REQUESTS):
+        gmail = GmailTools(f"user-{i % USERS}", use_client_pool=use_client_pool)
+        gmail.message_cache.clear()
+        result = gmail.search_emails(max_results=5, label="ALL")
+        assert result.count == 5
+    return fake.connections, fake.round_trips, time.perf_counter() - start
+
+
+def main():
+    expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+    for i in range(USERS):
+        GoogleApis.update_tokens(f"user-{i}", "access", "refresh", expiry)
+
+    with FakeGmail(message_count=100, latency=0.01, connect_latency=0.05) as fake:
+        # השירותים נבנים מול השרת המזויף במקום gmail.googleapis.com
+        GoogleApis.ROOT_URL = fake.url
+        GoogleApis._discovery_doc = None
+
+        print(f"{REQUESTS} requests from {USERS} users")
+        print(f"{'mode':>8} | {'connections':>11} | {'round trips':>11} | {'wall (s)':>8}")
+        for use_client_pool in (False, True):
+            connections, round_trips, elapsed = run(fake, use_client_pool)
+            mode = "pool" if use_client_pool else "new"
+            print(f"{mode:>8} | {connections:>11} | {round_trips:>11} | {elapsed:>8.3f}")
+        print("pool stats:", GmailClientPool.shared().stats())
+        GmailClientPool.shared().clear()
+
+if __name__ == "__main__":
+    main()
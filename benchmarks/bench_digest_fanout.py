@@ -0,0 +1,96 @@
+"""
+בנצ'מרק: digest לכל המשתמשים שנקבעו לאותה דקה - אחד אחרי השני מול DigestRunner.
+
+ה-job מדמה את get_emails: חיפוש ב-Gmail, ריצת LLM ושליחה לטלגרם, עם
+השהיות מדומות ועם כמה משתמשים "תקועים" שלא מסיימים. הריצה הסדרתית היא
+הלולאה הישנה (כל משתמש מחכה לקודמים, בלי timeout, אז המשתמשים התקועים
+לא נכללים בה). המדד הוא כמה זמן מתחילת הריצה כל משתמש קיבל את ה-digest.
+
+הרצה (מהתיקייה הראשית):
+    uv run python -m benchmarks.bench_digest_fanout
+"""
+
+import asyncio
+import random
+import time
+
+from digest_runner import NO_LIMITS, DigestRunner, ProviderLimits, percentile
+
+
+USERS = 200
+
+STUCK_USERS = 3
+
+GMAIL_LATENCY = 0.05
+
+LLM_LATENCY = 0.3
+
+TELEGRAM_LATENCY = 0.03
+
+
+async def fake_digest(user_id: str, chat_id: str, limits: ProviderLimits = NO_LIMITS):
+    if user_id.startswith("stuck"):
+        await asyncio.sleep(3600)
+    async with limits.gmail:
+        await asyncio.sleep(GMAIL_LATENCY * random.uniform(0.5, 1.5))
+    async with limits.llm:
+        await asyncio.sleep(LLM_LATENCY * random.uniform(0.5, 1.5))
+    async with limits.telegram:
+        await asyncio.sleep(TELEGRAM_LATENCY * random.uniform(0.5, 1.5))
+    return {"message": "Emails retrieved successfully"}
+
+
+def rows(count: int, stuck: int = 0) -> list[dict]:
+    users = [
+        {"user_id": f"user-{index}", "chat_id": str(index)} for index in range(count)
+    ]
+    users += [{"user_id": f"stuck-{index}", "chat_id": "0"} for index in range(stuck)]
+    return users
+
+
+async def run_serial(users: list[dict]) -> dict:
+    start = time.perf_counter()
+    latencies = []
+    for user in users:
+        await fake_digest(user["user_id"], user["chat_id"])
+        latencies.append(time.perf_counter() - start)
+    return {
+        "wall_s": time.perf_counter() - start,
+        "p50_s": percentile(latencies, 50),
+        "p90_s": percentile(latencies, 90),
+        "p99_s": percentile(latencies, 99),
+        "timeout": 0,
+    }
+
+
+async def main_async() -> None:
+    random.seed(1)
+    print(
+        f"{USERS} users (+{STUCK_USERS} stuck for the runner),"
+        f" gmail/llm/telegram ≈ {GMAIL_LATENCY}/{LLM_LATENCY}/{TELEGRAM_LATENCY}s"
+    )
+    print(
+        f"{'mode':>8} | {'wall (s)':>8} | {'p50 (s)':>7} | {'p90 (s)':>7}"
+        f" | {'p99 (s)':>7} | {'timeouts':>8}"
+    )
+    serial = await run_serial(rows(USERS))
+    runner = DigestRunner(
+        fake_digest,
+        concurrency=50,
+        user_timeout=5,
+        limits=ProviderLimits(gmail=20, llm=10, telegram=20),
+    )
+    fanout = await runner.run(rows(USERS, STUCK_USERS))
+    for mode, report in (("serial", serial), ("runner", fanout)):
+        print(
+            f"{mode:>8} | {report['wall_s']:>8.1f} | {report['p50_s']:>7.1f}"
+            f" | {report['p90_s']:>7.1f} | {report['p99_s']:>7.1f} | {report['timeout']:>8}"
+        )
+
+
+def main():
+    asyncio.run(main_async())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+בנצ'מרק: לולאת ה-polling הישנה של test2.py מול DigestScheduler, ליום שלם.
+
+הלולאה הישנה קוראת את כל user_chat_ids כל 2 שניות ומשווה מחרוזות HH:MM
+לכל שורה. עבורה מודדים בדיקה אחת ומכפילים ב-43,200 בדיקות ביום. את
+DigestScheduler מריצים על שעון מדומה לאורך 24 שעות: טעינה אחת, שאילתת
+delta כל 30 שניות ו-1% מהמשתמשים שמשנים שעה במהלך היום. הטבלה מזויפת
+בזיכרון וסופרת קריאות ושורות.
+
+הרצה (מהתיקייה הראשית):
+    uv run python -m benchmarks.bench_digest_scheduler
+"""
+
+import os
+import random
+import time
+from datetime import datetime
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_ROLE_KEY", "benchmark")
+
+from digest_scheduler import DigestScheduler  # noqa: E402
+
+
+USERS = [100, 1_000, 10_000, 100_000]
+
+DAY = 24 * 60 * 60
+
+OLD_CHECKS_PER_DAY = DAY // 2
+
+CHANGED_SHARE = 0.01
+
+
+def make_rows(count: int) -> list[dict]:
+    return [
+        {
+            "user_id": f"user-{index:06d}",
+            "chat_id": str(index + 1),
+            "time": f"{random.randrange(24):02d}:{random.randrange(60):02d}:00",
+            "updated_at": "2025-01-01T00:00:00+00:00",
+        }
+        for index in range(count)
+    ]
+
+
+def old_check(rows: list[dict], fired: list) -> None:
+    # כמו check_users ב-test2.py, בלי הקריאה ל-Supabase
+    now = datetime.now().strftime("%H:%M")
+    for user in rows:
+        if now == user["time"][:5]:
+            fired.append(user)
+
+
+def bench_old(rows: list[dict]) -> dict:
+    checks = 20
+    start = time.process_time()
+    for _ in range(checks):
+        old_check(rows, [])
+    per_check = (time.process_time() - start) / checks
+    return {
+        "reads": OLD_CHECKS_PER_DAY,
+        "rows": OLD_CHECKS_PER_DAY * len(rows),
+        "cpu": per_check * OLD_CHECKS_PER_DAY,
+    }
+
+
+class FakeTableScheduler(DigestScheduler):
+    def __init__(self, rows: list[dict], clock):
+        super().__init__(on_due=None, clock=clock)
+        self.rows = rows
+        self.changes: list[tuple[float, dict]] = []
+        self.rows_read = 0
+
+    def _fetch_all(self) -> list[dict]:
+        self.reads += (len(self.rows) + self.PAGE_SIZE - 1) // self.PAGE_SIZE or 1
+        self.rows_read += len(self.rows)
+        return list(self.rows)
+
+    def _fetch_changed(self, since: tuple[str, str] | None) -> list[dict]:
+        self.reads += 1
+        now = self.clock()
+        changed = [row for at, row in self.changes if at <= now]
+        self.changes = [(at, row) for at, row in self.changes if at > now]
+        self.rows_read += len(changed)
+        return changed
+
+
+def bench_new(rows: list[dict]) -> dict:
+    day_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    clock = {"now": day_start.timestamp()}
+    scheduler = FakeTableScheduler(rows, lambda: clock["now"])
+
+    for index, row in enumerate(random.sample(rows, int(len(rows) * CHANGED_SHARE))):
+        changed = dict(
+            row,
+            time=f"{random.randrange(24):02d}:{random.randrange(60):02d}:00",
+            updated_at=f"2025-01-02T00:00:00.{index:06d}+00:00",
+        )
+        scheduler.changes.append((clock["now"] + random.uniform(0, DAY), changed))
+
+    end = clock["now"] + DAY
+    wakeups = fired = 0
+    start = time.process_time()
+    scheduler.load()
+    while clock["now"] < end:
+        wake_at = min(scheduler._next_poll, scheduler.next_deadline() or end)
+        clock["now"] = min(wake_at, end)
+        wakeups += 1
+        if clock["now"] >= scheduler._next_poll:
+            scheduler.apply_changes()
+        fired += len(scheduler.pop_due(clock["now"]))
+    cpu = time.process_time() - start
+
+    return {
+        "reads": scheduler.reads,
+        "rows": scheduler.rows_read,
+        "cpu": cpu,
+        "wakeups": wakeups,
+        "fired": fired,
+    }
+
+
+def main():
+    random.seed(1)
+    print("per simulated day")
+    print(
+        f"{'users':>7} | {'old reads':>9} | {'old rows':>13} | {'old cpu (s)':>11}"
+        f" | {'new reads':>9} | {'new rows':>8} | {'new cpu (s)':>11} | {'fired':>6}"
+    )
+    for count in USERS:
+        rows = make_rows(count)
+        old = bench_old(rows)
+        new = bench_new(rows)
+        print(
+            f"{count:>7} | {old['reads']:>9} | {old['rows']:>13} | {old['cpu']:>11.1f}"
+            f" | {new['reads']:>9} | {new['rows']:>8} | {new['cpu']:>11.2f}"
+            f" | {new['fired']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
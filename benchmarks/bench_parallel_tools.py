@@ -0,0 +1,133 @@
+"""
+בנצ'מרק: "תפתח את חמשת המיילים האחרונים" - חמש קריאות get_email_message_details
+באותו תור של המודל.
+
+ה-Runner מריץ את קריאות הכלים של תור אחד עם asyncio.gather, ולכן כאן
+מפעילים את חמשת הכלים באותה צורה. משווים:
+  - blocking: הכלי הסינכרוני הישן, שרץ על ה-event loop (קריאה אחרי קריאה)
+  - threads:  הכלים הסינכרוניים דרך ה-thread pool של GmailTools
+  - async:    הכלים על AsyncGmailClient
+
+הרצה (מהתיקייה הראשית):
+    uv run python -m benchmarks.bench_parallel_tools
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_ROLE_KEY", "benchmark")
+
+from agents import function_tool  # noqa: E402
+from agents.run_context import RunContextWrapper  # noqa: E402
+from agents.tool_context import ToolContext  # noqa: E402
+from agents.usage import Usage  # noqa: E402
+from google.oauth2.credentials import Credentials  # noqa: E402
+from openai.types.responses import ResponseFunctionToolCall  # noqa: E402
+from openai.types.responses.response_usage import (  # noqa: E402
+    InputTokensDetails,
+    OutputTokensDetails,
+)
+
+from benchmarks.fake_gmail import fake_gmail_process, gmail_service  # noqa: E402
+from tools_agent_email.async_gmail_client import AsyncGmailClient  # noqa: E402
+from tools_agent_email.gmail_tools import GmailTools  # noqa: E402
+
+
+CALLS = 5
+
+ROUNDS = 5
+
+
+def make_tools(url: str, use_async_tools: bool) -> GmailTools:
+    expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+    creds = Credentials(token="benchmark", expiry=expiry)
+    return GmailTools(
+        "user-0",
+        service=gmail_service(url),
+        async_client=AsyncGmailClient("user-0", creds, root_url=url),
+        use_async_tools=use_async_tools,
+    )
+
+
+def blocking_tool(gmail: GmailTools):
+    @function_tool
+    def get_email_message_details(msg_id: str):
+        """Get detailed information about an email message, including its body."""
+
+        return gmail.get_email_message_details(msg_id)
+
+    return get_email_message_details
+
+
+def details_tool(gmail: GmailTools):
+    return next(
+        tool for tool in gmail.get_tools() if tool.name == "get_email_message_details"
+    )
+
+
+def tool_call(tool, index: int) -> tuple[ToolContext, str]:
+    """
+    The context and arguments the Runner passes to a tool call, built the way it does.
+    """
+    arguments = json.dumps({"msg_id": f"m{index:05d}"})
+    # Usage() נכשל עם openai חדש מזה שב-uv.lock (cache_write_tokens חובה),
+    # אז הפרטים נבנים במפורש - זה עובד בשתי הגרסאות
+    usage = Usage(
+        input_tokens_details=InputTokensDetails(cached_tokens=0, cache_write_tokens=0),
+        output_tokens_details=OutputTokensDetails(reasoning_tokens=0),
+    )
+    context = ToolContext.from_agent_context(
+        RunContextWrapper(context=None, usage=usage),
+        tool_call_id=f"call-{index}",
+        tool_call=ResponseFunctionToolCall(
+            arguments=arguments,
+            call_id=f"call-{index}",
+            name=tool.name,
+            type="function_call",
+        ),
+    )
+    return context, arguments
+
+
+async def turn(gmail: GmailTools, tool) -> float:
+    gmail.message_cache.clear()
+    calls = [tool_call(tool, index) for index in range(CALLS)]
+    start = time.perf_counter()
+    outputs = await asyncio.gather(
+        *(tool.on_invoke_tool(context, arguments) for context, arguments in calls)
+    )
+    assert not any("Error" in str(output) for output in outputs), outputs[0]
+    return time.perf_counter() - start
+
+
+async def main_async(url: str, latency: float) -> None:
+    blocking = make_tools(url, use_async_tools=False)
+    threads = make_tools(url, use_async_tools=False)
+    non_blocking = make_tools(url, use_async_tools=True)
+    modes = [
+        ("blocking", blocking, blocking_tool(blocking)),
+        ("threads", threads, details_tool(threads)),
+        ("async", non_blocking, details_tool(non_blocking)),
+    ]
+
+    print(f"one call ≈ {latency * 1000:.0f}ms, {CALLS} calls per turn")
+    print(f"{'mode':>8} | {'turn (ms)':>9}")
+    for name, gmail, tool in modes:
+        timings = [await turn(gmail, tool) for _ in range(ROUNDS)]
+        print(f"{name:>8} | {min(timings) * 1000:>9.0f}")
+    await AsyncGmailClient.aclose_shared()
+    GmailTools.shutdown_tool_executor()
+
+
+def main():
+    latency = 0.1
+    with fake_gmail_process(message_count=100, latency=latency) as url:
+        asyncio.run(main_async(url, latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+בנצ'מרק: search_emails עם בקשות batch מול בקשה נפרדת לכל הודעה.
+
+הרצה (מהתיקייה הראשית):
+    uv run python -m benchmarks.bench_search_batch
+"""
+
+import os
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_ROLE_KEY", "benchmark")
+
+from benchmarks.fake_gmail import FakeGmail  # noqa: E402
+from tools_agent_email.gmail_tools import GmailTools  # noqa: E402
+
+
+SIZES = [1, 10, 50, 100, 250, 500]
+
+
+def run(fake: FakeGmail, batch_requests: bool, max_results: int):
+    gmail = GmailTools(
+        "benchmark", service=fake.service(), batch_requests=batch_requests
+    )
+    gmail.message_cache.clear()
+    fake.reset()
+    start = time.perf_counter()
+    result = gmail.search_emails(max_results=max_results, label="ALL")
+    elapsed = time.perf_counter() - start
+    assert result.count == max_results
+    assert [m.msg_id for m in result.messages] == fake.message_ids[:max_results]
+    assert all(m.subject for m in result.messages), result.messages[0].body
+    return fake.round_trips, elapsed
+
+
+def main():
+    with FakeGmail(message_count=max(SIZES), latency=0.02) as fake:
+        print(f"{'N':>5} | {'mode':>10} | {'round trips':>11} | {'wall (s)':>8}")
+        for n in SIZES:
+            for batch_requests in (False, True):
+                round_trips, elapsed = run(fake, batch_requests, n)
+                mode = "batch" if batch_requests else "sequential"
+                print(f"{n:>5} | {mode:>10} | {round_trips:>11} | {elapsed:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
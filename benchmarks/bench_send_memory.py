@@ -0,0 +1,76 @@
+"""
+בנצ'מרק: שיא צריכת הזיכרון (RSS) של send_email עם קבצים מצורפים של 5-25MB.
+
+כל מדידה רצה בתהליך נפרד (ru_maxrss הוא שיא לכל חיי התהליך), מול שרת Gmail
+מזויף שרץ בתהליך משלו. משווים בין המסלול הפשוט (raw) לבין resumable upload.
+
+הרצה (מהתיקייה הראשית):
+    uv run python -m benchmarks.bench_send_memory
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_ROLE_KEY", "benchmark")
+
+SIZES_MB = [5, 10, 15, 20, 25]
+
+
+def max_rss_mb() -> float:
+    # ב-Linux ru_maxrss הוא ב-KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(url: str, size_mb: int, mode: str) -> None:
+    from benchmarks.fake_gmail import gmail_service
+    from tools_agent_email.gmail_tools import GmailTools
+
+    with tempfile.NamedTemporaryFile(suffix=".bin", delete=False) as attachment:
+        for _ in range(size_mb):
+            attachment.write(os.urandom(1024 * 1024))
+
+    gmail = GmailTools("benchmark", service=gmail_service(url))
+    # resumable לכל גודל, או raw לכל גודל
+    gmail.SIMPLE_SEND_MAX_BYTES = 0 if mode == "resumable" else 1 << 40
+
+    baseline = max_rss_mb()
+    try:
+        result = gmail.send_email(
+            to="someone@example.com",
+            subject="benchmark",
+            body="see attachment",
+            attachment_paths=[attachment.name],
+        )
+    finally:
+        os.remove(attachment.name)
+    assert result["status"] == "success", result
+    print(f"{max_rss_mb() - baseline:.1f}")
+
+
+def main():
+    from benchmarks.fake_gmail import fake_gmail_process
+
+    with fake_gmail_process(latency=0) as url:
+        print(f"{'MB':>4} | {'raw peak +RSS (MB)':>18} | {'resumable peak +RSS (MB)':>24}")
+        for size_mb in SIZES_MB:
+            peaks = []
+            for mode in ("raw", "resumable"):
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_send_memory", url, str(size_mb), mode],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout
+                peaks.append(float(output.strip().splitlines()[-1]))
+            print(f"{size_mb:>4} | {peaks[0]:>18.1f} | {peaks[1]:>24.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4:
+        measure(sys.argv[1], int(sys.argv[2]), sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,107 @@
+"""
+בנצ'מרק: שליחת digest לכמה מאות צ'אטים דרך TelegramSender.
+
+שרת Bot API מזויף (httpx.MockTransport) אוכף מגבלות כמו של טלגרם: עד 30
+הודעות בשנייה בסך הכל ועד הודעה אחת בשנייה לכל צ'אט, ומחזיר 429 עם
+retry_after כשהן נחצות. משווים שליחה בלי הגבלת קצב מול ה-token buckets.
+
+הרצה (מהתיקייה הראשית):
+    uv run python -m benchmarks.bench_telegram_sender
+"""
+
+import asyncio
+import json
+import time
+from collections import defaultdict, deque
+
+import httpx
+
+from telegram_sender import TelegramSender
+
+
+CHATS = 300
+
+MESSAGES_PER_CHAT = 2
+
+GLOBAL_LIMIT = 30
+
+LATENCY = 0.05
+
+
+class FakeBotApi:
+    def __init__(self):
+        self.sent = deque()
+        self.per_chat = defaultdict(deque)
+        self.throttled = 0
+
+    @staticmethod
+    def _over(window: deque, now: float, limit: int) -> bool:
+        while window and now - window[0] >= 1:
+            window.popleft()
+        return len(window) >= limit
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(LATENCY)
+        chat_id = json.loads(request.content)["chat_id"]
+        now = time.monotonic()
+        if self._over(self.sent, now, GLOBAL_LIMIT) or self._over(
+            self.per_chat[chat_id], now, 1
+        ):
+            self.throttled += 1
+            return httpx.Response(
+                429,
+                json={
+                    "ok": False,
+                    "error_code": 429,
+                    "parameters": {"retry_after": 1},
+                },
+            )
+        self.sent.append(now)
+        self.per_chat[chat_id].append(now)
+        return httpx.Response(200, json={"ok": True, "result": {}})
+
+
+async def run(limited: bool) -> None:
+    api = FakeBotApi()
+    rate = None if limited else 1_000_000
+    sender = TelegramSender(
+        token="benchmark",
+        api_url="http://telegram.test",
+        global_rate=rate,
+        chat_rate=rate,
+        http=httpx.AsyncClient(transport=httpx.MockTransport(api.handle)),
+    )
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            sender.send_message(str(chat_id), f"digest {index} for <b>{chat_id}</b>")
+            for chat_id in range(CHATS)
+            for index in range(MESSAGES_PER_CHAT)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    await sender.aclose()
+    stats = sender.stats()
+    mode = "buckets" if limited else "no limit"
+    print(
+        f"{mode:>8} | {elapsed:>8.1f} | {stats['sent']:>5}"
+        f" | {stats['sent'] / elapsed:>6.1f} | {api.throttled:>5} | {stats['failed']:>6}"
+    )
+
+
+async def main_async() -> None:
+    print(f"{CHATS} chats x {MESSAGES_PER_CHAT} messages, limit {GLOBAL_LIMIT}/s")
+    print(
+        f"{'mode':>8} | {'wall (s)':>8} | {'sent':>5} | {'msg/s':>6}"
+        f" | {'429s':>5} | {'failed':>6}"
+    )
+    for limited in (False, True):
+        await run(limited)
+
+
+def main():
+    asyncio.run(main_async())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+בנצ'מרק: רענון טוקנים מקבילי מול token endpoint מקומי ומזויף.
+
+20 בקשות מקבילות של אותו משתמש עם טוקן שפג - מצפים לקריאת רענון אחת בלבד.
+אחר כך: רענון ברקע של משתמש פעיל שהטוקן שלו עומד לפוג, רענון ברקע של טוקן
+בלי expiry ידוע, ו-20 threads (כל אחד עם AuthorizedHttp משלו) שמקבלים 401
+על טוקן שנראה תקף - גם כאן מצפים לקריאת רענון אחת.
+
+הרצה (מהתיקייה הראשית):
+    uv run python -m benchmarks.bench_token_refresh
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONCURRENT_REQUESTS = 20
+
+TOKEN_LATENCY = 0.2
+
+
+class FakeTokenEndpoint:
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with endpoint._lock:
+                    endpoint.calls += 1
+                    token = f"access-{endpoint.calls}"
+                time.sleep(TOKEN_LATENCY)
+                data = json.dumps(
+                    {"access_token": token, "expires_in": 3600, "token_type": "Bearer"}
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/token"
+
+
+class FakeApi:
+    """
+    Answers 401 to any token the fake token endpoint did not issue.
+    """
+
+    def __init__(self):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                authorized = self.headers.get("Authorization", "").startswith(
+                    "Bearer access-"
+                )
+                data = b"{}"
+                self.send_response(200 if authorized else 401)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/"
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def main():
+    endpoint = FakeTokenEndpoint()
+    os.environ["GOOGLE_TOKEN_URI"] = endpoint.url
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+    os.environ.setdefault("SUPABASE_ROLE_KEY", "benchmark")
+    os.environ.setdefault(
+        "GOOGLE_CLIENT_SECRET_JSON",
+        json.dumps({"web": {"client_id": "id", "client_secret": "secret"}}),
+    )
+
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import build_http
+
+    from tools_agent_email.google_apis import GoogleApis
+
+    # שמירה ל-Supabase לא רלוונטית כאן
+    GoogleApis.save_tokens = staticmethod(lambda *args: None)
+
+    GoogleApis.update_tokens("user", "expired", "refresh", utcnow() - timedelta(minutes=5))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(CONCURRENT_REQUESTS) as pool:
+        clients = list(pool.map(lambda _: GoogleApis("user"), range(CONCURRENT_REQUESTS)))
+    elapsed = time.perf_counter() - start
+    tokens = {client.access_token for client in clients}
+    print(
+        f"{CONCURRENT_REQUESTS} concurrent requests: {endpoint.calls} token endpoint call(s), "
+        f"{elapsed:.3f}s, tokens seen: {sorted(tokens)}"
+    )
+
+    GoogleApis.update_tokens("user", "soon", "refresh", utcnow() + timedelta(seconds=60))
+    calls_before = endpoint.calls
+    refreshed = GoogleApis.token_refresher.refresh_due()
+    entry = GoogleApis._tokens_cache.get("user")
+    print(
+        f"background refresh: {refreshed} user(s), {endpoint.calls - calls_before} call(s), "
+        f"new token {entry['access_token']} expires {entry['expiry']:%H:%M:%S}"
+    )
+
+    GoogleApis.update_tokens("user", "unknown", "refresh", None)
+    calls_before = endpoint.calls
+    refreshed = GoogleApis.token_refresher.refresh_due()
+    entry = GoogleApis._tokens_cache.get("user")
+    print(
+        f"unknown expiry: {refreshed} user(s) refreshed in the background, "
+        f"{endpoint.calls - calls_before} call(s), new token {entry['access_token']}"
+    )
+
+    # טוקן שבוטל: ה-expiry עוד לא עבר, אבל ה-API עונה 401
+    api = FakeApi()
+    GoogleApis.update_tokens("user", "revoked", "refresh", utcnow() + timedelta(hours=1))
+    client = GoogleApis("user")
+    calls_before = endpoint.calls
+
+    def request(_):
+        # כמו ב-GmailTools: לכל thread חיבור AuthorizedHttp משלו עם אותם credentials
+        http = AuthorizedHttp(client.creds, http=build_http())
+        return http.request(api.url)[0].status
+
+    with ThreadPoolExecutor(CONCURRENT_REQUESTS) as pool:
+        statuses = list(pool.map(request, range(CONCURRENT_REQUESTS)))
+    entry = GoogleApis._tokens_cache.get("user")
+    print(
+        f"401 on {CONCURRENT_REQUESTS} threads: {statuses.count(200)} succeeded after retry, "
+        f"{endpoint.calls - calls_before} token endpoint call(s), "
+        f"stored token {entry['access_token']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
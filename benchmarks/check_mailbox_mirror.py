@@ -0,0 +1,135 @@
+"""
+בדיקה: המראה המקומית (MailboxMirror) מול history feed של שרת Gmail מזויף.
+
+עוברת על סריקה מלאה שנעצרת ב-FULL_SCAN_LIMIT, סריקה מלאה של כל התיבה,
+סנכרון חלקי (הודעה חדשה, מחיקה, שינוי תוויות, העברה ל-trash) ו-historyId
+שפג (404 וחזרה לסריקה מלאה), ובודקת ש-search_emails עונה מהמראה רק כשהיא
+נכונה ואחרת עובר ל-API.
+
+הרצה (מהתיקייה הראשית):
+    uv run python -m benchmarks.check_mailbox_mirror
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_ROLE_KEY", "benchmark")
+
+from benchmarks.fake_gmail import FakeGmail  # noqa: E402
+from tools_agent_email.gmail_tools import MIRROR_PAGE_PREFIX, GmailTools  # noqa: E402
+from tools_agent_email.mailbox_mirror import MailboxMirror  # noqa: E402
+
+
+MESSAGE_COUNT = 120
+
+
+def check(name: str, condition: bool, detail="") -> None:
+    print(f"{'ok' if condition else 'FAILED':>6}  {name} {detail}")
+    assert condition, name
+
+
+def search(gmail: GmailTools, fake: FakeGmail, **kwargs):
+    fake.reset()
+    result = gmail.search_emails(**kwargs)
+    return result, fake.round_trips
+
+
+def ids(result) -> list[str]:
+    return [m.msg_id for m in result.messages]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp, FakeGmail(
+        message_count=MESSAGE_COUNT, latency=0.0
+    ) as fake:
+        MailboxMirror.DB_PATH = os.path.join(tmp, "mirror.sqlite3")
+        gmail = GmailTools("check", service=fake.service(), use_mirror=True)
+        mirror = gmail.mirror
+
+        # סריקה מלאה חלקית: רק 50 ההודעות החדשות נכנסות
+        mirror.FULL_SCAN_LIMIT = 50
+        check("partial full sync", mirror.sync() == "full")
+        check("partial mirror is not complete", not mirror.is_complete())
+
+        result, round_trips = search(gmail, fake, label="ALL", max_results=10)
+        check(
+            "full page from partial mirror",
+            ids(result) == fake.message_ids[:10] and round_trips == 0,
+            f"next_page_token={result.next_page_token}",
+        )
+        result, round_trips = search(
+            gmail, fake, label="ALL", max_results=10,
+            next_page_token=result.next_page_token,
+        )
+        check(
+            "second mirror page",
+            ids(result) == fake.message_ids[10:20] and round_trips == 0,
+        )
+
+        result, round_trips = search(gmail, fake, label="ALL", max_results=100)
+        check(
+            "short page from partial mirror goes to the API",
+            ids(result) == fake.message_ids[:100] and round_trips > 0,
+            f"({round_trips} round trips, next_page_token={result.next_page_token})",
+        )
+
+        result, _ = search(
+            gmail, fake, label="ALL", max_results=10,
+            next_page_token=f"{MIRROR_PAGE_PREFIX}45",
+        )
+        check(
+            "mirror token past the mirror continues in the API",
+            ids(result) == fake.message_ids[45:55],
+        )
+
+        # מראה חדשה, וסריקה מלאה של כל התיבה
+        mirror = gmail.mirror = MailboxMirror(
+            "check", gmail.service, db_path=os.path.join(tmp, "complete.sqlite3")
+        )
+        mirror.FULL_SCAN_LIMIT = 1000
+        check("full sync of the whole mailbox", mirror.sync() == "full")
+        check("whole mailbox mirrored", mirror.is_complete())
+        result, round_trips = search(gmail, fake, label="ALL", max_results=500)
+        check(
+            "complete mirror answers a short page",
+            ids(result) == fake.message_ids
+            and round_trips == 0
+            and result.next_page_token is None,
+        )
+
+        # סנכרון חלקי
+        newest = fake.message_ids[0]
+        fake.add_message("m90000")
+        fake.delete_message(fake.message_ids[5])
+        fake.change_labels(newest, added=["STARRED"])
+        trashed = fake.message_ids[2]
+        fake.change_labels(trashed, added=["TRASH"], removed=["INBOX"])
+        check("incremental sync", mirror.sync(force=True) == "incremental")
+        result, round_trips = search(gmail, fake, label="ALL", max_results=500)
+        check(
+            "incremental changes applied",
+            ids(result) == [i for i in fake.message_ids if i != trashed]
+            and round_trips == 0,
+        )
+        starred = {m.msg_id: m.star for m in result.messages}
+        check("label change applied", starred[newest] and not starred["m90000"])
+
+        result, round_trips = search(gmail, fake, label="TRASH", max_results=10)
+        check("trash goes to the API", round_trips > 0, f"({round_trips} round trips)")
+
+        # historyId שפג: 404 וסריקה מלאה שמביאה גם את השינויים שבינתיים
+        fake.add_message("m90001")
+        fake.expire_history()
+        check("expired historyId falls back to full sync", mirror.sync(force=True) == "full")
+        result, _ = search(gmail, fake, label="ALL", max_results=3)
+        check(
+            "full sync after expiry sees new mail",
+            ids(result)[:1] == ["m90001"] and trashed not in ids(result),
+        )
+
+        print("all mailbox mirror checks passed")
+
+
+if __name__ == "__main__":
+    main()
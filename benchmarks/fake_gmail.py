@@ -0,0 +1,340 @@
+"""
+שרת Gmail מקומי ומזויף לבנצ'מרקים.
+
+מממש את החלק מ-Gmail API שהקוד שלנו משתמש בו (messages.list, messages.get
+ו-batch), מוסיף השהיה קבועה לכל round trip כדי לדמות רשת, וסופר בקשות.
+"""
+
+import json
+import multiprocessing
+import re
+from contextlib import contextmanager
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import build_http
+
+
+MESSAGE_PATH = re.compile(r"^/gmail/v1/users/me/messages/([^/?]+)$")
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+def gmail_service(url: str):
+    """Gmail service שמצביע על שרת Gmail מזויף בכתובת url."""
+    doc = json.loads(get_static_doc("gmail", "v1"))
+    doc["rootUrl"] = url
+    return build_from_document(doc, http=build_http())
+
+
+def make_message(
+    msg_id: str, label_ids: list[str] | None = None, internal_date: int | None = None
+) -> dict:
+    if internal_date is None:
+        # m00000 היא החדשה ביותר, כמו הסדר של messages.list
+        internal_date = 1763366400000 - int(msg_id.lstrip("mn") or 0)
+    return {
+        "id": msg_id,
+        "threadId": msg_id,
+        "labelIds": label_ids or ["INBOX", "UNREAD"],
+        "internalDate": str(internal_date),
+        # עברית, כדי שהבנצ'מרקים יבדקו גם פענוח של תווים שאינם ASCII
+        "snippet": f"שלום עולם - snippet of message {msg_id}",
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [
+                {"name": "Subject", "value": f"Subject {msg_id}"},
+                {"name": "From", "value": "sender@example.com"},
+                {"name": "To", "value": "me@example.com"},
+                {"name": "Date", "value": "Mon, 17 Nov 2025 10:00:00 +0200"},
+            ],
+            "body": {"data": "SGVsbG8gd29ybGQ="},
+        },
+    }
+
+
+class _Server(ThreadingHTTPServer):
+    # ברירת המחדל (5) מפילה חיבורים כשהרבה לקוחות מתחברים יחד
+    request_queue_size = 256
+
+
+class FakeGmail:
+    def __init__(
+        self,
+        message_count: int = 500,
+        latency: float = 0.02,
+        connect_latency: float = 0.0,
+    ):
+        self.message_ids = [f"m{i:05d}" for i in range(message_count)]
+        self.latency = latency
+        # עלות פתיחת חיבור חדש (במקום TLS handshake אמיתי)
+        self.connect_latency = connect_latency
+        self.round_trips = 0
+        self.connections = 0
+        self.history_id = 1000
+        self.oldest_history_id = self.history_id
+        self.history: list[dict] = []
+        # תוויות שהשתנו מברירת המחדל של make_message
+        self.labels: dict[str, list[str]] = {}
+        # הודעות שנוספו עם add_message חדשות מכל השאר
+        self.internal_dates: dict[str, int] = {}
+        self.sent_bytes = 0
+        self.uploads = 0
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.round_trips = 0
+            self.connections = 0
+
+    def service(self):
+        """Gmail service שמצביע על השרת המזויף."""
+        return gmail_service(self.url)
+
+    def _record(self, **change) -> None:
+        self.history_id += 1
+        self.history.append({"id": str(self.history_id), **change})
+
+    def add_message(self, msg_id: str) -> None:
+        self.internal_dates[msg_id] = 1763366400000 + len(self.internal_dates) + 1
+        self.message_ids.insert(0, msg_id)
+        self._record(messagesAdded=[{"message": {"id": msg_id}}])
+
+    def delete_message(self, msg_id: str) -> None:
+        self.message_ids.remove(msg_id)
+        self._record(messagesDeleted=[{"message": {"id": msg_id}}])
+
+    def change_labels(self, msg_id: str, added=(), removed=()) -> None:
+        labels = [
+            label
+            for label in self.labels.get(msg_id, make_message(msg_id)["labelIds"])
+            if label not in removed
+        ]
+        self.labels[msg_id] = labels + [label for label in added if label not in labels]
+        if added:
+            self._record(
+                labelsAdded=[{"message": {"id": msg_id}, "labelIds": list(added)}]
+            )
+        if removed:
+            self._record(
+                labelsRemoved=[{"message": {"id": msg_id}, "labelIds": list(removed)}]
+            )
+
+    def expire_history(self) -> None:
+        """history.list יחזיר 404 לכל historyId ישן, כמו ב-Gmail."""
+        self.oldest_history_id = self.history_id
+
+    def list_history(self, query: dict):
+        start = int(query["startHistoryId"][0])
+        if start < self.oldest_history_id:
+            return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+        records = [r for r in self.history if int(r["id"]) > start]
+        return 200, {"history": records, "historyId": str(self.history_id)}
+
+    def list_messages(self, query: dict) -> dict:
+        max_results = int(query.get("maxResults", ["100"])[0])
+        start = int(query.get("pageToken", ["0"])[0])
+        # כמו ב-Gmail: בלי includeSpamTrash אין spam ו-trash (q לא נתמך)
+        message_ids = self.message_ids
+        if query.get("includeSpamTrash", ["false"])[0] != "true":
+            message_ids = [
+                i
+                for i in message_ids
+                if not {"SPAM", "TRASH"} & set(self.labels.get(i, ()))
+            ]
+        ids = message_ids[start : start + max_results]
+        result = {"messages": [{"id": i, "threadId": i} for i in ids]}
+        if start + max_results < len(message_ids):
+            result["nextPageToken"] = str(start + max_results)
+        return result
+
+    def answer(self, method: str, path: str):
+        parsed = urlparse(path)
+        if method == "GET" and parsed.path == "/gmail/v1/users/me/messages":
+            return 200, self.list_messages(parse_qs(parsed.query))
+        if method == "GET" and parsed.path == "/gmail/v1/users/me/profile":
+            return 200, {"emailAddress": "me@example.com", "historyId": str(self.history_id)}
+        if method == "GET" and parsed.path == "/gmail/v1/users/me/history":
+            return self.list_history(parse_qs(parsed.query))
+        match = MESSAGE_PATH.match(parsed.path)
+        if method == "GET" and match:
+            if match.group(1) not in self.message_ids:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            msg_id = match.group(1)
+            return 200, make_message(
+                msg_id, self.labels.get(msg_id), self.internal_dates.get(msg_id)
+            )
+        return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+    def answer_batch(self, content_type: str, body: bytes) -> tuple[str, bytes]:
+        envelope = BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        out_boundary = f"batch_{uuid.uuid4().hex}"
+        chunks = []
+        for part in envelope.get_payload():
+            content_id = part["Content-ID"].strip("<>")
+            request_line = part.get_payload().lstrip().splitlines()[0]
+            method, path, _ = request_line.split(" ")
+            status, payload = self.answer(method, path)
+            chunks.append(
+                f"--{out_boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(payload, ensure_ascii=False)}\r\n"
+            )
+        chunks.append(f"--{out_boundary}--\r\n")
+        return (
+            f"multipart/mixed; boundary={out_boundary}",
+            "".join(chunks).encode("utf-8"),
+        )
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+                time.sleep(fake.connect_latency)
+
+            def _reply(self, status: int, content_type: str, data: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _round_trip(self):
+                with fake._lock:
+                    fake.round_trips += 1
+                time.sleep(fake.latency)
+
+            def do_GET(self):
+                self._round_trip()
+                status, payload = fake.answer("GET", self.path)
+                self._reply(
+                    status,
+                    "application/json; charset=UTF-8",
+                    json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                )
+
+            def _drain_body(self) -> int:
+                remaining = int(self.headers.get("Content-Length", 0))
+                size = remaining
+                while remaining:
+                    remaining -= len(self.rfile.read(min(remaining, 1 << 16)))
+                return size
+
+            def _sent(self, size: int):
+                with fake._lock:
+                    fake.sent_bytes += size
+                    fake.uploads += 1
+                    msg_id = f"sent{fake.uploads}"
+                self._reply(200, "application/json", json.dumps({"id": msg_id}).encode())
+
+            def do_POST(self):
+                self._round_trip()
+                path = urlparse(self.path).path
+                if path.startswith("/batch"):
+                    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                    content_type, data = fake.answer_batch(
+                        self.headers["Content-Type"], body
+                    )
+                    self._reply(200, content_type, data)
+                elif path in (
+                    "/gmail/v1/users/me/messages/batchDelete",
+                    "/gmail/v1/users/me/messages/batchModify",
+                ):
+                    self._drain_body()
+                    self._reply(204, "application/json", b"")
+                elif path == "/gmail/v1/users/me/messages/send":
+                    self._sent(self._drain_body())
+                elif path == "/upload/gmail/v1/users/me/messages/send":
+                    # תחילת resumable upload: מחזירים כתובת session
+                    self._drain_body()
+                    self.send_response(200)
+                    self.send_header("Location", f"{fake.url}upload/session/{uuid.uuid4().hex}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                else:
+                    self._drain_body()
+                    self._reply(404, "application/json", b"{}")
+
+            def do_DELETE(self):
+                self._round_trip()
+                match = MESSAGE_PATH.match(urlparse(self.path).path)
+                if match and match.group(1) in fake.message_ids:
+                    self._reply(204, "application/json", b"")
+                else:
+                    self._reply(404, "application/json", b"{}")
+
+            def do_PUT(self):
+                self._round_trip()
+                size = self._drain_body()
+                match = CONTENT_RANGE.match(self.headers.get("Content-Range", ""))
+                if not urlparse(self.path).path.startswith("/upload/session/") or not match:
+                    self._reply(404, "application/json", b"{}")
+                    return
+                end, total = int(match.group(2)), int(match.group(3))
+                if end + 1 < total:
+                    self.send_response(308)
+                    self.send_header("Range", f"bytes=0-{end}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                else:
+                    self._sent(size)
+
+        return Handler
+
+
+def _serve(ready, stop, kwargs):
+    with FakeGmail(**kwargs) as fake:
+        ready.put(fake.url)
+        stop.wait()
+
+
+@contextmanager
+def fake_gmail_process(**kwargs):
+    """
+    מריץ את FakeGmail בתהליך נפרד, כדי שהזיכרון של השרת לא ייספר במדידה.
+    מחזיר את כתובת השרת.
+    """
+    ready = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    process = multiprocessing.Process(target=_serve, args=(ready, stop, kwargs), daemon=True)
+    process.start()
+    try:
+        yield ready.get(timeout=30)
+    finally:
+        stop.set()
+        process.join(timeout=5)
@@ -100,7 +100,9 @@ async def oauth2callback(code: str, state: str):
         #     "access_token": creds.token,
         #     "refresh_token": creds.refresh_token,
         # }
-        return save_tokens_accessMail(user_id, creds.token, creds.refresh_token)
+        return save_tokens_accessMail(
+            user_id, creds.token, creds.refresh_token, creds.expiry
+        )
     except Exception as e:
         print(f"Error in oauth2callback: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -1,12 +1,13 @@
 from supabase_client import supabase
+from telegram_sender import telegram_sender
+from telegram_updates import TelegramUpdateQueue
 
 from fastapi.responses import RedirectResponse
+import asyncio
 import os
 
 import dotenv
 
-import httpx
-
 
 dotenv.load_dotenv(override=True)
 
@@ -19,9 +20,11 @@ async def save_chat_id_to_supabase(chat_id: str, user_id: str):
     print("user_id: ", user_id)
     print("chat_id: ", chat_id)
     try:
-        supabase.table("user_chat_ids").upsert(
-            {"user_id": user_id, "chat_id": chat_id}
-        ).execute()
+        await asyncio.to_thread(
+            supabase.table("user_chat_ids")
+            .upsert({"user_id": user_id, "chat_id": chat_id})
+            .execute
+        )
 
         print(f"Chat ID {chat_id} saved successfully for user {user_id}")
 
@@ -33,23 +36,45 @@ async def save_chat_id_to_supabase(chat_id: str, user_id: str):
         return False
 
 
-def send_message_to_telegram(chat_id: str, text: str, parse_mode: str = "HTML"):
-    try:
-        payload = {"chat_id": chat_id, "text": text}
-        if parse_mode:
-            payload["parse_mode"] = parse_mode
+async def send_message_to_telegram(chat_id: str, text: str, parse_mode: str = "HTML"):
+    # חיבור משותף, הגבלת קצב ופיצול הודעות ארוכות - ב-telegram_sender
+    return await telegram_sender.send_message(chat_id, text, parse_mode)
+
 
-        response = httpx.post(
-            url=f"https://api.telegram.org/bot{TOKEN}/sendMessage",
-            json=payload,
+async def handle_telegram_update(update: dict):
+    """
+    Handle one webhook update in the background: the /start <user_id> flow
+    that links a Telegram chat to a user.
+    """
+    message = update.get("message")
+    if not message:
+        # עדכונים בלי הודעה (למשל edited_message) לא מעניינים אותנו
+        return
+
+    message_text = message.get("text", "")
+    print("message_text: ", message_text)
+
+    chat_id = message.get("chat", {}).get("id", "")
+
+    parts = message_text.split()
+    if len(parts) < 2:
+        print("Error: No user_id provided in /start command")
+        await send_message_to_telegram(
+            chat_id, "שגיאה: לא התקבל מזהה משתמש. אנא נסה להתחבר שוב דרך הקישור באתר."
         )
+        return
 
-        if response.status_code != 200:
-            print(f"Telegram API Error: {response.status_code} - {response.text}")
+    user_id = parts[1]
+    print("user_id extracted: ", user_id)
 
-        return {"message": "Message sent successfully"}
+    await send_message_to_telegram(chat_id, "היי! מחברים אותך, כמה רגעים...")
+    if await save_chat_id_to_supabase(chat_id, user_id):
+        client_url = os.getenv("CLIENT_URL")
+        text = f'החיבור עבר בהצלחה!\nחזור לאתר בכדי להגדיר כל כמה זמן תרצה לקבל מיילים לבוט\n\n <a href="{client_url}/connection-telegram">לחץ כאן כדי לפתוח את האתר</a>'
+        await send_message_to_telegram(chat_id, text, parse_mode="HTML")
+    else:
+        await send_message_to_telegram(chat_id, "החיבור נכשל. נסה שנית מאוחר יותר.")
 
-    except Exception as e:
-        print(f"Error sending message to Telegram: {e}")
 
-        return {"message": "Error sending message to Telegram"}
+# עדכוני ה-webhook מעובדים ברקע, אחרי שהשבנו לטלגרם
+telegram_updates = TelegramUpdateQueue(handle_telegram_update)
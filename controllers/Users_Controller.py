@@ -1,4 +1,5 @@
 from supabase_client import supabase
+from tools_agent_email.google_apis import GoogleApis
 from fastapi.responses import RedirectResponse
 import os
 import dotenv
@@ -17,21 +18,23 @@ def save_token_from_supabase(body: dict):
     return {"message": "Token saved successfully"}
 
 
-def save_tokens_accessMail(user_id: str, access_token: str, refresh_token: str):
+def save_tokens_accessMail(
+    user_id: str, access_token: str, refresh_token: str, expiry=None
+):
     try:
         # משתמשים ב-upsert כדי ליצור או לעדכן רשומה
-        result = (
-            supabase.table("user_tokens")
-            .upsert(
-                {
-                    "id": user_id,
-                    "access_token": access_token,
-                    "refresh_token": refresh_token,
-                }
-            )
-            .execute()
+        result = GoogleApis.write_user_tokens(
+            lambda row: supabase.table("user_tokens").upsert(row).execute(),
+            {
+                "id": user_id,
+                "access_token": access_token,
+                "refresh_token": refresh_token,
+                "expiry": GoogleApis.format_expiry(expiry),
+            },
         )
         print(f"Tokens saved successfully for user {user_id}")
+        # הטוקנים החדשים מחליפים את מה שנשמר ב-cache
+        GoogleApis.update_tokens(user_id, access_token, refresh_token, expiry)
         print(f"Result: {result.data}")
         return RedirectResponse(url=f"{os.getenv('CLIENT_URL')}/chat")
     except Exception as e:
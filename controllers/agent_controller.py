@@ -1,7 +1,17 @@
 from agents import trace, Runner
-from agent import init_agent
+from agent import init_agent, STYLE_MODE
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from supabase_client import supabase
+from threading import Lock
+from conversation_memory import conversation_memory
+from message_writer import message_writer
+from style_stage import style_stage, StyleResult
+from openai.types.responses import ResponseTextDeltaEvent
+from tools_agent_email.gmail_tools import GmailTools
+import asyncio
+import json
+import os
+import time
 
 
 # אובייקט פשוט לשמירת היסטוריית שיחה בזיכרון
@@ -10,25 +20,12 @@ class SimpleSession:
         self.history = []
         self.user_id = user_id
 
-    async def get_items(self):
+    async def get_items(self, limit: int | None = None):
         print("get_items")
-        response = (
-            supabase.table("messages")
-            .select("*")
-            .eq("user_id", self.user_id)
-            .order("created_at", desc=False)
-            .order("role", desc=False)
-            .execute()
-        )
-        self.history = [
-            {
-                "role": item["role"],
-                "content": item.get("content", ""),
-            }
-            for item in response.data
-        ]
-        print("history: ", self.history)
-        return self.history
+        # סיכום מתגלגל + חלון ההודעות האחרונות, מהזיכרון של התהליך
+        self.history = await conversation_memory.get_items(self.user_id)
+        print("history: ", len(self.history), "items")
+        return self.history[-limit:] if limit else self.history
 
     async def add_item(self, role: str, content: str):
         print("add_item: ")
@@ -46,46 +43,280 @@ class SimpleSession:
 # הערה: history הוסר כי SimpleSession דורש user_id - נוצר חדש בכל קריאה ל-handle_message
 
 
+class AgentCache:
+    """
+    Ready Agent objects per user, so a turn does not rebuild GmailTools, the
+    Gmail service and every function_tool.
+
+    An entry is rebuilt when the user's Gmail client can no longer be
+    reused (tokens invalidated or re-authorized), when the tool settings
+    change, or after invalidate() / clear(). Entries idle for IDLE_TTL_SECONDS
+    are dropped and at most MAX_SIZE users are kept (LRU).
+    """
+
+    MAX_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "200"))
+
+    IDLE_TTL_SECONDS = float(os.getenv("AGENT_CACHE_IDLE_TTL", "900"))
+
+    # משתני סביבה שמשנים את הכלים שהסוכן מקבל
+    TOOL_SETTINGS = [
+        "GMAIL_ASYNC_TOOLS",
+        "GMAIL_MIRROR_ENABLED",
+        "GMAIL_SEARCH_INDEX_ENABLED",
+    ]
+
+    def __init__(self, max_size: int | None = None, idle_ttl: float | None = None):
+        self.max_size = max_size or self.MAX_SIZE
+        self.idle_ttl = idle_ttl if idle_ttl is not None else self.IDLE_TTL_SECONDS
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _settings(self) -> tuple:
+        return (self._version,) + tuple(os.getenv(name) for name in self.TOOL_SETTINGS)
+
+    def get(self, user_id: str):
+        settings = self._settings()
+        now = time.monotonic()
+        with self._lock:
+            self._expire_idle(now)
+            entry = self._entries.get(user_id)
+            if entry is not None and entry["settings"] != settings:
+                del self._entries[user_id]
+                entry = None
+            if entry is not None:
+                entry["last_used"] = now
+                self._entries.move_to_end(user_id)
+
+        if entry is not None and self._tokens_current(entry["gmail_tool"]):
+            with self._lock:
+                self.hits += 1
+            return entry["agent"]
+
+        with self._lock:
+            self.misses += 1
+            if entry is not None and self._entries.get(user_id) is entry:
+                del self._entries[user_id]
+
+        gmail_tool = GmailTools(user_id)
+        mail_agent = init_agent(user_id, gmail_tool)
+        if gmail_tool.service is None:
+            # אין טוקנים - לא שומרים, כדי שהתחברות מחדש תיקלט מיד
+            return mail_agent
+
+        with self._lock:
+            self._entries[user_id] = {
+                "agent": mail_agent,
+                "gmail_tool": gmail_tool,
+                "settings": settings,
+                "last_used": time.monotonic(),
+            }
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return mail_agent
+
+    @staticmethod
+    def _tokens_current(gmail_tool: GmailTools) -> bool:
+        if gmail_tool.service_manager is None:
+            return True
+        try:
+            # מעדכן את ה-credentials מה-token store, או False אם צריך לבנות מחדש
+            return gmail_tool.service_manager.sync_credentials()
+        except Exception as e:
+            print(f"Cached agent of user {gmail_tool.user_id} is stale: {e}")
+            return False
+
+    def _expire_idle(self, now: float) -> None:
+        expired = [
+            user_id
+            for user_id, entry in self._entries.items()
+            if now - entry["last_used"] >= self.idle_ttl
+        ]
+        for user_id in expired:
+            del self._entries[user_id]
+        self.expirations += len(expired)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        """
+        Drop every cached agent, e.g. after the tools or instructions were reconfigured.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._version += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+agent_cache = AgentCache()
+
+
 def get_mail_agent(user_id: str):
-    # יוצר agent חדש לכל user_id
-    # אם רוצים cache, אפשר להחזיר את השורות המבוטלות ולהשתמש ב-dict לפי user_id
-    mail_agent = init_agent(user_id)
-    return mail_agent
+    # סוכן מוכן מה-cache; נבנה מחדש רק כשהטוקנים או הגדרות הכלים השתנו
+    if os.getenv("AGENT_CACHE_ENABLED", "true").lower() != "true":
+        return init_agent(user_id)
+    return agent_cache.get(user_id)
 
 
 def handle_save_in_DB(message: str, result: str, user_id: str):
-    try:
-        supabase.table("messages").insert(
-            [
-                {
-                    "role": "user",
-                    "content": message,
-                    "user_id": user_id,
-                    "created_at": datetime.now().isoformat(),
-                },
-                {
-                    "role": "assistant",
-                    "content": result,
-                    "user_id": user_id,
-                    "created_at": (
-                        datetime.now() + timedelta(milliseconds=1)
-                    ).isoformat(),
-                },
-            ]
-        ).execute()
-    except Exception as e:
-        print("error 👉:", e)
+    rows = [
+        {
+            "role": "user",
+            "content": message,
+            "user_id": user_id,
+            "created_at": datetime.now().isoformat(),
+        },
+        {
+            "role": "assistant",
+            "content": result,
+            "user_id": user_id,
+            "created_at": (datetime.now() + timedelta(milliseconds=1)).isoformat(),
+        },
+    ]
+    # התור הבא יקבל את ההודעות מהזיכרון, בלי לשלוף אותן שוב מה-DB
+    conversation_memory.record(user_id, rows)
+    # בשרת ארוך-חיים הכתיבה ל-DB נעשית ברקע, ב-batch; בלי writer פעיל (למשל Vercel) היא נעשית כאן
+    message_writer.enqueue(rows)
+
+
+async def style_reply(final_output) -> str:
+    # במצב "tool" הסוכן כבר עיצב את התשובה עם style_agent_tool
+    if STYLE_MODE == "tool":
+        return final_output
+    return (await style_stage.style(final_output)).text
 
 
 async def handle_message(message: str, user_id: str):
     with trace(f"chat_endpoint_{user_id}"):
-        mail_agent = get_mail_agent(user_id)
+        mail_agent = await asyncio.to_thread(get_mail_agent, user_id)
         result = await Runner.run(mail_agent, message, session=SimpleSession(user_id))
         print("message 👉:", message)
         print("result 👉:", result.final_output)
-        handle_save_in_DB(message, result.final_output, user_id)
+        reply = await style_reply(result.final_output)
+        handle_save_in_DB(message, reply, user_id)
     return {
         "role": "assistant",
-        "content": result.final_output,
+        "content": reply,
         "time": datetime.now(),
     }
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _raw_field(raw_item, name: str):
+    return raw_item.get(name) if isinstance(raw_item, dict) else getattr(raw_item, name, None)
+
+
+# ריצות של לקוח שהתנתק באמצע ממשיכות עד הסוף, והתשובה נשמרת
+_background_runs: set[asyncio.Task] = set()
+
+
+async def _run_streamed(message: str, user_id: str, events: asyncio.Queue):
+    """
+    Run the agent for stream_message, put its SSE events on events and save
+    the reply. The last item is None.
+    """
+    try:
+        with trace(f"chat_endpoint_{user_id}"):
+            # בניית הסוכן (GmailTools, טוקנים) חוסמת - לא על ה-event loop
+            mail_agent = await asyncio.to_thread(get_mail_agent, user_id)
+            result = Runner.run_streamed(
+                mail_agent, message, session=SimpleSession(user_id)
+            )
+            tool_names = {}
+            async for event in result.stream_events():
+                if event.type == "run_item_stream_event":
+                    raw_item = event.item.raw_item
+                    call_id = _raw_field(raw_item, "call_id")
+                    if event.name == "tool_called":
+                        tool_names[call_id] = _raw_field(raw_item, "name")
+                        events.put_nowait(
+                            sse_event(
+                                "tool", {"name": tool_names[call_id], "status": "started"}
+                            )
+                        )
+                    elif event.name == "tool_output":
+                        events.put_nowait(
+                            sse_event(
+                                "tool", {"name": tool_names.get(call_id), "status": "done"}
+                            )
+                        )
+                elif (
+                    STYLE_MODE == "tool"
+                    and event.type == "raw_response_event"
+                    and isinstance(event.data, ResponseTextDeltaEvent)
+                ):
+                    # במצב "tool" הטקסט של הסוכן הוא כבר התשובה למשתמש
+                    events.put_nowait(sse_event("token", {"delta": event.data.delta}))
+
+            print("message 👉:", message)
+            print("result 👉:", result.final_output)
+            if STYLE_MODE == "tool":
+                reply = result.final_output
+            else:
+                async for item in style_stage.stream(result.final_output):
+                    if isinstance(item, StyleResult):
+                        reply = item.text
+                    else:
+                        events.put_nowait(sse_event("token", {"delta": item}))
+
+        handle_save_in_DB(message, reply, user_id)
+        events.put_nowait(
+            sse_event(
+                "done",
+                {"role": "assistant", "content": reply, "time": datetime.now().isoformat()},
+            )
+        )
+    except Exception as e:
+        print("error 👉:", e)
+        events.put_nowait(sse_event("error", {"message": str(e)}))
+    finally:
+        events.put_nowait(None)
+
+
+async def finish_background_runs() -> None:
+    """
+    Wait for the streamed runs still going, so their replies are saved before shutdown.
+    """
+    if _background_runs:
+        await asyncio.gather(*_background_runs, return_exceptions=True)
+
+
+async def stream_message(message: str, user_id: str):
+    """
+    Run the agent with Runner.run_streamed and yield Server-Sent Events:
+    start, tool (started / done), token (reply text deltas), then done with
+    the full reply, which is also saved. error is sent if the run fails.
+
+    The run itself is a background task, so when the client disconnects it
+    still finishes and the reply is saved.
+    """
+    events = asyncio.Queue()
+    task = asyncio.get_running_loop().create_task(
+        _run_streamed(message, user_id, events)
+    )
+    _background_runs.add(task)
+    task.add_done_callback(_background_runs.discard)
+    # אירוע ראשון מיד, כדי שהלקוח יקבל תשובה לפני שהסוכן מתחיל לעבוד
+    yield sse_event("start", {"time": datetime.now().isoformat()})
+    while (event := await events.get()) is not None:
+        yield event
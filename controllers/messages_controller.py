@@ -0,0 +1,154 @@
+from fastapi import HTTPException
+from supabase_client import supabase, filter_value
+from datetime import datetime
+import base64
+import hashlib
+import json
+import os
+import re
+
+
+# עמודות שהלקוח יכול לבקש ב-fields
+MESSAGE_FIELDS = ("id", "user_id", "role", "content", "created_at")
+
+# created_at ו-role תמיד נבחרים, כי מהם בונים את ה-cursor
+CURSOR_FIELDS = ("created_at", "role")
+
+MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE", "500"))
+
+ROLE_PATTERN = re.compile(r"^[a-z_]+$")
+
+
+def encode_cursor(row: dict) -> str:
+    """
+    Opaque cursor for the position of a row in the (created_at, role) order.
+    """
+    data = json.dumps([row["created_at"], row["role"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """
+    The (created_at, role) of a cursor. The cursor comes from the client, so
+    created_at must be a timestamp and role a plain word.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, role = json.loads(base64.urlsafe_b64decode(padded))
+        created_at = datetime.fromisoformat(created_at).isoformat()
+        if not isinstance(role, str) or not ROLE_PATTERN.match(role):
+            raise ValueError(role)
+        return created_at, role
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+
+
+def select_columns(fields: str | None) -> str:
+    if not fields:
+        return "*"
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in MESSAGE_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. "
+            f"Allowed: {', '.join(MESSAGE_FIELDS)}",
+        )
+    for name in CURSOR_FIELDS:
+        if name not in names:
+            names.append(name)
+    return ", ".join(names)
+
+
+def _keyset(query, cursor: tuple[str, str], op: str):
+    # (created_at, role) > / < (cursor) בלי tuple comparison ב-PostgREST
+    created_at, role = (filter_value(value) for value in cursor)
+    return query.or_(
+        f"created_at.{op}.{created_at},"
+        f"and(created_at.eq.{created_at},role.{op}.{role})"
+    )
+
+
+def history_version(user_id: str) -> dict:
+    """
+    Cheap fingerprint of a user's history: the number of rows and the newest row.
+    """
+    response = (
+        supabase.table("messages")
+        .select("created_at, role", count="exact")
+        .eq("user_id", user_id)
+        .order("created_at", desc=True)
+        .order("role", desc=True)
+        .limit(1)
+        .execute()
+    )
+    latest = response.data[0] if response.data else None
+    return {
+        "count": response.count,
+        "latest": [latest["created_at"], latest["role"]] if latest else None,
+    }
+
+
+def history_etag(user_id: str, version: dict, params: dict) -> str:
+    data = json.dumps([user_id, version, params], sort_keys=True).encode("utf-8")
+    return f'W/"{hashlib.sha1(data).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # השוואה חלשה: W/"x" ו-"x" נחשבים אותו ETag
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def fetch_messages(
+    user_id: str,
+    limit: int | None = None,
+    before: str | None = None,
+    since: str | None = None,
+    fields: str | None = None,
+) -> dict:
+    """
+    One page of a user's messages in (created_at, role) order, oldest first.
+
+    Without cursors and limit this is the whole history. With limit only,
+    it is the newest `limit` messages; `before` pages back to older ones and
+    `since` returns only messages after a cursor (for polling). Returns the
+    rows, the cursor for the next older page (None when there is none) and
+    the cursor of the newest row, to pass as `since` on the next poll.
+    """
+    if before and since:
+        raise HTTPException(
+            status_code=400, detail="Use either before or since, not both"
+        )
+    query = (
+        supabase.table("messages")
+        .select(select_columns(fields))
+        .eq("user_id", user_id)
+    )
+    if since:
+        query = _keyset(query, decode_cursor(since), "gt")
+    if before:
+        query = _keyset(query, decode_cursor(before), "lt")
+
+    # בלי since מחזירים את ההודעות האחרונות, אז קוראים מהסוף ומהפכים
+    backwards = limit is not None and not since
+    query = query.order("created_at", desc=backwards).order("role", desc=backwards)
+    if limit is not None:
+        query = query.limit(limit)
+    rows = query.execute().data
+    if backwards:
+        rows.reverse()
+
+    return {
+        "messages": rows,
+        "next_cursor": (
+            encode_cursor(rows[0])
+            if backwards and rows and len(rows) == limit
+            else None
+        ),
+        "since_cursor": (
+            None if before else encode_cursor(rows[-1]) if rows else since
+        ),
+    }
@@ -0,0 +1,240 @@
+import asyncio
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+
+from agents import Agent, Runner
+from dotenv import load_dotenv
+
+from supabase_client import supabase
+
+load_dotenv(override=True)
+
+
+summary_instructions = """
+You maintain a running summary of a conversation between a user and an email assistant.
+
+You receive the current summary (may be empty) and older messages that are leaving
+the conversation window. Return an updated summary that keeps what later turns may
+need: the user's preferences, people and email addresses mentioned, email drafts in
+progress, searches and their results, and decisions taken.
+
+Be concise (at most 150 words). Write in the language of the conversation.
+Return only the summary text.
+"""
+
+
+class ConversationMemory:
+    """
+    Bounded conversation history per user, kept in process memory between turns.
+
+    The model gets a rolling summary of older messages plus the last
+    WINDOW_SIZE messages, so the prompt size does not grow with the length of
+    the conversation. Only the first turn of a user loads rows from the
+    messages table: the last WINDOW_SIZE + SUMMARY_BATCH rows, so for a long
+    conversation the summary starts from that batch and older history is
+    not summarized. Later turns fetch only rows written since the last one
+    seen (e.g. by another worker), going back FETCH_OVERLAP_SECONDS because
+    the write-behind queue can commit a row after newer ones. Rows are
+    matched by their created_at as an aware UTC timestamp, so a row that
+    was recorded here and fetched back is kept once. Messages that leave
+    the window are folded into the summary in the background,
+    SUMMARY_BATCH at a time.
+    """
+
+    WINDOW_SIZE = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))
+
+    SUMMARY_BATCH = int(os.getenv("CHAT_SUMMARY_BATCH", "10"))
+
+    SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", "2000"))
+
+    MAX_USERS = int(os.getenv("CHAT_MEMORY_USERS", "1000"))
+
+    # שורה יכולה להיכתב באיחור (תור הכתיבה וה-retries שלו), עם created_at מוקדם יותר
+    FETCH_OVERLAP_SECONDS = float(os.getenv("CHAT_HISTORY_FETCH_OVERLAP", "120"))
+
+    def __init__(self, window_size: int | None = None, summary_batch: int | None = None):
+        self.window_size = window_size or self.WINDOW_SIZE
+        self.summary_batch = summary_batch or self.SUMMARY_BATCH
+        self._users: OrderedDict[str, dict] = OrderedDict()
+        self._lock = Lock()
+        self._summarizer = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def _state(self, user_id: str) -> dict:
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                state = {
+                    "loaded": False,
+                    "window": [],
+                    "pending": [],
+                    "summary": "",
+                    "last_created_at": None,
+                    # (created_at, role) של השורות בטווח ה-overlap, גם אלה שכבר יצאו מהחלון
+                    "seen": {},
+                    "summarizing": False,
+                    "load_lock": asyncio.Lock(),
+                }
+                self._users[user_id] = state
+                while len(self._users) > self.MAX_USERS:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+            return state
+
+    async def get_items(self, user_id: str) -> list[dict]:
+        """
+        Return the summary (as a system message) followed by the messages in the window.
+        """
+        state = self._state(user_id)
+        async with state["load_lock"]:
+            if not state["loaded"]:
+                rows = await asyncio.to_thread(self._fetch_latest, user_id)
+                state["loaded"] = True
+            else:
+                rows = await asyncio.to_thread(
+                    self._fetch_since, user_id, state["last_created_at"]
+                )
+            self._append(user_id, state, rows)
+
+        items = []
+        if state["summary"]:
+            items.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{state['summary']}",
+                }
+            )
+        items += [{"role": row["role"], "content": row["content"]} for row in state["window"]]
+        return items
+
+    def record(self, user_id: str, rows: list[dict]) -> None:
+        """
+        Add rows this process wrote to the messages table, so the next turn does not fetch them back.
+        """
+        state = self._state(user_id)
+        if state["loaded"]:
+            self._append(user_id, state, rows)
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def _fetch_latest(self, user_id: str) -> list[dict]:
+        # בטעינה הראשונה: החלון האחרון ועוד batch אחד לסיכום
+        response = (
+            supabase.table("messages")
+            .select("role, content, created_at")
+            .eq("user_id", user_id)
+            .order("created_at", desc=True)
+            .order("role", desc=True)
+            .limit(self.window_size + self.summary_batch)
+            .execute()
+        )
+        return list(reversed(response.data))
+
+    @staticmethod
+    def _timestamp(value) -> datetime | None:
+        """
+        created_at as an aware UTC datetime. A naive value is UTC, as the timestamptz column reads it.
+        """
+        if not value:
+            return None
+        if isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                return None
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+
+    def _fetch_since(self, user_id: str, created_at: datetime | None) -> list[dict]:
+        query = (
+            supabase.table("messages")
+            .select("role, content, created_at")
+            .eq("user_id", user_id)
+        )
+        if created_at:
+            since = created_at - timedelta(seconds=self.FETCH_OVERLAP_SECONDS)
+            query = query.gte("created_at", since.isoformat())
+        response = (
+            query.order("created_at", desc=False).order("role", desc=False).execute()
+        )
+        return response.data
+
+    def _append(self, user_id: str, state: dict, rows: list[dict]) -> None:
+        seen = state["seen"]
+        added = False
+        for row in rows:
+            created_at = self._timestamp(row.get("created_at"))
+            key = (created_at, row["role"])
+            if created_at is not None and key in seen:
+                continue
+            if created_at is not None:
+                seen[key] = created_at
+            state["window"].append(
+                {"role": row["role"], "content": row.get("content") or "", "created_at": created_at}
+            )
+            added = True
+            if created_at and (
+                state["last_created_at"] is None or created_at > state["last_created_at"]
+            ):
+                state["last_created_at"] = created_at
+
+        if added:
+            # שורה שנכתבה באיחור נכנסת למקומה לפי created_at
+            state["window"].sort(
+                key=lambda row: row["created_at"] or datetime.max.replace(tzinfo=timezone.utc)
+            )
+        if state["last_created_at"] is not None:
+            horizon = state["last_created_at"] - timedelta(seconds=self.FETCH_OVERLAP_SECONDS)
+            for key in [key for key, created_at in seen.items() if created_at < horizon]:
+                del seen[key]
+
+        overflow = len(state["window"]) - self.window_size
+        if overflow > 0:
+            state["pending"] += state["window"][:overflow]
+            del state["window"][:overflow]
+
+        if len(state["pending"]) >= self.summary_batch and not state["summarizing"]:
+            self._schedule_summary(user_id, state)
+
+    def _schedule_summary(self, user_id: str, state: dict) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        state["summarizing"] = True
+        task = loop.create_task(self._summarize(user_id, state))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, user_id: str, state: dict) -> None:
+        pending = state["pending"]
+        state["pending"] = []
+        try:
+            if self._summarizer is None:
+                self._summarizer = Agent(
+                    name="history_summarizer",
+                    instructions=summary_instructions,
+                    model="gpt-4o-mini",
+                )
+            transcript = "\n".join(f"{row['role']}: {row['content']}" for row in pending)
+            result = await Runner.run(
+                self._summarizer,
+                f"Current summary:\n{state['summary'] or '(empty)'}\n\n"
+                f"Older messages:\n{transcript}",
+            )
+            state["summary"] = str(result.final_output)[: self.SUMMARY_MAX_CHARS]
+        except Exception as e:
+            print(f"Error summarizing history for user {user_id}: {e}")
+            # ננסה שוב בפעם הבאה, בלי לתת לרשימה לגדול בלי גבול
+            state["pending"] = (pending + state["pending"])[-self.summary_batch * 5 :]
+        finally:
+            state["summarizing"] = False
+
+
+conversation_memory = ConversationMemory()
@@ -0,0 +1,159 @@
+import asyncio
+import math
+import os
+from contextlib import nullcontext
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+
+class ProviderLimits:
+    """
+    How many digest jobs may use each external provider at the same time.
+
+    A job wraps each provider call in `async with limits.gmail:` (or llm /
+    telegram). A limit of None means no limit, which is what callers outside
+    the digest runner get with NO_LIMITS.
+    """
+
+    def __init__(
+        self,
+        gmail: int | None = None,
+        llm: int | None = None,
+        telegram: int | None = None,
+    ):
+        self.gmail = asyncio.Semaphore(gmail) if gmail else nullcontext()
+        self.llm = asyncio.Semaphore(llm) if llm else nullcontext()
+        self.telegram = asyncio.Semaphore(telegram) if telegram else nullcontext()
+
+    @classmethod
+    def from_env(cls) -> "ProviderLimits":
+        return cls(
+            gmail=int(os.getenv("DIGEST_GMAIL_CONCURRENCY", "20")),
+            llm=int(os.getenv("DIGEST_LLM_CONCURRENCY", "10")),
+            telegram=int(os.getenv("DIGEST_TELEGRAM_CONCURRENCY", "20")),
+        )
+
+
+NO_LIMITS = ProviderLimits()
+
+
+async def to_thread_limited(limit, func, *args):
+    """
+    asyncio.to_thread(func, *args) under a ProviderLimits limit.
+
+    A job cancelled by its timeout cannot stop the thread, so the slot is
+    given back when the thread is done rather than when the job is
+    cancelled; otherwise threads would pile up beyond the limit.
+    """
+    if not isinstance(limit, asyncio.Semaphore):
+        return await asyncio.to_thread(func, *args)
+
+    await limit.acquire()
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+
+    def release(future):
+        limit.release()
+        # שגיאה של thread שהקורא שלו כבר בוטל - לא להשאיר אותה "לא נקראה"
+        if not future.cancelled():
+            future.exception()
+
+    future.add_done_callback(release)
+    return await asyncio.shield(future)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return 0.0
+    index = min(len(values), max(1, math.ceil(p / 100 * len(values)))) - 1
+    return values[index]
+
+
+class DigestRunner:
+    """
+    Runs the digest job for every due user on one event loop.
+
+    Each run starts up to CONCURRENCY workers that take users from the list,
+    and every job gets USER_TIMEOUT_SECONDS before it is cancelled. The
+    same limit applies across runs that overlap, and the ProviderLimits cap
+    concurrent calls to Gmail, the LLM and Telegram. run() returns (and
+    prints) a report with the latency percentiles of the run: the time from
+    the start of the run until each user's digest was done.
+
+    job(user_id, chat_id, limits) is a coroutine function. A job that raises,
+    or returns a dict with an "error" key, counts as failed.
+    """
+
+    CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "50"))
+
+    USER_TIMEOUT_SECONDS = float(os.getenv("DIGEST_USER_TIMEOUT", "60"))
+
+    def __init__(
+        self,
+        job,
+        concurrency: int | None = None,
+        user_timeout: float | None = None,
+        limits: ProviderLimits | None = None,
+    ):
+        self.job = job
+        self.concurrency = concurrency or self.CONCURRENCY
+        self.user_timeout = user_timeout or self.USER_TIMEOUT_SECONDS
+        self.limits = limits or ProviderLimits.from_env()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self.last_report: dict | None = None
+
+    async def run(self, rows: list[dict]) -> dict:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        pending = iter(rows)
+        latencies = []
+        counts = {"ok": 0, "failed": 0, "timeout": 0}
+
+        async def worker():
+            for row in pending:
+                status = await self._run_one(row)
+                counts[status] += 1
+                latencies.append(loop.time() - start)
+
+        workers = min(self.concurrency, len(rows))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+        latencies.sort()
+        report = {
+            "users": len(rows),
+            **counts,
+            "wall_s": loop.time() - start,
+            "p50_s": percentile(latencies, 50),
+            "p90_s": percentile(latencies, 90),
+            "p99_s": percentile(latencies, 99),
+            "max_s": latencies[-1] if latencies else 0.0,
+        }
+        self.last_report = report
+        print(
+            f"digest run: {report['users']} users, ok={report['ok']} "
+            f"failed={report['failed']} timeout={report['timeout']} "
+            f"wall={report['wall_s']:.1f}s p50={report['p50_s']:.1f}s "
+            f"p90={report['p90_s']:.1f}s p99={report['p99_s']:.1f}s"
+        )
+        return report
+
+    async def _run_one(self, row: dict) -> str:
+        async with self._slots:
+            try:
+                result = await asyncio.wait_for(
+                    self.job(row["user_id"], row["chat_id"], self.limits),
+                    timeout=self.user_timeout,
+                )
+            except asyncio.TimeoutError:
+                print(f"error 👉: digest for user {row['user_id']} timed out")
+                return "timeout"
+            except Exception as e:
+                print(f"error 👉: digest for user {row['user_id']} failed: {e}")
+                return "failed"
+        if isinstance(result, dict) and result.get("error"):
+            return "failed"
+        return "ok"
@@ -0,0 +1,292 @@
+import asyncio
+import heapq
+import os
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from supabase_client import supabase, filter_value
+
+load_dotenv(override=True)
+
+
+class DigestScheduler:
+    """
+    Fires each user's daily digest at the time set in user_chat_ids.
+
+    The table is read once at start. Every user with a time gets an entry in
+    a min-heap keyed by the next fire time, and the loop sleeps until the
+    earliest one is due. Changes are picked up with a small delta query on
+    updated_at every POLL_SECONDS (rows whose time was cleared are removed),
+    so the number of reads does not depend on the number of users. The
+    delta pages by (updated_at, user_id), so rows sharing a timestamp are
+    not skipped. Rows deleted from the table are dropped by the full reload
+    every FULL_RELOAD_SECONDS, or right away with remove().
+
+    A failed read is logged and tried again after a backoff that doubles up
+    to MAX_ERROR_BACKOFF_SECONDS. Users already in the heap keep firing.
+
+    Due users are passed to on_due(rows) as a list, in a background task.
+    Times are HH:MM in the server's local time, like the old polling loop.
+    """
+
+    TABLE = "user_chat_ids"
+
+    # updated_at צריך להתעדכן בכל שינוי של השורה (default now() ו-trigger ב-update)
+    COLUMNS = "user_id, chat_id, time, updated_at"
+
+    POLL_SECONDS = float(os.getenv("DIGEST_SCHEDULE_POLL_SECONDS", "30"))
+
+    FULL_RELOAD_SECONDS = float(os.getenv("DIGEST_FULL_RELOAD_SECONDS", "86400"))
+
+    PAGE_SIZE = 1000
+
+    ERROR_BACKOFF_SECONDS = float(os.getenv("DIGEST_SCHEDULE_ERROR_BACKOFF", "5"))
+
+    MAX_ERROR_BACKOFF_SECONDS = float(
+        os.getenv("DIGEST_SCHEDULE_MAX_ERROR_BACKOFF", "300")
+    )
+
+    def __init__(self, on_due, clock=time.time):
+        self.on_due = on_due
+        self.clock = clock
+        self._heap: list[tuple[float, int, str]] = []
+        # user_id -> (שורה, גרסה). רשומה בערימה עם גרסה ישנה מתעלמים ממנה
+        self._users: dict[str, tuple[dict, int]] = {}
+        self._version = 0
+        # (updated_at, user_id) של השורה האחרונה שנקראה - ה-cursor של שאילתת ה-delta
+        self._last_seen: tuple[str, str] | None = None
+        self._failures = 0
+        self._next_poll = 0.0
+        self._next_reload = 0.0
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+        self.reads = 0
+        self.fired = 0
+
+    @staticmethod
+    def next_fire_time(user_time: str, now: float) -> float | None:
+        """
+        The next moment after now at user_time (HH:MM) local time, as a timestamp.
+        """
+        try:
+            hour, minute = (int(part) for part in user_time[:5].split(":"))
+        except (TypeError, ValueError):
+            return None
+        today = datetime.fromtimestamp(now)
+        fire = today.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if fire.timestamp() <= now:
+            fire += timedelta(days=1)
+        return fire.timestamp()
+
+    def update(self, row: dict) -> None:
+        """
+        Add, reschedule or (when it has no time) remove a user's digest.
+        """
+        user_id = row["user_id"]
+        fire_at = self.next_fire_time(row.get("time"), self.clock())
+        if fire_at is None or not row.get("chat_id"):
+            self.remove(user_id)
+            return
+        self._version += 1
+        self._users[user_id] = (row, self._version)
+        heapq.heappush(self._heap, (fire_at, self._version, user_id))
+        # אולי הרשומה החדשה מוקדמת ממה שהלולאה מחכה לו
+        self._wake.set()
+
+    def remove(self, user_id: str) -> None:
+        self._users.pop(user_id, None)
+
+    def next_deadline(self) -> float | None:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self) -> None:
+        while self._heap:
+            _, version, user_id = self._heap[0]
+            entry = self._users.get(user_id)
+            if entry is not None and entry[1] == version:
+                return
+            heapq.heappop(self._heap)
+
+    def pop_due(self, now: float) -> list[dict]:
+        """
+        Remove the users whose fire time has come and schedule their next day.
+        """
+        due = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, version, user_id = heapq.heappop(self._heap)
+            row = self._users[user_id][0]
+            due.append(row)
+            # מהשעה הנוכחית ולא מזמן הירי, כדי לא לירות שוב ושוב אחרי השהיה ארוכה
+            heapq.heappush(
+                self._heap, (self.next_fire_time(row["time"], now), version, user_id)
+            )
+
+    def load(self) -> None:
+        """
+        Read the whole table and rebuild the heap.
+        """
+        self._reload(self._fetch_all())
+
+    def _reload(self, rows: list[dict]) -> None:
+        self._heap = []
+        self._users = {}
+        self._apply(rows)
+        now = self.clock()
+        self._next_poll = now + self.POLL_SECONDS
+        self._next_reload = now + self.FULL_RELOAD_SECONDS
+
+    def apply_changes(self) -> int:
+        """
+        Apply rows changed since the last read. Returns how many there were.
+        """
+        return self._apply(self._fetch_changed(self._last_seen))
+
+    def _apply(self, rows: list[dict]) -> int:
+        for row in rows:
+            self.update(row)
+            self._track_last_seen(row)
+        self._next_poll = self.clock() + self.POLL_SECONDS
+        return len(rows)
+
+    def _track_last_seen(self, row: dict) -> None:
+        updated_at = row.get("updated_at")
+        if not updated_at:
+            return
+        try:
+            datetime.fromisoformat(updated_at)
+        except (TypeError, ValueError):
+            print(f"error 👉: bad updated_at for user {row['user_id']}: {updated_at!r}")
+            return
+        key = (updated_at, row["user_id"])
+        if self._last_seen is None or key > self._last_seen:
+            self._last_seen = key
+
+    def _fetch_all(self) -> list[dict]:
+        rows = []
+        while True:
+            self.reads += 1
+            page = (
+                supabase.table(self.TABLE)
+                .select(self.COLUMNS)
+                .order("user_id")
+                .range(len(rows), len(rows) + self.PAGE_SIZE - 1)
+                .execute()
+                .data
+            )
+            rows += page
+            if len(page) < self.PAGE_SIZE:
+                return rows
+
+    def _fetch_changed(self, since: tuple[str, str] | None) -> list[dict]:
+        self.reads += 1
+        query = supabase.table(self.TABLE).select(self.COLUMNS)
+        if since:
+            # (updated_at, user_id) > since בלי tuple comparison ב-PostgREST
+            updated_at, user_id = (filter_value(value) for value in since)
+            query = query.or_(
+                f"updated_at.gt.{updated_at},"
+                f"and(updated_at.eq.{updated_at},user_id.gt.{user_id})"
+            )
+        return (
+            query.order("updated_at")
+            .order("user_id")
+            .limit(self.PAGE_SIZE)
+            .execute()
+            .data
+        )
+
+    def _dispatch(self, rows: list[dict]) -> None:
+        self.fired += len(rows)
+        task = asyncio.get_running_loop().create_task(self._run_due(rows))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_due(self, rows: list[dict]) -> None:
+        try:
+            await self.on_due(rows)
+        except Exception as e:
+            print(f"error 👉: digest for {len(rows)} users failed: {e}")
+
+    async def _read(self, now: float) -> None:
+        # הקריאות ל-Supabase חוסמות, אז הן רצות ב-thread
+        if now >= self._next_reload:
+            self._reload(await asyncio.to_thread(self._fetch_all))
+        elif now >= self._next_poll:
+            # עמוד מלא אומר שיש עוד שינויים, אז ממשיכים לקרוא
+            while (
+                self._apply(
+                    await asyncio.to_thread(self._fetch_changed, self._last_seen)
+                )
+                == self.PAGE_SIZE
+            ):
+                pass
+
+    def _back_off(self, now: float, error: Exception) -> None:
+        self._failures += 1
+        delay = min(
+            self.MAX_ERROR_BACKOFF_SECONDS,
+            self.ERROR_BACKOFF_SECONDS * 2 ** (self._failures - 1),
+        )
+        print(f"error 👉: reading {self.TABLE} failed, retrying in {delay:.0f}s: {error}")
+        retry_at = now + delay
+        if now >= self._next_reload:
+            self._next_reload = retry_at
+        self._next_poll = max(self._next_poll, retry_at)
+
+    async def run(self) -> None:
+        # _next_reload מתחיל ב-0, אז הסיבוב הראשון טוען את כל הטבלה
+        while True:
+            self._wake.clear()
+            now = self.clock()
+            try:
+                await self._read(now)
+                self._failures = 0
+            except Exception as e:
+                self._back_off(now, e)
+
+            now = self.clock()
+            due = self.pop_due(now)
+            if due:
+                self._dispatch(due)
+
+            wake_at = min(self._next_poll, self._next_reload)
+            deadline = self.next_deadline()
+            if deadline is not None:
+                wake_at = min(wake_at, deadline)
+            try:
+                await asyncio.wait_for(
+                    self._wake.wait(), timeout=max(0.0, wake_at - self.clock())
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "heap": len(self._heap),
+            "reads": self.reads,
+            "fired": self.fired,
+            "next_deadline": self.next_deadline(),
+        }
@@ -0,0 +1,160 @@
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+from supabase_client import supabase
+
+load_dotenv(override=True)
+
+# סימן עצירה בתור
+_STOP = object()
+
+
+class MessageWriter:
+    """
+    Write-behind queue for chat rows in the messages table.
+
+    enqueue() returns at once; a background task collects rows from all
+    requests and writes them with one bulk insert per batch (up to
+    BATCH_SIZE rows, or whatever arrived within FLUSH_INTERVAL_SECONDS).
+    Failed inserts are retried with exponential backoff. stop() writes
+    everything still queued, so the app lifespan flushes on shutdown.
+
+    Write-behind needs a long-lived process: on a serverless host such as
+    Vercel an instance can be frozen or recycled before stop() runs, and
+    the queued rows would be lost. So the queue is used only when
+    WRITE_BEHIND is on (env CHAT_WRITE_BEHIND, off by default when the
+    VERCEL env variable is set) and start() was called by the lifespan.
+    Otherwise enqueue() writes the rows through before returning.
+
+    Rows keep the created_at they were given when queued, so the order of a
+    user / assistant pair (assistant at +1ms) does not depend on when the
+    batch is written.
+    """
+
+    TABLE = "messages"
+
+    BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100"))
+
+    FLUSH_INTERVAL_SECONDS = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", "0.5"))
+
+    MAX_RETRIES = int(os.getenv("CHAT_WRITE_MAX_RETRIES", "5"))
+
+    RETRY_BASE_SECONDS = float(os.getenv("CHAT_WRITE_RETRY_BASE", "0.5"))
+
+    WRITE_BEHIND = (
+        os.getenv("CHAT_WRITE_BEHIND", "false" if os.getenv("VERCEL") else "true").lower()
+        == "true"
+    )
+
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.written = 0
+        self.retries = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def enqueue(self, rows: list[dict]) -> None:
+        """
+        Queue rows for writing. Without a running writer they are written right away.
+        """
+        if not self.running:
+            # אין worker ארוך-חיים שיכתוב את התור, אז כותבים עכשיו
+            try:
+                self._insert(rows)
+                self.written += len(rows)
+            except Exception as e:
+                self.dropped += len(rows)
+                print("error 👉:", e)
+            return
+        for row in rows:
+            self._queue.put_nowait(row)
+
+    def start(self) -> None:
+        if not self.WRITE_BEHIND:
+            return
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Write every queued row, then stop the writer.
+        """
+        if self._task is None or self._task.done():
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is _STOP:
+                break
+            batch = [row]
+            deadline = loop.time() + self.FLUSH_INTERVAL_SECONDS
+            # אוספים עוד שורות מבקשות אחרות עד שה-batch מתמלא או שהזמן נגמר
+            while len(batch) < self.BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._write(batch)
+
+        # כיבוי: כותבים את מה שנשאר בתור
+        batch = []
+        while not self._queue.empty():
+            row = self._queue.get_nowait()
+            if row is not _STOP:
+                batch.append(row)
+            if len(batch) == self.BATCH_SIZE:
+                await self._write(batch)
+                batch = []
+        await self._write(batch)
+
+    async def _write(self, batch: list[dict]) -> None:
+        if not batch:
+            return
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                await asyncio.to_thread(self._insert, batch)
+                self.written += len(batch)
+                return
+            except Exception as e:
+                if attempt == self.MAX_RETRIES:
+                    self.dropped += len(batch)
+                    print(f"error 👉: dropping {len(batch)} chat rows after {attempt + 1} attempts: {e}")
+                    return
+                self.retries += 1
+                delay = self.RETRY_BASE_SECONDS * 2**attempt
+                print(f"error 👉: chat rows insert failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def _insert(self, rows: list[dict]) -> None:
+        supabase.table(self.TABLE).insert(rows).execute()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "written": self.written,
+            "retries": self.retries,
+            "dropped": self.dropped,
+        }
+
+
+message_writer = MessageWriter()
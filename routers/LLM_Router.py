@@ -1,6 +1,14 @@
-from fastapi import APIRouter, Request
-from controllers.agent_controller import handle_message
-from supabase_client import supabase
+from fastapi import APIRouter, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from controllers.agent_controller import handle_message, stream_message
+from controllers.messages_controller import (
+    MAX_PAGE_SIZE,
+    etag_matches,
+    fetch_messages,
+    history_etag,
+    history_version,
+)
+import asyncio
 
 routerLLM = APIRouter()
 
@@ -15,12 +23,41 @@ async def chat(user_id: str, request: Request):
     return await handle_message(message, user_id)
 
 
+@routerLLM.post("/ask-llm-stream/{user_id}")
+async def chat_stream(user_id: str, request: Request):
+    request_data = await request.json()
+    message = request_data.get("message", "")
+    print("message from ask-llm-stream: ", message)
+    return StreamingResponse(
+        stream_message(message, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @routerLLM.get("/get-messages/{user_id}")
-async def get_messages(user_id: str):
-    response = supabase.table("messages")\
-    .select("*")\
-    .eq("user_id", user_id)\
-    .order("created_at", desc=False)\
-    .order("role", desc=False)\
-    .execute()
-    return response.data
\ No newline at end of file
+async def get_messages(
+    user_id: str,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    before: str | None = None,
+    since: str | None = None,
+    fields: str | None = None,
+    if_none_match: str | None = Header(None),
+):
+    # 304 בלי גוף כשההיסטוריה לא השתנתה מאז הבקשה הקודמת של הלקוח
+    version = await asyncio.to_thread(history_version, user_id)
+    params = {"limit": limit, "before": before, "since": since, "fields": fields}
+    etag = history_etag(user_id, version, params)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    page = await asyncio.to_thread(
+        fetch_messages, user_id, limit, before, since, fields
+    )
+    if page["next_cursor"]:
+        headers["X-Next-Cursor"] = page["next_cursor"]
+    if page["since_cursor"]:
+        headers["X-Since-Cursor"] = page["since_cursor"]
+    # התשובה נשארת רשימה, כמו קודם
+    return JSONResponse(content=page["messages"], headers=headers)
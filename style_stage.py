@@ -0,0 +1,362 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Literal
+
+from agents import Runner
+from dotenv import load_dotenv
+from openai.types.responses import ResponseTextDeltaEvent
+from pydantic import BaseModel, Field
+
+from styleAgent import get_style_agent
+
+load_dotenv(override=True)
+
+
+class ReplyEmail(BaseModel):
+    msg_id: str = Field(..., description="The ID of the email message.")
+
+    subject: str = Field(..., description="The subject of the email message.")
+
+    sender: str = Field(..., description="The sender of the email message.")
+
+    date: str = Field(..., description="The date when the email was sent.")
+
+    snippet: str = Field(..., description="A short snippet of the email message.")
+
+    body: str | None = Field(
+        None, description="The body of the email, only when the user asked to read it."
+    )
+
+
+class AgentReply(BaseModel):
+    """
+    Structured final output of the mail agent. The styling stage turns it
+    into the Hebrew text the user sees.
+    """
+
+    kind: Literal[
+        "email_list", "email", "draft", "missing", "confirmation", "error", "text"
+    ] = Field(
+        ...,
+        description=(
+            "email_list: search results. email: one email the user asked to read. "
+            "draft: an email ready to send, waiting for the user's confirmation. "
+            "missing: a field of the email draft is missing. "
+            "confirmation: an action was completed. error: an action failed. "
+            "text: anything else, written in 'text'."
+        ),
+    )
+
+    text: str | None = Field(
+        None, description="Free-form reply for kind 'text', or extra details for other kinds."
+    )
+
+    emails: list[ReplyEmail] | None = Field(
+        None, description="The emails for kind 'email_list' or 'email'."
+    )
+
+    to: str | None = Field(None, description="Draft recipient.")
+
+    subject: str | None = Field(None, description="Draft subject.")
+
+    body: str | None = Field(None, description="Draft body.")
+
+    missing_field: Literal["to", "subject", "body"] | None = Field(
+        None, description="The missing draft field for kind 'missing'."
+    )
+
+    action: Literal[
+        "sent", "deleted", "archived", "marked_read", "marked_unread", "starred", "unstarred"
+    ] | None = Field(None, description="The completed action for kind 'confirmation'.")
+
+    count: int | None = Field(
+        None, description="How many emails the action affected, if more than one."
+    )
+
+    error: str | None = Field(None, description="What went wrong, for kind 'error'.")
+
+
+MISSING_FIELD_QUESTIONS = {
+    "to": "לאיזו כתובת מייל לשלוח את ההודעה?",
+    "subject": "מה יהיה הנושא של המייל?",
+    "body": "מה תרצה לכתוב בגוף המייל?",
+}
+
+ACTION_LABELS = {
+    "sent": "נשלח",
+    "deleted": "נמחק",
+    "archived": "הועבר לארכיון",
+    "marked_read": "סומן כנקרא",
+    "marked_unread": "סומן כלא נקרא",
+    "starred": "סומן בכוכב",
+    "unstarred": "הכוכב הוסר",
+}
+
+FIELD_LABELS = {
+    "to": "אל",
+    "subject": "נושא",
+    "body": "תוכן",
+    "action": "פעולה",
+    "count": "מספר מיילים",
+    "error": "שגיאה",
+}
+
+# כשאין שום דבר להציג, כדי שהמשתמש לא יקבל הודעה ריקה
+EMPTY_REPLY = "לא הצלחתי להכין תשובה, נסה לנסח את הבקשה שוב."
+
+
+def _email_line(index: int, email: ReplyEmail) -> str:
+    line = f"{index}. {email.subject or '(ללא נושא)'} – מאת {email.sender}"
+    if email.date:
+        line += f" ({email.date})"
+    if email.snippet:
+        line += f"\n   {email.snippet}"
+    return line
+
+
+def render_template(reply: AgentReply) -> str | None:
+    """
+    Render the fixed Hebrew wording of a structured reply, or None when the reply needs the style agent.
+
+    reply.text (extra details) is added after the fixed wording.
+    """
+    rendered = _render_kind(reply)
+    if rendered is None:
+        return None
+    # ב-error בלי reply.error הטקסט כבר מוצג כפרטי השגיאה
+    if reply.text and reply.text.strip() and (reply.kind != "error" or reply.error):
+        rendered += f"\n\n{reply.text.strip()}"
+    return rendered
+
+
+def render_fallback(reply: AgentReply) -> str:
+    """
+    Generic rendering of the fields an incomplete structured reply does have.
+    """
+    lines = [_email_line(i, email) for i, email in enumerate(reply.emails or [], 1)]
+    if reply.missing_field:
+        lines.append(MISSING_FIELD_QUESTIONS[reply.missing_field])
+    for field, label in FIELD_LABELS.items():
+        value = getattr(reply, field)
+        if value is None or value == "":
+            continue
+        if field == "action":
+            value = ACTION_LABELS[value]
+        lines.append(f"{label}: {value}")
+    return "\n".join(lines) or EMPTY_REPLY
+
+
+def _render_kind(reply: AgentReply) -> str | None:
+    if reply.kind == "email_list" and reply.emails is not None:
+        if not reply.emails:
+            return "לא נמצאו מיילים שמתאימים לחיפוש."
+        count = len(reply.emails)
+        lines = ["מצאתי מייל אחד:" if count == 1 else f"מצאתי {count} מיילים:"]
+        lines += [_email_line(i, email) for i, email in enumerate(reply.emails, 1)]
+        return "\n".join(lines)
+
+    if reply.kind == "email" and reply.emails:
+        email = reply.emails[0]
+        lines = [
+            f"נושא: {email.subject or '(ללא נושא)'}",
+            f"מאת: {email.sender}",
+        ]
+        if email.date:
+            lines.append(f"תאריך: {email.date}")
+        lines.append("")
+        lines.append(email.body or email.snippet)
+        return "\n".join(lines)
+
+    if reply.kind == "draft" and reply.to and reply.subject and reply.body:
+        return (
+            "זה המייל שהכנתי:\n"
+            f"אל: {reply.to}\n"
+            f"נושא: {reply.subject}\n\n"
+            f"{reply.body}\n\n"
+            "לשלוח אותו?"
+        )
+
+    if reply.kind == "missing" and reply.missing_field:
+        return MISSING_FIELD_QUESTIONS[reply.missing_field]
+
+    if reply.kind == "confirmation" and reply.action:
+        label = ACTION_LABELS[reply.action]
+        if reply.action == "sent" and reply.to:
+            return f"המייל {label} בהצלחה אל {reply.to}."
+        if reply.count and reply.count > 1:
+            return f"{reply.count} מיילים: {label} בהצלחה."
+        return f"המייל {label} בהצלחה."
+
+    if reply.kind == "error":
+        details = reply.error or reply.text
+        return f"משהו השתבש: {details}" if details else "משהו השתבש, נסה שוב."
+
+    return None
+
+
+class StyleResult(BaseModel):
+    text: str
+
+    path: Literal["template", "phrase_cache", "llm", "plain"]
+
+    latency_ms: float
+
+    tokens: int
+
+
+class StyleStage:
+    """
+    Styling step that runs after the mail agent instead of inside it.
+
+    Structured replies (email lists, drafts, confirmations, errors) are
+    rendered from templates, with reply.text added after them. An
+    incomplete structured reply goes to the style agent when it has text,
+    and is otherwise rendered field by field, so the user never gets an
+    empty message. Free-form text goes through get_style_agent(),
+    and short results are kept in a phrase cache, so a repeated phrase is
+    styled once. The stats compare the cheap paths with the average cost of
+    the style agent, to show the latency and tokens saved per turn.
+    """
+
+    PHRASE_CACHE_SIZE = int(os.getenv("STYLE_PHRASE_CACHE_SIZE", "1000"))
+
+    # רק משפטים קצרים חוזרים על עצמם מספיק כדי שכדאי לשמור אותם
+    PHRASE_MAX_CHARS = int(os.getenv("STYLE_PHRASE_MAX_CHARS", "300"))
+
+    def __init__(self, phrase_cache_size: int | None = None):
+        self.phrase_cache_size = phrase_cache_size or self.PHRASE_CACHE_SIZE
+        self._phrases: OrderedDict[str, str] = OrderedDict()
+        self._lock = Lock()
+        self._style_agent = None
+        self.turns = {"template": 0, "phrase_cache": 0, "llm": 0, "plain": 0}
+        self.llm_latency_ms = 0.0
+        self.llm_tokens = 0
+
+    @staticmethod
+    def _phrase_key(text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip().lower()
+
+    def _cached_phrase(self, key: str) -> str | None:
+        with self._lock:
+            styled = self._phrases.get(key)
+            if styled is not None:
+                self._phrases.move_to_end(key)
+            return styled
+
+    def _cache_phrase(self, key: str, styled: str) -> None:
+        with self._lock:
+            self._phrases[key] = styled
+            self._phrases.move_to_end(key)
+            while len(self._phrases) > self.phrase_cache_size:
+                self._phrases.popitem(last=False)
+
+    async def _stream_style_agent(self, text: str, usage: dict):
+        if self._style_agent is None:
+            self._style_agent = get_style_agent()
+        result = Runner.run_streamed(self._style_agent, text)
+        async for event in result.stream_events():
+            if event.type == "raw_response_event" and isinstance(
+                event.data, ResponseTextDeltaEvent
+            ):
+                yield event.data.delta
+        usage["tokens"] = result.context_wrapper.usage.total_tokens
+        usage["text"] = str(result.final_output)
+
+    async def style(self, reply) -> StyleResult:
+        """
+        Turn the agent's final output (an AgentReply, or plain text) into the reply for the user.
+        """
+        async for item in self.stream(reply):
+            if isinstance(item, StyleResult):
+                return item
+
+    async def stream(self, reply):
+        """
+        Like style(), but yields the reply text in pieces as the style agent writes it.
+
+        Template and cached replies come as a single piece. The last item is the StyleResult.
+        """
+        start = time.perf_counter()
+        tokens = 0
+
+        if isinstance(reply, AgentReply):
+            styled = render_template(reply)
+            text = reply.text or ""
+            if styled is None and not text.strip():
+                # תשובה מובנית חסרה (למשל email_list בלי emails) בלי טקסט לעיצוב
+                styled = render_fallback(reply)
+        else:
+            styled = None
+            text = str(reply or "")
+
+        if styled is not None:
+            path = "template"
+        elif not text.strip():
+            styled, path = EMPTY_REPLY, "plain"
+        else:
+            key = self._phrase_key(text)
+            styled = self._cached_phrase(key)
+            if styled is not None:
+                path = "phrase_cache"
+            else:
+                usage = {}
+                async for delta in self._stream_style_agent(text, usage):
+                    yield delta
+                styled, tokens = usage["text"], usage["tokens"]
+                path = "llm"
+                if len(text) <= self.PHRASE_MAX_CHARS:
+                    self._cache_phrase(key, styled)
+
+        if path != "llm" and styled:
+            yield styled
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.turns[path] += 1
+            if path == "llm":
+                self.llm_latency_ms += latency_ms
+                self.llm_tokens += tokens
+
+        result = StyleResult(text=styled, path=path, latency_ms=latency_ms, tokens=tokens)
+        saved = self.saved(result)
+        print(
+            f"style: path={path} latency={latency_ms:.1f}ms tokens={tokens} "
+            f"saved≈{saved['latency_ms']:.0f}ms/{saved['tokens']} tokens"
+        )
+        yield result
+
+    def saved(self, result: StyleResult) -> dict:
+        """
+        Estimated latency and tokens this turn saved compared to an average style agent run.
+        """
+        with self._lock:
+            llm_turns = self.turns["llm"]
+            if result.path in ("llm", "plain") or not llm_turns:
+                return {"latency_ms": 0.0, "tokens": 0}
+            return {
+                "latency_ms": max(
+                    0.0, self.llm_latency_ms / llm_turns - result.latency_ms
+                ),
+                "tokens": round(self.llm_tokens / llm_turns),
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            llm_turns = self.turns["llm"]
+            cheap_turns = self.turns["template"] + self.turns["phrase_cache"]
+            avg_latency = self.llm_latency_ms / llm_turns if llm_turns else 0.0
+            avg_tokens = self.llm_tokens / llm_turns if llm_turns else 0.0
+            return {
+                "turns": dict(self.turns),
+                "phrase_cache_size": len(self._phrases),
+                "llm_avg_latency_ms": avg_latency,
+                "llm_avg_tokens": avg_tokens,
+                "estimated_saved_latency_ms": avg_latency * cheap_turns,
+                "estimated_saved_tokens": round(avg_tokens * cheap_turns),
+            }
+
+
+style_stage = StyleStage()
@@ -0,0 +1,3 @@
+-- תוקף ה-access token, כדי שתהליכים אחרים ואתחולים לא ירעננו טוקן שעוד בתוקף
+alter table public.user_tokens
+    add column if not exists expiry timestamptz;
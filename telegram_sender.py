@@ -0,0 +1,284 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+
+MAX_MESSAGE_CHARS = 4096
+
+_HTML_TOKEN = re.compile(r"<[^>]*>|&#?\w+;|\n|[^\S\n]+|[^<&\s]+|[<&]")
+
+_TEXT_TOKEN = re.compile(r"\n|[^\S\n]+|\S+")
+
+_TAG_NAME = re.compile(r"<\s*/?\s*([\w-]+)")
+
+
+def _tokens(text: str, html: bool, max_token: int) -> list[str]:
+    tokens = []
+    for token in (_HTML_TOKEN if html else _TEXT_TOKEN).findall(text):
+        if len(token) > max_token and not (html and token.startswith("<")):
+            # מילה ארוכה מדי (למשל קישור) נחתכת לחתיכות
+            tokens += [
+                token[start : start + max_token]
+                for start in range(0, len(token), max_token)
+            ]
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def _apply_tag(stack: list, token: str) -> list:
+    match = _TAG_NAME.match(token)
+    if not token.startswith("<") or not match:
+        return stack
+    name = match.group(1).lower()
+    if token.startswith("</"):
+        for index in range(len(stack) - 1, -1, -1):
+            if stack[index][0] == name:
+                return stack[:index]
+        return stack
+    if token.endswith("/>"):
+        return stack
+    return stack + [(name, token)]
+
+
+def _closing(stack: list) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_CHARS, html: bool = True) -> list[str]:
+    """
+    Split text into Telegram messages of at most limit characters.
+
+    Prefers to cut at a line break, then at a space, and never cuts inside
+    an HTML tag or entity. With html, tags still open at a cut are closed
+    at the end of the chunk and opened again at the start of the next one.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    tokens = _tokens(text, html, max(1, limit // 4))
+    chunks = []
+    stack = []
+    index = 0
+    while index < len(tokens):
+        parts = [tag for _, tag in stack]
+        size = sum(len(part) for part in parts)
+        chunk_stack = stack
+        # נקודות חיתוך: (אינדקס הטוקן הבא, מספר החלקים, תגיות פתוחות)
+        line_break = space_break = None
+        end = index
+        while end < len(tokens):
+            token = tokens[end]
+            next_stack = _apply_tag(chunk_stack, token) if html else chunk_stack
+            if size + len(token) + len(_closing(next_stack)) > limit and end > index:
+                break
+            parts.append(token)
+            size += len(token)
+            chunk_stack = next_stack
+            end += 1
+            # חיתוך מוקדם מדי ייצר הודעות קצרות, אז רק מחצי ההודעה והלאה
+            if size >= limit // 2:
+                if token == "\n":
+                    line_break = (end, len(parts), chunk_stack)
+                elif token.isspace():
+                    space_break = (end, len(parts), chunk_stack)
+
+        if end == len(tokens):
+            cut = (end, len(parts), chunk_stack)
+        else:
+            cut = line_break or space_break or (end, len(parts), chunk_stack)
+
+        index, count, stack = cut
+        chunk = "".join(parts[:count]) + _closing(stack)
+        if re.sub(r"<[^>]*>", "", chunk).strip():
+            chunks.append(chunk)
+    return chunks
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second, with bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                wait = self.blocked_until - now
+                if wait <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(max(wait, (1 - self.tokens) / self.rate))
+
+    def pause(self, seconds: float) -> None:
+        """
+        Let no acquisition through for the next `seconds` (after a 429).
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class TelegramSender:
+    """
+    Async sendMessage client for the bot, shared by the whole process.
+
+    All messages go through one httpx.AsyncClient, so connections to the
+    Bot API are kept alive. Token buckets keep the send rate under
+    Telegram's limits: GLOBAL_RATE messages per second overall, CHAT_RATE
+    per private chat and GROUP_RATE per group. A 429 pauses the chat for the
+    retry_after Telegram asks for, and the message is sent again. Texts
+    longer than 4096 characters are split with split_message().
+    """
+
+    API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+    GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+
+    CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+
+    # קבוצות: עד 20 הודעות לדקה
+    GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))
+
+    MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+    MAX_CONNECTIONS = int(os.getenv("TELEGRAM_MAX_CONNECTIONS", "20"))
+
+    TIMEOUT_SECONDS = float(os.getenv("TELEGRAM_TIMEOUT", "30"))
+
+    MAX_CHATS = 10000
+
+    def __init__(
+        self,
+        token: str | None = None,
+        api_url: str | None = None,
+        global_rate: float | None = None,
+        chat_rate: float | None = None,
+        http: httpx.AsyncClient | None = None,
+    ):
+        self.token = token or os.getenv("TELEGRAM_BOT_TOKEN")
+        self.api_url = (api_url or self.API_URL).rstrip("/")
+        self.chat_rate = chat_rate or self.CHAT_RATE
+        self.global_bucket = TokenBucket(global_rate or self.GLOBAL_RATE)
+        self._chats: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._http = http
+        self.sent = 0
+        self.throttled = 0
+        self.failed = 0
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=self.TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=self.MAX_CONNECTIONS,
+                    max_keepalive_connections=self.MAX_CONNECTIONS,
+                ),
+            )
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            # מזהה שלילי = קבוצה או ערוץ
+            rate = self.GROUP_RATE if key.startswith("-") else self.chat_rate
+            bucket = self._chats[key] = TokenBucket(rate)
+            while len(self._chats) > self.MAX_CHATS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(key)
+        return bucket
+
+    async def send_message(
+        self, chat_id: str, text: str, parse_mode: str | None = "HTML"
+    ) -> dict:
+        """
+        Send text to a chat, split into several messages when it is too long.
+        """
+        try:
+            for chunk in split_message(text, html=parse_mode == "HTML"):
+                payload = {"chat_id": chat_id, "text": chunk}
+                if parse_mode:
+                    payload["parse_mode"] = parse_mode
+                await self._send(chat_id, payload)
+            return {"message": "Message sent successfully"}
+
+        except Exception as e:
+            self.failed += 1
+            print(f"Error sending message to Telegram: {e}")
+            return {"message": "Error sending message to Telegram"}
+
+    async def _send(self, chat_id: str, payload: dict) -> dict:
+        bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.MAX_RETRIES + 1):
+            # קודם התור של הצ'אט, כדי לא לתפוס מקום בתור הגלובלי בזמן המתנה
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                response = await self.http.post(
+                    f"{self.api_url}/bot{self.token}/sendMessage", json=payload
+                )
+            except httpx.TransportError:
+                if attempt == self.MAX_RETRIES:
+                    raise
+                await asyncio.sleep(2**attempt)
+                continue
+
+            if response.status_code == 200:
+                self.sent += 1
+                return response.json()
+
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == self.MAX_RETRIES:
+                    break
+                retry_after = 2**attempt
+                if response.status_code == 429:
+                    self.throttled += 1
+                    try:
+                        retry_after = response.json()["parameters"]["retry_after"]
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                bucket.pause(retry_after)
+                continue
+
+            break
+
+        raise RuntimeError(
+            f"Telegram API Error: {response.status_code} - {response.text}"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "throttled": self.throttled,
+            "failed": self.failed,
+            "chats": len(self._chats),
+        }
+
+
+telegram_sender = TelegramSender()
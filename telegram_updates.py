@@ -0,0 +1,109 @@
+import asyncio
+import os
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# סימן עצירה ל-worker
+_STOP = object()
+
+
+class TelegramUpdateQueue:
+    """
+    Background processing of Telegram webhook updates.
+
+    The webhook only calls submit() and answers 200 at once, so Telegram
+    does not time out and send the same update again. submit() drops
+    update_ids it has already seen (the last DEDUPE_SIZE of them) and queues
+    the rest. WORKERS tasks take updates from the queue and run the handler,
+    so a burst of updates waits in the queue instead of slowing the webhook.
+    When the queue is full, submit() returns False and the webhook answers
+    503, which makes Telegram retry the update later.
+    """
+
+    WORKERS = int(os.getenv("TELEGRAM_UPDATE_WORKERS", "4"))
+
+    QUEUE_SIZE = int(os.getenv("TELEGRAM_UPDATE_QUEUE_SIZE", "1000"))
+
+    DEDUPE_SIZE = int(os.getenv("TELEGRAM_UPDATE_DEDUPE_SIZE", "10000"))
+
+    def __init__(self, handler=None, workers: int | None = None):
+        self.handler = handler
+        self.workers = workers or self.WORKERS
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._seen: OrderedDict[int, None] = OrderedDict()
+        self.received = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def submit(self, update: dict) -> bool:
+        """
+        Queue an update for processing. Returns False when the queue is full.
+        """
+        update_id = update["update_id"]
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+
+        self.start()
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # לא זוכרים את העדכון, כדי שהניסיון החוזר של טלגרם יתקבל
+            self.rejected += 1
+            return False
+
+        self.received += 1
+        self._seen[update_id] = None
+        while len(self._seen) > self.DEDUPE_SIZE:
+            self._seen.popitem(last=False)
+        return True
+
+    def start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._tasks = [task for task in self._tasks if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(self._tasks) < self.workers:
+            self._tasks.append(loop.create_task(self.run()))
+
+    async def stop(self) -> None:
+        """
+        Process the updates still queued, then stop the workers.
+        """
+        tasks = [task for task in self._tasks if not task.done()]
+        if not tasks:
+            return
+        for _ in tasks:
+            # ה-sentinel נכנס גם כשהתור מלא
+            await self._queue.put(_STOP)
+        await asyncio.gather(*tasks)
+        self._tasks = []
+
+    async def run(self) -> None:
+        while True:
+            update = await self._queue.get()
+            if update is _STOP:
+                return
+            try:
+                await self.handler(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"error 👉: Telegram update {update.get('update_id')} failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "workers": len([task for task in self._tasks if not task.done()]),
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
@@ -2,6 +2,7 @@ from tools_agent_email.gmail_tools import GmailTools
 from styleAgent import get_style_agent
 from agents import Agent, trace, Runner
 from controllers.Telegram_Controller import send_message_to_telegram
+from digest_runner import NO_LIMITS, ProviderLimits, to_thread_limited
 
 
 style_agent = get_style_agent()
@@ -22,31 +23,41 @@ return name sender and subject and content and date always in hebrew only
 style_agent = Agent(name="style_agent", instructions=instructions, model="gpt-4o-mini")
 
 
-async def get_emails(user_id: str, chat_id: str):
+async def get_emails(user_id: str, chat_id: str, limits: ProviderLimits = NO_LIMITS):
     print("get_emails called 👉")
     print("user_id: ", user_id)
     print("chat_id: ", chat_id) 
-    gmail_tool = GmailTools(user_id)
     query = "חשבונית או קבלה"
     try:
-        results = gmail_tool.search_emails(
-            query=query,
-            label="INBOX",
-            max_results=3,
-            next_page_token=None,
-        )
+        # בניית הלקוח טוענת טוקנים מ-Supabase, אז היא רצה ב-thread.
+        # המקום ב-limits.gmail משתחרר רק כשה-thread מסתיים, גם אם ה-job בוטל
+        gmail_tool = await to_thread_limited(limits.gmail, GmailTools, user_id)
+        if gmail_tool.async_client is not None:
+            async with limits.gmail:
+                results = await gmail_tool.search_emails_async(
+                    query=query,
+                    label="INBOX",
+                    max_results=3,
+                    next_page_token=None,
+                )
+        else:
+            results = await to_thread_limited(
+                limits.gmail, gmail_tool.search_emails, query, "INBOX", 3, None
+            )
         emails_text = "\n\n".join(
             [
                 f"Subject: {e.subject}\nSender: {e.sender}\nSnippet: {e.snippet}"
                 for e in results.messages
             ]
         )
-        with trace("get_emails"):
-            result = await Runner.run(style_agent, emails_text)
-            print("result from LLM: ", result.final_output)
-        await send_message_to_telegram(chat_id=chat_id, text=result.final_output)
+        async with limits.llm:
+            with trace("get_emails"):
+                result = await Runner.run(style_agent, emails_text)
+                print("result from LLM: ", result.final_output)
+        async with limits.telegram:
+            await send_message_to_telegram(chat_id=chat_id, text=result.final_output)
         return {"message": "Emails retrieved successfully", "data": results}
 
     except Exception as e:
         print(f"Error retrieving emails: {e}")
-        return {"message": "Error retrieving emails"}
+        return {"message": "Error retrieving emails", "error": str(e)}
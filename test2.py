@@ -1,30 +1,18 @@
-import schedule
-import time
 import asyncio
-from datetime import datetime
-from supabase_client import supabase
+from digest_runner import DigestRunner
+from digest_scheduler import DigestScheduler
 from test import get_emails
 
-def do_action(user):
-    print(f"מבצע פעולה על היוזר {user['user_id']} בשעה {user['time']}")
-    asyncio.run(get_emails(user['user_id'], user['chat_id']))
-    print("--------------------------------")
 
-def check_users():
-    now = datetime.now().strftime("%H:%M")
-    users = supabase.from_("user_chat_ids").select("*").execute()
-    for user in users.data:
-        user_time = user['time'][:5]
-        print("now: ", now)
-        print("user_time: ", user_time)
-        if now == user_time:
-            do_action(user)
+async def main():
+    # כל המשתמשים שהגיע זמנם רצים במקביל, עם הגבלה לכל ספק
+    runner = DigestRunner(get_emails)
+    # טוען את השעות פעם אחת וישן עד המשתמש הבא, במקום לקרוא את כל הטבלה כל 2 שניות
+    scheduler = DigestScheduler(runner.run)
+    await scheduler.run()
 
-schedule.every(2).seconds.do(check_users)
 
 try:
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    asyncio.run(main())
 except KeyboardInterrupt:
     print("התוכנית הופסקה ידנית")
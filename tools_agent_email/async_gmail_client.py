@@ -0,0 +1,275 @@
+import asyncio
+import json
+import os
+import uuid
+from email.feedparser import FeedParser
+from urllib.parse import quote, urlencode
+
+import httpx
+from dotenv import load_dotenv
+from google.auth.transport.requests import Request
+
+
+load_dotenv(override=True)
+
+
+class GmailApiError(Exception):
+    """
+    Error response from the Gmail API, with the HTTP status code.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"<HttpError {status}: {message}>")
+        self.status = status
+        self.message = message
+
+
+def _error_from(status: int, content: bytes) -> GmailApiError:
+    try:
+        message = json.loads(content)["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        message = content.decode("utf-8", errors="replace")[:200]
+    return GmailApiError(status, message)
+
+
+class AsyncGmailClient:
+    """
+    Non-blocking Gmail API client on httpx, for use from the event loop.
+
+    Covers the calls the agent tools need: messages list / get / send /
+    delete, batchDelete / batchModify and batched gets. All clients share one
+    httpx.AsyncClient, so keep-alive connections are pooled across users.
+
+    Credentials are google.oauth2 Credentials. An expired token is refreshed
+    with token_refresher.refresh_async (one refresh per user at a time) and
+    a request that gets 401 is retried once after a refresh.
+    """
+
+    ROOT_URL = os.getenv("GMAIL_API_ROOT_URL", "https://gmail.googleapis.com/")
+
+    BATCH_PATH = "batch/gmail/v1"
+
+    BATCH_SIZE = 50
+
+    MAX_CONNECTIONS = int(os.getenv("GMAIL_ASYNC_MAX_CONNECTIONS", "100"))
+
+    TIMEOUT_SECONDS = float(os.getenv("GMAIL_ASYNC_TIMEOUT", "60"))
+
+    _http: httpx.AsyncClient | None = None
+
+    def __init__(
+        self,
+        user_id: str,
+        creds,
+        token_refresher=None,
+        root_url: str | None = None,
+        http: httpx.AsyncClient | None = None,
+    ):
+        self.user_id = user_id
+        self.creds = creds
+        self.token_refresher = token_refresher
+        self.root_url = (root_url or self.ROOT_URL).rstrip("/") + "/"
+        self._own_http = http
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return self._own_http or self.shared_http()
+
+    @classmethod
+    def shared_http(cls) -> httpx.AsyncClient:
+        """
+        Return the httpx client shared by all AsyncGmailClient objects of the process.
+        """
+        if cls._http is None or cls._http.is_closed:
+            cls._http = httpx.AsyncClient(
+                timeout=cls.TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=cls.MAX_CONNECTIONS,
+                    max_keepalive_connections=cls.MAX_CONNECTIONS,
+                ),
+            )
+        return cls._http
+
+    @classmethod
+    async def aclose_shared(cls) -> None:
+        if cls._http is not None:
+            await cls._http.aclose()
+            cls._http = None
+
+    def _url(self, path: str) -> str:
+        return f"{self.root_url}gmail/v1/users/me/{path}"
+
+    async def _refresh(self) -> None:
+        if self.token_refresher is not None:
+            await self.token_refresher.refresh_async(self.user_id, self.creds)
+        else:
+            await asyncio.to_thread(self.creds.refresh, Request())
+
+    async def _authorization(self) -> dict:
+        expired = self.creds.expiry is None or self.creds.expired
+        if expired and self.creds.refresh_token:
+            await self._refresh()
+        return {"Authorization": f"Bearer {self.creds.token}"}
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        headers = {**kwargs.pop("headers", {}), **await self._authorization()}
+        response = await self.http.request(method, url, headers=headers, **kwargs)
+        if response.status_code == 401 and self.creds.refresh_token:
+            # הטוקן נדחה למרות שלא פג - מרעננים פעם אחת ומנסים שוב
+            await self._refresh()
+            headers.update(await self._authorization())
+            response = await self.http.request(method, url, headers=headers, **kwargs)
+        return response
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        response = await self._send(method, self._url(path), **kwargs)
+        if response.status_code >= 400:
+            raise _error_from(response.status_code, response.content)
+        return response.json() if response.content else {}
+
+    async def list_messages(
+        self,
+        q: str | None = None,
+        max_results: int | None = None,
+        page_token: str | None = None,
+    ) -> dict:
+        params = {}
+        if q:
+            params["q"] = q
+        if max_results:
+            params["maxResults"] = max_results
+        if page_token:
+            params["pageToken"] = page_token
+        return await self._request("GET", "messages", params=params)
+
+    @staticmethod
+    def _get_params(
+        format: str | None = None,
+        metadata_headers: list[str] | None = None,
+        fields: str | None = None,
+    ) -> list[tuple[str, str]]:
+        params = []
+        if format:
+            params.append(("format", format))
+        for header in metadata_headers or []:
+            params.append(("metadataHeaders", header))
+        if fields:
+            params.append(("fields", fields))
+        return params
+
+    async def get_message(
+        self,
+        msg_id: str,
+        format: str | None = None,
+        metadata_headers: list[str] | None = None,
+        fields: str | None = None,
+    ) -> dict:
+        return await self._request(
+            "GET",
+            f"messages/{quote(msg_id, safe='')}",
+            params=self._get_params(format, metadata_headers, fields),
+        )
+
+    async def batch_get_messages(
+        self,
+        msg_ids: list[str],
+        format: str | None = None,
+        metadata_headers: list[str] | None = None,
+        fields: str | None = None,
+    ) -> list:
+        """
+        Get many messages with Gmail batch requests of BATCH_SIZE, sent concurrently.
+
+        Returns one item per msg_id, in order: the message resource, or the
+        exception for a message that could not be retrieved.
+        """
+        query = urlencode(self._get_params(format, metadata_headers, fields))
+        chunks = [
+            msg_ids[start : start + self.BATCH_SIZE]
+            for start in range(0, len(msg_ids), self.BATCH_SIZE)
+        ]
+        results = await asyncio.gather(
+            *(self._batch_get(chunk, query) for chunk in chunks),
+            return_exceptions=True,
+        )
+
+        messages = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                messages.extend(result for _ in chunk)
+            else:
+                messages.extend(result)
+        return messages
+
+    async def _batch_get(self, msg_ids: list[str], query: str) -> list:
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for index, msg_id in enumerate(msg_ids):
+            path = f"/gmail/v1/users/me/messages/{quote(msg_id, safe='')}"
+            if query:
+                path += f"?{query}"
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                "Content-Transfer-Encoding: binary\r\n"
+                f"Content-ID: <{index}>\r\n\r\n"
+                f"GET {path} HTTP/1.1\r\n\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+
+        response = await self._send(
+            "POST",
+            f"{self.root_url}{self.BATCH_PATH}",
+            headers={"Content-Type": f"multipart/mixed; boundary={boundary}"},
+            content="".join(parts).encode("utf-8"),
+        )
+        if response.status_code >= 400:
+            raise _error_from(response.status_code, response.content)
+
+        return self._parse_batch_response(
+            response.headers["Content-Type"], response.content, len(msg_ids)
+        )
+
+    @staticmethod
+    def _parse_batch_response(content_type: str, content: bytes, count: int) -> list:
+        # כמו googleapiclient: מפענחים את כל התשובה כ-UTF-8 לפני הפירוק, אחרת
+        # BytesParser הופך תווים שאינם ASCII (עברית בנושא וב-snippet) ל-�
+        parser = FeedParser()
+        parser.feed(f"Content-Type: {content_type}\r\n\r\n" + content.decode("utf-8"))
+        envelope = parser.close()
+        results: list = [GmailApiError(500, "missing from batch response")] * count
+        for part in envelope.get_payload():
+            # Content-ID: <response-N>
+            index = int(part["Content-ID"].strip("<>").rsplit("-", 1)[-1])
+            http_response = part.get_payload().lstrip()
+            head, _, body = http_response.partition("\r\n\r\n")
+            if not body and "\n\n" in http_response:
+                head, _, body = http_response.partition("\n\n")
+            status = int(head.split(" ", 2)[1])
+            if status >= 400:
+                results[index] = _error_from(status, body.encode("utf-8"))
+            else:
+                results[index] = json.loads(body)
+        return results
+
+    async def send_message(self, raw: str) -> dict:
+        return await self._request("POST", "messages/send", json={"raw": raw})
+
+    async def delete_message(self, msg_id: str) -> None:
+        await self._request("DELETE", f"messages/{quote(msg_id, safe='')}")
+
+    async def batch_delete(self, msg_ids: list[str]) -> None:
+        await self._request("POST", "messages/batchDelete", json={"ids": msg_ids})
+
+    async def batch_modify(
+        self,
+        msg_ids: list[str],
+        add_label_ids: list[str] | None = None,
+        remove_label_ids: list[str] | None = None,
+    ) -> None:
+        body = {"ids": msg_ids}
+        if add_label_ids:
+            body["addLabelIds"] = add_label_ids
+        if remove_label_ids:
+            body["removeLabelIds"] = remove_label_ids
+        await self._request("POST", "messages/batchModify", json=body)
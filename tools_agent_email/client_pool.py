@@ -0,0 +1,147 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from dotenv import load_dotenv
+
+from tools_agent_email.google_apis import GoogleApis
+
+
+load_dotenv(override=True)
+
+
+class GmailClientPool:
+    """
+    Pool of authorized Gmail clients (GoogleApis objects), one per user.
+
+    Each client keeps its own httplib2 transport open between requests, so
+    the keep-alive connection to gmail.googleapis.com is reused instead of
+    running a new TLS handshake for every request. Clients unused for
+    IDLE_TTL_SECONDS, or pushed out by MAX_SIZE, are closed.
+
+    The same client is handed to concurrent requests, and an httplib2
+    transport is not thread-safe, so requests pass http=client.thread_http():
+    every thread has its own kept-alive connection to the user's client.
+    """
+
+    MAX_SIZE = int(os.getenv("GMAIL_CLIENT_POOL_SIZE", "200"))
+
+    IDLE_TTL_SECONDS = float(os.getenv("GMAIL_CLIENT_IDLE_TTL", "600"))
+
+    _shared: "GmailClientPool | None" = None
+
+    _shared_lock = Lock()
+
+    def __init__(self, max_size: int | None = None, idle_ttl: float | None = None):
+        self.max_size = max_size or self.MAX_SIZE
+        self.idle_ttl = idle_ttl if idle_ttl is not None else self.IDLE_TTL_SECONDS
+        self._clients: OrderedDict[str, dict] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def shared(cls) -> "GmailClientPool":
+        """
+        Return the pool shared by the whole process.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def acquire(self, user_id: str) -> GoogleApis:
+        """
+        Return the pooled client of user_id, building one on a miss.
+
+        A client whose user has no tokens (service is None) is returned but not pooled.
+        """
+        closed = []
+        with self._lock:
+            closed += self._expire_idle()
+            entry = self._clients.get(user_id)
+            if entry is not None:
+                entry["last_used"] = time.monotonic()
+                self._clients.move_to_end(user_id)
+
+        if entry is not None:
+            client = entry["client"]
+            # הטוקן אולי רוענן ברקע או הוחלף מאז השימוש הקודם
+            if client.sync_credentials():
+                with self._lock:
+                    self.hits += 1
+                self._close(closed)
+                return client
+            with self._lock:
+                if self._clients.get(user_id) is entry:
+                    del self._clients[user_id]
+            closed.append(client)
+
+        with self._lock:
+            self.misses += 1
+
+        client = GoogleApis(user_id)
+        if client.service is not None:
+            with self._lock:
+                previous = self._clients.pop(user_id, None)
+                if previous is not None:
+                    closed.append(previous["client"])
+                self._clients[user_id] = {
+                    "client": client,
+                    "last_used": time.monotonic(),
+                }
+                while len(self._clients) > self.max_size:
+                    _, evicted = self._clients.popitem(last=False)
+                    closed.append(evicted["client"])
+                    self.evictions += 1
+
+        self._close(closed)
+        return client
+
+    def _expire_idle(self) -> list:
+        # נקרא כשה-lock מוחזק; הסגירה עצמה נעשית מחוץ ל-lock
+        deadline = time.monotonic() - self.idle_ttl
+        expired = [
+            user_id
+            for user_id, entry in self._clients.items()
+            if entry["last_used"] <= deadline
+        ]
+        self.expirations += len(expired)
+        return [self._clients.pop(user_id)["client"] for user_id in expired]
+
+    @staticmethod
+    def _close(clients: list) -> None:
+        for client in clients:
+            client.close()
+
+    def discard(self, user_id: str) -> None:
+        """
+        Drop and close the client of user_id, e.g. after the user re-authorized.
+        """
+        with self._lock:
+            entry = self._clients.pop(user_id, None)
+        if entry is not None:
+            entry["client"].close()
+
+    def clear(self) -> None:
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+        self._close([entry["client"] for entry in entries])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "open_connections": sum(
+                    entry["client"].open_connections()
+                    for entry in self._clients.values()
+                ),
+            }
@@ -1,8 +1,22 @@
+import asyncio
+
 import os
 
+import re
+
 import base64
 
-from typing import Literal, Optional, List
+import threading
+
+import weakref
+
+from collections import OrderedDict
+
+from contextlib import asynccontextmanager
+
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Iterator, Literal, Optional, List
 
 from email.mime.text import MIMEText
 
@@ -11,17 +25,34 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 
+from tempfile import NamedTemporaryFile
+
 from pydantic import BaseModel, Field
 from agents import function_tool
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.http import MediaFileUpload, build_http
 
 from dotenv import load_dotenv
 
 from tools_agent_email.google_apis import GoogleApis
+from tools_agent_email.client_pool import GmailClientPool
+from tools_agent_email.message_cache import MessageCache
+from tools_agent_email.mailbox_mirror import MailboxMirror
+from tools_agent_email.search_index import SearchIndex
+from tools_agent_email.mime_utils import extract_body, has_attachments as has_attachment_parts
+from tools_agent_email.mime_writer import write_mime_message
 
 
 load_dotenv(override=True)
 
 
+# שאילתות שהמראה המקומית יודעת לענות עליהן: ריקה או from:<sender>
+SENDER_QUERY = re.compile(r'^\s*from:\s*"?([^"\s]+)"?\s*$', re.IGNORECASE)
+
+# next_page_token של תוצאות מהמראה: "mirror:<offset>"
+MIRROR_PAGE_PREFIX = "mirror:"
+
+
 class EmailMessage(BaseModel):
     msg_id: str = Field(..., description="The ID of the email message.")
 
@@ -31,7 +62,10 @@ class EmailMessage(BaseModel):
 
     recipients: str = Field(..., description="The recipients of the email message.")
 
-    body: str = Field(..., description="The body of the email message.")
+    body: str = Field(
+        "",
+        description="The body of the email message. Empty in metadata-only listings until get_email_message_body is called.",
+    )
 
     snippet: str = Field(..., description="A snippet of the email message.")
 
@@ -57,14 +91,128 @@ class EmailMessages(BaseModel):
 
 
 class GmailTools:
-    def __init__(self, user_id: str) -> None:
+    # Gmail accepts up to 100 calls per batch request, but recommends staying
+    # at 50 or below to avoid rate limiting of the individual calls.
+    BATCH_SIZE = 50
+
+    # Headers and response fields requested by metadata-only listings.
+    # Content-Type lets us guess attachments without downloading the parts.
+    METADATA_HEADERS = ["Subject", "From", "To", "Date", "Content-Type"]
+
+    METADATA_FIELDS = "id,snippet,labelIds,payload(mimeType,headers)"
+
+    BODY_FIELDS = "id,snippet,labelIds,payload"
+
+    # תקציב לפענוח גוף ההודעה: בתים מפוענחים מה-base64 ותווים בטקסט שמוחזר
+    MAX_BODY_BYTES = int(os.getenv("GMAIL_MAX_BODY_BYTES", "200000"))
+
+    MAX_BODY_CHARS = int(os.getenv("GMAIL_MAX_BODY_CHARS", "20000"))
+
+    # batchDelete / batchModify accept up to 1000 IDs per call
+    BULK_CHUNK_SIZE = 1000
+
+    # הודעות שהקבצים המצורפים שלהן גדולים מזה נשלחות ב-resumable upload מקובץ זמני
+    SIMPLE_SEND_MAX_BYTES = int(os.getenv("GMAIL_SIMPLE_SEND_MAX_BYTES", str(5 * 1024 * 1024)))
+
+    UPLOAD_CHUNK_BYTES = int(os.getenv("GMAIL_UPLOAD_CHUNK_BYTES", str(4 * 1024 * 1024)))
+
+    # כלים חוסמים רצים ב-thread pool משותף ולא על ה-event loop, כך שכמה
+    # קריאות כלים מאותו תור של המודל רצות במקביל
+    TOOL_THREADS = int(os.getenv("GMAIL_TOOL_THREADS", "16"))
+
+    # כמה קריאות כלים של אותו משתמש רצות בו-זמנית
+    USER_TOOL_CONCURRENCY = int(os.getenv("GMAIL_USER_TOOL_CONCURRENCY", "8"))
+
+    TOOL_THREAD_PREFIX = "gmail-tool"
+
+    _tool_executor: ThreadPoolExecutor | None = None
+
+    _tool_executor_lock = threading.Lock()
+
+    # לכל event loop סמפורים משלו: asyncio.Semaphore שייך ל-loop שבו נוצר
+    _user_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, OrderedDict[str, dict]]" = (
+        weakref.WeakKeyDictionary()
+    )
+
+    MAX_USER_SLOTS = 1000
+
+    BULK_ACTIONS = {
+        "archive": {"removeLabelIds": ["INBOX"]},
+        "mark_read": {"removeLabelIds": ["UNREAD"]},
+        "mark_unread": {"addLabelIds": ["UNREAD"]},
+        "star": {"addLabelIds": ["STARRED"]},
+        "unstar": {"removeLabelIds": ["STARRED"]},
+    }
+
+    def __init__(
+        self,
+        user_id: str,
+        service=None,
+        batch_requests: bool = True,
+        use_mirror: Optional[bool] = None,
+        use_search_index: Optional[bool] = None,
+        use_client_pool: Optional[bool] = None,
+        async_client=None,
+        use_async_tools: Optional[bool] = None,
+    ) -> None:
         self.user_id = user_id
 
         print("GmailTool user_id: ", self.user_id)
 
-        self.service_manager = GoogleApis(self.user_id)
+        self.batch_requests = batch_requests
+
+        # httplib2 אינו thread-safe: לכל thread חיבור משלו
+        self._local = threading.local()
 
-        self.service = self.service_manager.service
+        if service is not None:
+            # שירות מוכן מראש (למשל מול שרת Gmail מקומי בבנצ'מרק)
+            self.service_manager = None
+
+            self.service = service
+        else:
+            if use_client_pool is None:
+                use_client_pool = (
+                    os.getenv("GMAIL_CLIENT_POOL_ENABLED", "true").lower() == "true"
+                )
+
+            # לקוח מה-pool שומר על חיבור keep-alive פתוח בין בקשות של אותו משתמש
+            self.service_manager = (
+                GmailClientPool.shared().acquire(self.user_id)
+                if use_client_pool
+                else GoogleApis(self.user_id)
+            )
+
+            self.service = self.service_manager.service
+
+        # לקוח Gmail לא-חוסם לכלים האסינכרוניים
+        if async_client is None and self.service_manager is not None and self.service:
+            async_client = self.service_manager.async_client()
+
+        self.async_client = async_client
+
+        if use_async_tools is None:
+            use_async_tools = os.getenv("GMAIL_ASYNC_TOOLS", "true").lower() == "true"
+
+        self.use_async_tools = use_async_tools
+
+        # cache משותף לכל המופעים של אותו משתמש
+        self.message_cache = MessageCache.for_user(self.user_id)
+
+        if use_mirror is None:
+            use_mirror = os.getenv("GMAIL_MIRROR_ENABLED", "false").lower() == "true"
+
+        self.mirror = (
+            MailboxMirror(self.user_id, self.service, http=self._http)
+            if use_mirror and self.service
+            else None
+        )
+
+        if use_search_index is None:
+            use_search_index = (
+                os.getenv("GMAIL_SEARCH_INDEX_ENABLED", "false").lower() == "true"
+            )
+
+        self.search_index = SearchIndex(self.user_id) if use_search_index else None
 
     def send_email(
         self,
@@ -103,7 +251,50 @@ class GmailTools:
                 "status": "error",
             }
 
-        # Validate required parameters
+        error = self._validate_email(to, subject, body, body_type, attachment_paths)
+
+        if error is not None:
+            return error
+
+        attachments_size = sum(
+            os.path.getsize(attachment_path) for attachment_path in attachment_paths or []
+        )
+
+        if attachments_size > self.SIMPLE_SEND_MAX_BYTES:
+            return self._send_email_resumable(
+                to, subject, body, body_type.lower(), attachment_paths
+            )
+
+        try:
+            raw_message = self._build_raw_message(
+                to, subject, body, body_type.lower(), attachment_paths
+            )
+
+            response = (
+                self.service.users()
+                .messages()
+                .send(userId="me", body={"raw": raw_message})
+                .execute(http=self._http())
+            )
+
+            return {"msg_id": response["id"], "status": "success"}
+
+        except Exception as e:
+            return {"error": f"An error occurred: {str(e)}", "status": "failed"}
+
+    def _validate_email(
+        self,
+        to: Optional[str],
+        subject: Optional[str],
+        body: Optional[str],
+        body_type: str,
+        attachment_paths: Optional[List[str]],
+    ):
+        """
+
+        Check the send_email arguments. Returns the error to give back, or None.
+        """
+
         if not to:
             return {
                 "error": "Missing recipient email address. Please provide the recipient's email address (to).",
@@ -122,59 +313,113 @@ class GmailTools:
                 "status": "missing_parameters",
             }
 
-        try:
-            message = MIMEMultipart()
+        if body_type.lower() not in ["plain", "html"]:
+            return 'Error: body_type must be either "plain" or "html".'
 
-            message["to"] = to
+        for attachment_path in attachment_paths or []:
+            if not os.path.exists(attachment_path):
+                return f"File not found - {attachment_path}"
 
-            message["subject"] = subject
+        return None
 
-            if body_type.lower() not in ["plain", "html"]:
-                return 'Error: body_type must be either "plain" or "html".'
+    def _build_raw_message(
+        self,
+        to: str,
+        subject: str,
+        body: str,
+        body_type: str,
+        attachment_paths: Optional[List[str]],
+    ) -> str:
+        """
 
-            message.attach(MIMEText(body, body_type.lower()))
+        Build the base64url encoded MIME message for messages.send.
+        """
 
-            if attachment_paths:
-                for attachment_path in attachment_paths:
-                    if os.path.exists(attachment_path):
-                        filename = os.path.basename(attachment_path)
+        message = MIMEMultipart()
 
-                        with open(attachment_path, "rb") as attachment:
-                            part = MIMEBase("application", "octet-stream")
+        message["to"] = to
 
-                            part.set_payload(attachment.read())
+        message["subject"] = subject
 
-                        encoders.encode_base64(part)
+        message.attach(MIMEText(body, body_type.lower()))
 
-                        part.add_header(
-                            "Content-Disposition",
-                            f"attachment; filename= {filename}",
-                        )
+        if attachment_paths:
+            for attachment_path in attachment_paths:
+                filename = os.path.basename(attachment_path)
 
-                        message.attach(part)
-                    else:
-                        return f"File not found - {attachment_path}"
+                with open(attachment_path, "rb") as attachment:
+                    part = MIMEBase("application", "octet-stream")
 
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode("utf-8")
+                    part.set_payload(attachment.read())
 
-            response = (
+                encoders.encode_base64(part)
+
+                part.add_header(
+                    "Content-Disposition",
+                    f"attachment; filename= {filename}",
+                )
+
+                message.attach(part)
+
+        return base64.urlsafe_b64encode(message.as_bytes()).decode("utf-8")
+
+    def _send_email_resumable(
+        self,
+        to: str,
+        subject: str,
+        body: str,
+        body_type: str,
+        attachment_paths: List[str],
+    ) -> dict:
+        """
+
+        Send a large email through the Gmail media upload endpoint.
+
+        The MIME message is streamed to a temporary file and uploaded in
+        UPLOAD_CHUNK_BYTES chunks with a resumable upload, so attachments are
+        never held in memory as a whole.
+        """
+
+        temp_file = NamedTemporaryFile(mode="wb", suffix=".eml", delete=False)
+
+        try:
+            with temp_file:
+                write_mime_message(
+                    temp_file, to, subject, body, body_type, attachment_paths
+                )
+
+            media = MediaFileUpload(
+                temp_file.name,
+                mimetype="message/rfc822",
+                chunksize=self.UPLOAD_CHUNK_BYTES,
+                resumable=True,
+            )
+
+            request = (
                 self.service.users()
                 .messages()
-                .send(userId="me", body={"raw": raw_message})
-                .execute()
+                .send(userId="me", body={}, media_body=media)
             )
 
+            response = None
+            while response is None:
+                _, response = request.next_chunk(http=self._http(), num_retries=3)
+
             return {"msg_id": response["id"], "status": "success"}
 
         except Exception as e:
             return {"error": f"An error occurred: {str(e)}", "status": "failed"}
 
+        finally:
+            os.remove(temp_file.name)
+
     def search_emails(
         self,
         query: Optional[str] = None,
         label: Literal["ALL", "INBOX", "SENT", "DRAFT", "SPAM", "TRASH"] = "INBOX",
         max_results: Optional[int] = 10,
         next_page_token: Optional[str] = None,
+        metadata_only: bool = True,
     ):
         """
 
@@ -190,6 +435,9 @@ class GmailTools:
             Available labels include: 'INBOX', 'SENT', 'DRAFT', 'SPAM', 'TRASH',.
 
             max_results (int): Maximum number of messages to return. The maximum allowed is 500.
+
+            metadata_only (bool): Fetch only headers, snippet and labels. The body is left
+            empty and is loaded with get_email_message_body. Default is True.
         """
 
         if not self.service:
@@ -198,63 +446,30 @@ class GmailTools:
                 "status": "error",
             }
 
-        messages = []
-
-        next_page_token_ = next_page_token
-
-        if label == "ALL":
-            label_ = None
-        else:
-            label_ = [label]
-
-        while True:
-            # Build the API call parameters
-
-            api_params = {
-                "userId": "me",
-                "maxResults": min(500, max_results - len(messages))
-                if max_results
-                else 500,
-            }
-
-            # Build query string
-
-            query_parts = []
-
-            if query:
-                query_parts.append(query)
-
-            if label_ is not None and label != "ALL":
-                query_parts.append(f"label:{label.lower()}")
-
-            if query_parts:
-                api_params["q"] = " ".join(query_parts)
-
-            if next_page_token_:
-                api_params["pageToken"] = next_page_token_
-
-            result = self.service.users().messages().list(**api_params).execute()
-
-            messages.extend(result.get("messages", []))
+        if self.mirror is not None and self._is_mirror_page(next_page_token):
+            local_results = self._search_mirror(
+                query, label, max_results, next_page_token
+            )
 
-            next_page_token_ = result.get("nextPageToken")
+            if local_results is not None:
+                return local_results
 
-            if not next_page_token_ or (max_results and len(messages) >= max_results):
-                break
+        next_page_token, max_results, skip = self._resume_after_mirror(
+            next_page_token, max_results
+        )
 
-        # compile emails details
+        email_messages_ = []
 
-        email_messages = []
-        for message_ in messages:
-            msg_id = message_["id"]
+        next_page_token_ = next_page_token
 
-            msg_details = self.get_email_message_details(msg_id)
+        for page in self.iter_emails(
+            query, label, max_results, next_page_token, metadata_only
+        ):
+            email_messages_.extend(page.messages)
 
-            email_messages.append(msg_details)
+            next_page_token_ = page.next_page_token
 
-        email_messages_ = (
-            email_messages[:max_results] if max_results else email_messages
-        )
+        email_messages_ = email_messages_[skip:]
 
         return EmailMessages(
             count=len(email_messages_),
@@ -262,169 +477,251 @@ class GmailTools:
             next_page_token=next_page_token_,
         )
 
-    def get_email_message_details(self, msg_id: str) -> EmailMessage:
+    def iter_emails(
+        self,
+        query: Optional[str] = None,
+        label: Literal["ALL", "INBOX", "SENT", "DRAFT", "SPAM", "TRASH"] = "INBOX",
+        max_results: Optional[int] = 10,
+        next_page_token: Optional[str] = None,
+        metadata_only: bool = True,
+        page_size: Optional[int] = None,
+    ) -> Iterator[EmailMessages]:
         """
 
-        Get detailed information about an email message.
+        Search for emails page by page, yielding each page as soon as its messages are hydrated.
 
 
         Args:
 
-            msg_id (str): The ID of the email message.
+            query, label, max_results, next_page_token, metadata_only: Same as search_emails.
 
+            page_size (int): Messages requested per page. Default is as many as allowed (500).
+            Smaller pages return the first results sooner.
 
-        Returns:
 
-            EmailMessage: Detailed information about the email message.
+        Yields:
+
+            EmailMessages: One page of messages. next_page_token resumes the search after this page.
+
+            The consumer can stop iterating at any time; no further pages are requested.
         """
 
         if not self.service:
-            return {
-                "error": "Gmail service not initialized. tokens are not valid.",
-                "status": "error",
-            }
+            return
 
-        try:
-            message = (
-                self.service.users().messages().get(userId="me", id=msg_id).execute()
-            )
+        fetched = 0
 
-            headers = message["payload"].get("headers", [])
+        next_page_token_ = next_page_token
 
-            subject = next((h["value"] for h in headers if h["name"] == "Subject"), "")
+        search_query = self._search_query(query, label)
 
-            sender = next((h["value"] for h in headers if h["name"] == "From"), "")
+        while True:
+            # Build the API call parameters
 
-            to = next((h["value"] for h in headers if h["name"] == "To"), "")
+            page_limit = min(500, page_size) if page_size else 500
 
-            date = next((h["value"] for h in headers if h["name"] == "Date"), "")
+            api_params = {
+                "userId": "me",
+                "maxResults": min(page_limit, max_results - fetched)
+                if max_results
+                else page_limit,
+            }
 
-            body = self._get_message_body(message["payload"])
+            if search_query:
+                api_params["q"] = search_query
 
-            snippet = message.get("snippet", "")
+            if next_page_token_:
+                api_params["pageToken"] = next_page_token_
 
-            has_attachments = bool(
-                message["payload"].get("parts", [])
-                and any(
-                    part.get("filename")
-                    for part in message["payload"].get("parts", [])
-                    if part.get("filename")
-                )
+            result = (
+                self.service.users()
+                .messages()
+                .list(**api_params)
+                .execute(http=self._http())
             )
 
-            label_ids = message.get("labelIds", [])
+            msg_ids = [message_["id"] for message_ in result.get("messages", [])]
 
-            label = ", ".join(label_ids)
+            if max_results:
+                msg_ids = msg_ids[: max_results - fetched]
 
-            star = "STARRED" in label_ids
+            fetched += len(msg_ids)
 
-            return EmailMessage(
-                msg_id=msg_id,
-                subject=subject,
-                sender=sender,
-                recipients=to,
-                body=body,
-                snippet=snippet,
-                has_attachments=has_attachments,
-                date=date,
-                star=star,
-                label=label,
-            )
+            next_page_token_ = result.get("nextPageToken")
 
-        except Exception as e:
-            return EmailMessage(
-                msg_id=msg_id,
-                subject="",
-                sender="",
-                recipients="",
-                body=f"Error retrieving message: {str(e)}",
-                snippet="",
-                has_attachments=False,
-                date="",
-                star=False,
-                label="",
+            # compile emails details
+
+            if self.batch_requests:
+                email_messages_ = self.get_email_messages_details(
+                    msg_ids, metadata_only
+                )
+            else:
+                email_messages_ = [
+                    self.get_email_message_details(msg_id, metadata_only)
+                    for msg_id in msg_ids
+                ]
+
+            yield EmailMessages(
+                count=len(email_messages_),
+                messages=email_messages_,
+                next_page_token=next_page_token_,
             )
 
-    def _get_message_body(self, payload: dict) -> str:
+            if not next_page_token_ or (max_results and fetched >= max_results):
+                break
+
+    def _search_query(self, query: Optional[str], label: str) -> Optional[str]:
         """
 
-        Extract the body text from an email message payload.
+        Build the Gmail search string for a query and a label filter.
+        """
 
+        query_parts = []
 
-        Args:
+        if query:
+            query_parts.append(query)
 
-            payload (dict): The email message payload.
+        if label != "ALL":
+            query_parts.append(f"label:{label.lower()}")
 
+        return " ".join(query_parts) or None
 
-        Returns:
+    @staticmethod
+    def _is_mirror_page(next_page_token: Optional[str]) -> bool:
+        return not next_page_token or next_page_token.startswith(MIRROR_PAGE_PREFIX)
 
-            str: The email body text.
+    @staticmethod
+    def _mirror_offset(next_page_token: Optional[str]) -> int:
+        try:
+            return int(next_page_token[len(MIRROR_PAGE_PREFIX) :])
+        except (TypeError, ValueError):
+            return 0
+
+    def _resume_after_mirror(
+        self, next_page_token: Optional[str], max_results: Optional[int]
+    ) -> tuple[Optional[str], Optional[int], int]:
         """
 
-        if not self.service:
-            return "Gmail service not initialized. tokens are not valid."
+        Turn a mirror page token the mirror can no longer answer into an API search.
 
-        body = ""
 
-        if "parts" in payload:
-            for part in payload["parts"]:
-                if part["mimeType"] == "text/plain":
-                    data = part["body"].get("data")
-                    if data:
-                        body = base64.urlsafe_b64decode(data).decode("utf-8")
+        The API search starts from the first page and the messages the mirror
+        already returned are skipped. Returns (next_page_token, max_results,
+        how many messages to skip).
+        """
 
-                        break
-        else:
-            if payload["mimeType"] == "text/plain":
-                data = payload["body"].get("data")
-                if data:
-                    body = base64.urlsafe_b64decode(data).decode("utf-8")
+        if not next_page_token or not next_page_token.startswith(MIRROR_PAGE_PREFIX):
+            return next_page_token, max_results, 0
 
-        return body
+        skip = self._mirror_offset(next_page_token)
 
-    def get_email_message_body(self, msg_id: str) -> str:
-        """
+        return None, max_results + skip if max_results else max_results, skip
 
-        Get the body of an email message.
+    def _search_mirror(
+        self,
+        query: Optional[str],
+        label: str,
+        max_results: Optional[int],
+        next_page_token: Optional[str] = None,
+    ) -> Optional[EmailMessages]:
+        """
 
+        Answer label and sender searches from the local mailbox mirror.
 
-        Args:
 
-            msg_id (str): The ID of the email message.
+        The mirror has no spam or trash, and after a full scan that stopped at
+        FULL_SCAN_LIMIT it has only the newest messages. Every message missing
+        from it is older than the ones it has, so a full page is still right;
+        a short page from an incomplete mirror is not, and the Gmail API
+        answers instead.
 
 
         Returns:
 
-            str: The email body text.
+            EmailMessages, or None when the query needs the Gmail API.
         """
 
-        if not self.service:
-            return "Gmail service not initialized. tokens are not valid."
+        if label in ("SPAM", "TRASH"):
+            return None
 
-        try:
-            message = (
-                self.service.users().messages().get(userId="me", id=msg_id).execute()
-            )
+        sender = None
+
+        if query:
+            match = SENDER_QUERY.match(query)
+            if not match:
+                return None
+
+            sender = match.group(1)
 
-            return self._get_message_body(message["payload"])
+        try:
+            self.mirror.sync()
 
         except Exception as e:
-            return f"Error retrieving message body: {str(e)}"
+            print(f"Mailbox mirror sync failed for user {self.user_id}: {e}")
 
-    def delete_email_message(self, msg_id: str) -> dict:
+            return None
+
+        offset = self._mirror_offset(next_page_token)
+
+        # שורה אחת נוספת אומרת אם יש עמוד הבא
+        rows = self.mirror.search(
+            label=None if label == "ALL" else label,
+            sender=sender,
+            max_results=max_results + 1 if max_results else None,
+            offset=offset,
+        )
+
+        has_more = bool(max_results) and len(rows) > max_results
+
+        if not has_more and not self.mirror.is_complete():
+            return None
+
+        rows = rows[:max_results] if max_results else rows
+
+        email_messages = []
+        for row in rows:
+            label_ids = [label_id for label_id in row["label_ids"].split(",") if label_id]
+
+            email_messages.append(
+                EmailMessage(
+                    msg_id=row["msg_id"],
+                    subject=row["subject"],
+                    sender=row["sender"],
+                    recipients=row["recipients"],
+                    snippet=row["snippet"],
+                    has_attachments=bool(row["has_attachments"]),
+                    date=row["date"],
+                    star="STARRED" in label_ids,
+                    label=", ".join(label_ids),
+                )
+            )
+
+        return EmailMessages(
+            count=len(email_messages),
+            messages=email_messages,
+            next_page_token=(
+                f"{MIRROR_PAGE_PREFIX}{offset + len(rows)}" if has_more else None
+            ),
+        )
+
+    def get_email_message_details(
+        self, msg_id: str, metadata_only: bool = False
+    ) -> EmailMessage:
         """
 
-        Delete an email message.
+        Get detailed information about an email message.
 
 
         Args:
 
-            msg_id (str): The ID of the email message to delete.
+            msg_id (str): The ID of the email message.
+
+            metadata_only (bool): Fetch only headers, snippet and labels, without the body.
 
 
         Returns:
 
-            dict: Response indicating success or failure.
+            EmailMessage: Detailed information about the email message.
         """
 
         if not self.service:
@@ -433,74 +730,1192 @@ class GmailTools:
                 "status": "error",
             }
 
+        cached = self.message_cache.get(msg_id, full=not metadata_only)
+        if cached:
+            return cached["message"]
+
         try:
-            self.service.users().messages().delete(userId="me", id=msg_id).execute()
+            message = self._get_message_request(msg_id, metadata_only).execute(
+                http=self._http()
+            )
 
-            return {"msg_id": msg_id, "status": "success"}
+            return self._store_message(msg_id, message, metadata_only)
 
         except Exception as e:
-            return {"error": f"An error occurred: {str(e)}", "status": "failed"}
+            return self._email_message_error(msg_id, e)
 
-    def get_tools(self):
+    def get_email_messages_details(
+        self, msg_ids: List[str], metadata_only: bool = False
+    ) -> List[EmailMessage]:
         """
 
-        Get all available Gmail tools as a list.
+        Get detailed information about several email messages using Gmail batch requests.
+
+
+        Args:
+
+            msg_ids (list): The IDs of the email messages.
+
+            metadata_only (bool): Fetch only headers, snippet and labels, without the body.
 
 
         Returns:
 
-            list: List of function tools that can be used by an agent.
+            list: EmailMessage objects in the same order as msg_ids.
         """
 
         if not self.service:
-            # החזר רשימה ריקה במקום dict - Agent מצפה לרשימה
+            return [
+                self._email_message_error(
+                    msg_id, "Gmail service not initialized. tokens are not valid."
+                )
+                for msg_id in msg_ids
+            ]
 
-            print("⚠️ Gmail service not initialized. Returning empty tools list.")
+        email_messages = {}
 
-            return []
+        missing = []
 
-        # Create wrapper functions to avoid binding issues with @function_tool
+        for index, msg_id in enumerate(msg_ids):
+            cached = self.message_cache.get(msg_id, full=not metadata_only)
+            if cached:
+                email_messages[index] = cached["message"]
+            else:
+                missing.append(index)
 
-        @function_tool
-        def send_email(
-            to: Optional[str] = None,
-            subject: Optional[str] = None,
-            body: Optional[str] = None,
-            body_type: Literal["plain", "html"] = "plain",
-            attachment_paths: Optional[List[str]] = None,
-        ) -> dict:
-            """Send an email using the Gmail API. All parameters (to, subject, body) are required but should be collected from the user before calling this function."""
+        def collect(request_id, response, exception):
+            index = int(request_id)
 
-            return self.send_email(to, subject, body, body_type, attachment_paths)
+            msg_id = msg_ids[index]
 
-        @function_tool
-        def search_emails(
-            query: Optional[str] = None,
-            label: Literal["ALL", "INBOX", "SENT", "DRAFT", "SPAM", "TRASH"] = "INBOX",
-            max_results: Optional[int] = 10,
-            next_page_token: Optional[str] = None,
-        ):
-            """Search for emails in the user's mailbox using the Gmail API."""
+            if exception is None:
+                try:
+                    email_messages[index] = self._store_message(
+                        msg_id, response, metadata_only
+                    )
 
-            return self.search_emails(query, label, max_results, next_page_token)
+                    return
 
-        @function_tool
-        def get_email_message_details(msg_id: str) -> EmailMessage:
-            """Get detailed information about an email message."""
+                except Exception as e:
+                    exception = e
 
-            return self.get_email_message_details(msg_id)
+            email_messages[index] = self._email_message_error(msg_id, exception)
+
+        for start in range(0, len(missing), self.BATCH_SIZE):
+            chunk = missing[start : start + self.BATCH_SIZE]
+
+            batch = self.service.new_batch_http_request(callback=collect)
+
+            for index in chunk:
+                batch.add(
+                    self._get_message_request(msg_ids[index], metadata_only),
+                    request_id=str(index),
+                )
+
+            try:
+                batch.execute(http=self._http())
+
+            except Exception as e:
+                for index in chunk:
+                    email_messages.setdefault(
+                        index, self._email_message_error(msg_ids[index], e)
+                    )
+
+        return [email_messages[index] for index in range(len(msg_ids))]
+
+    def _get_message_request(self, msg_id: str, metadata_only: bool = False):
+        """
+
+        Build a messages.get request, either full or metadata-only with a fields mask.
+        """
+
+        if metadata_only:
+            return (
+                self.service.users()
+                .messages()
+                .get(
+                    userId="me",
+                    id=msg_id,
+                    format="metadata",
+                    metadataHeaders=self.METADATA_HEADERS,
+                    fields=self.METADATA_FIELDS,
+                )
+            )
+
+        return self.service.users().messages().get(userId="me", id=msg_id)
+
+    def _parse_email_message(
+        self, msg_id: str, message: dict, metadata_only: bool = False
+    ) -> EmailMessage:
+        """
+
+        Build an EmailMessage from a Gmail API message resource.
+
+
+        Args:
+
+            msg_id (str): The ID of the email message.
+
+            message (dict): The message resource returned by messages.get.
+
+            metadata_only (bool): The resource was fetched with format=metadata.
+
+
+        Returns:
+
+            EmailMessage: Detailed information about the email message.
+        """
+
+        headers = message["payload"].get("headers", [])
+
+        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "")
+
+        sender = next((h["value"] for h in headers if h["name"] == "From"), "")
+
+        to = next((h["value"] for h in headers if h["name"] == "To"), "")
+
+        date = next((h["value"] for h in headers if h["name"] == "Date"), "")
+
+        snippet = message.get("snippet", "")
+
+        if metadata_only:
+            body = ""
+
+            content_type = next(
+                (h["value"] for h in headers if h["name"] == "Content-Type"), ""
+            )
+
+            has_attachments = content_type.lower().startswith("multipart/mixed")
+        else:
+            body = self._get_message_body(message["payload"])
+
+            has_attachments = has_attachment_parts(message["payload"])
+
+        label_ids = message.get("labelIds", [])
+
+        label = ", ".join(label_ids)
+
+        star = "STARRED" in label_ids
+
+        return EmailMessage(
+            msg_id=msg_id,
+            subject=subject,
+            sender=sender,
+            recipients=to,
+            body=body,
+            snippet=snippet,
+            has_attachments=has_attachments,
+            date=date,
+            star=star,
+            label=label,
+        )
+
+    def _store_message(
+        self, msg_id: str, message: dict, metadata_only: bool = False
+    ) -> EmailMessage:
+        """
+
+        Parse a Gmail API message resource and keep it in the user's message cache.
+        """
+
+        email_message = self._parse_email_message(msg_id, message, metadata_only)
+
+        self.message_cache.put(
+            msg_id, email_message, message, full=not metadata_only
+        )
+
+        if self.search_index is not None:
+            try:
+                self.search_index.add(email_message)
+
+            except Exception as e:
+                print(f"Error indexing message {msg_id}: {e}")
+
+        return email_message
+
+    def search_local_emails(self, query: str, max_results: int = 10) -> EmailMessages:
+        """
+
+        Full-text search over the messages already fetched for this user, ranked by relevance.
+
+
+        Args:
+
+            query (str): Words to look for in the subject, sender, snippet and body.
+
+            max_results (int): Maximum number of messages to return.
+
+
+        Returns:
+
+            EmailMessages: The best matching messages, most relevant first. Bodies are not included.
+        """
+
+        if self.search_index is None:
+            return EmailMessages(count=0, messages=[], next_page_token=None)
+
+        rows = self.search_index.search(query, max_results)
+
+        email_messages = [
+            EmailMessage(
+                msg_id=row["msg_id"],
+                subject=row["subject"],
+                sender=row["sender"],
+                recipients=row["recipients"],
+                snippet=row["snippet"],
+                has_attachments=bool(row["has_attachments"]),
+                date=row["date"],
+                star=bool(row["star"]),
+                label=row["label"],
+            )
+            for row in rows
+        ]
+
+        return EmailMessages(
+            count=len(email_messages),
+            messages=email_messages,
+            next_page_token=None,
+        )
+
+    def _email_message_error(self, msg_id: str, error) -> EmailMessage:
+        """
+
+        Build the fallback EmailMessage returned when a message cannot be retrieved.
+        """
+
+        return EmailMessage(
+            msg_id=msg_id,
+            subject="",
+            sender="",
+            recipients="",
+            body=f"Error retrieving message: {str(error)}",
+            snippet="",
+            has_attachments=False,
+            date="",
+            star=False,
+            label="",
+        )
+
+    def _get_message_body(self, payload: dict) -> str:
+        """
+
+        Extract the body text from an email message payload.
+
+        Nested multipart parts are walked; text/plain is preferred and text/html is
+        converted to text. Attachments are skipped and decoding stops after
+        MAX_BODY_BYTES / MAX_BODY_CHARS.
+
+
+        Args:
+
+            payload (dict): The email message payload.
+
+
+        Returns:
+
+            str: The email body text.
+        """
+
+        if not self.service:
+            return "Gmail service not initialized. tokens are not valid."
+
+        return extract_body(payload, self.MAX_BODY_CHARS, self.MAX_BODY_BYTES)
+
+    def get_email_message_body(self, msg_id: str) -> str:
+        """
+
+        Get the body of an email message.
+
+
+        Args:
+
+            msg_id (str): The ID of the email message.
+
+
+        Returns:
+
+            str: The email body text.
+        """
+
+        if not self.service:
+            return "Gmail service not initialized. tokens are not valid."
+
+        cached = self.message_cache.get(msg_id, full=True)
+        if cached:
+            return cached["message"].body
+
+        try:
+            message = (
+                self.service.users()
+                .messages()
+                .get(userId="me", id=msg_id, fields=self.BODY_FIELDS)
+                .execute(http=self._http())
+            )
+
+            return self._store_message(msg_id, message).body
+
+        except Exception as e:
+            return f"Error retrieving message body: {str(e)}"
+
+    def delete_email_message(self, msg_id: str) -> dict:
+        """
+
+        Delete an email message.
+
+
+        Args:
+
+            msg_id (str): The ID of the email message to delete.
+
+
+        Returns:
+
+            dict: Response indicating success or failure.
+        """
+
+        if not self.service:
+            return {
+                "error": "Gmail service not initialized. tokens are not valid.",
+                "status": "error",
+            }
+
+        try:
+            self.service.users().messages().delete(userId="me", id=msg_id).execute(
+                http=self._http()
+            )
+
+            self.message_cache.invalidate(msg_id)
+
+            if self.search_index is not None:
+                self.search_index.remove(msg_id)
+
+            return {"msg_id": msg_id, "status": "success"}
+
+        except Exception as e:
+            return {"error": f"An error occurred: {str(e)}", "status": "failed"}
+
+    def batch_delete_email_messages(self, msg_ids: List[str]) -> dict:
+        """
+
+        Permanently delete many email messages with users.messages.batchDelete.
+
+
+        Args:
+
+            msg_ids (list): The IDs of the email messages to delete. Sets larger than
+            1000 IDs are split into several calls.
+
+
+        Returns:
+
+            dict: Overall status and a per-chunk result summary.
+        """
+
+        if not self.service:
+            return {
+                "error": "Gmail service not initialized. tokens are not valid.",
+                "status": "error",
+            }
+
+        def delete_chunk(chunk):
+            self.service.users().messages().batchDelete(
+                userId="me", body={"ids": chunk}
+            ).execute(http=self._http())
+
+            if self.search_index is not None:
+                self.search_index.remove(*chunk)
+
+        return self._run_in_chunks(msg_ids, delete_chunk)
+
+    def batch_modify_email_messages(
+        self,
+        msg_ids: List[str],
+        action: Literal["archive", "mark_read", "mark_unread", "star", "unstar"],
+    ) -> dict:
+        """
+
+        Archive, mark as read/unread or star/unstar many email messages with users.messages.batchModify.
+
+
+        Args:
+
+            msg_ids (list): The IDs of the email messages. Sets larger than 1000 IDs are
+            split into several calls.
+
+            action (str): One of 'archive', 'mark_read', 'mark_unread', 'star', 'unstar'.
+
+
+        Returns:
+
+            dict: Overall status and a per-chunk result summary.
+        """
+
+        if not self.service:
+            return {
+                "error": "Gmail service not initialized. tokens are not valid.",
+                "status": "error",
+            }
+
+        if action not in self.BULK_ACTIONS:
+            return {
+                "error": f"Unknown action '{action}'. Use one of: {', '.join(self.BULK_ACTIONS)}.",
+                "status": "failed",
+            }
+
+        def modify_chunk(chunk):
+            self.service.users().messages().batchModify(
+                userId="me", body={"ids": chunk, **self.BULK_ACTIONS[action]}
+            ).execute(http=self._http())
+
+            self._index_label_change(chunk, action)
+
+        return self._run_in_chunks(msg_ids, modify_chunk)
+
+    def _index_label_change(self, msg_ids: List[str], action: str) -> None:
+        """
+
+        Apply a successful bulk action's label change to the local search index.
+        """
+
+        if self.search_index is not None:
+            labels = self.BULK_ACTIONS[action]
+
+            self.search_index.change_labels(
+                msg_ids, labels.get("addLabelIds", ()), labels.get("removeLabelIds", ())
+            )
+
+    def _run_in_chunks(self, msg_ids: List[str], run_chunk) -> dict:
+        """
+
+        Run a bulk operation over msg_ids in chunks of BULK_CHUNK_SIZE and summarize the results.
+        """
+
+        msg_ids = list(dict.fromkeys(msg_ids or []))
+
+        if not msg_ids:
+            return {
+                "error": "No message IDs were provided.",
+                "status": "missing_parameters",
+            }
+
+        chunks = []
+
+        succeeded = 0
+
+        for start in range(0, len(msg_ids), self.BULK_CHUNK_SIZE):
+            chunk = msg_ids[start : start + self.BULK_CHUNK_SIZE]
+
+            try:
+                run_chunk(chunk)
+
+                # התוויות או ההודעות השתנו - ה-cache כבר לא נכון
+                self.message_cache.invalidate(*chunk)
+
+                succeeded += len(chunk)
+
+                chunks.append({"count": len(chunk), "status": "success"})
+
+            except Exception as e:
+                chunks.append(
+                    {
+                        "count": len(chunk),
+                        "status": "failed",
+                        "error": f"An error occurred: {str(e)}",
+                    }
+                )
+
+        return self._chunks_summary(msg_ids, chunks, succeeded)
+
+    def _chunks_summary(self, msg_ids: List[str], chunks: List[dict], succeeded: int) -> dict:
+        if succeeded == len(msg_ids):
+            status = "success"
+        elif succeeded:
+            status = "partial"
+        else:
+            status = "failed"
+
+        return {
+            "status": status,
+            "total": len(msg_ids),
+            "succeeded": succeeded,
+            "failed": len(msg_ids) - succeeded,
+            "chunks": chunks,
+        }
+
+    # Async variants, on the non-blocking AsyncGmailClient. They return the same
+    # results as the methods above, without blocking the event loop.
+
+    def _message_params(self, metadata_only: bool) -> dict:
+        if metadata_only:
+            return {
+                "format": "metadata",
+                "metadata_headers": self.METADATA_HEADERS,
+                "fields": self.METADATA_FIELDS,
+            }
+
+        return {}
+
+    async def send_email_async(
+        self,
+        to: Optional[str] = None,
+        subject: Optional[str] = None,
+        body: Optional[str] = None,
+        body_type: Literal["plain", "html"] = "plain",
+        attachment_paths: Optional[List[str]] = None,
+    ) -> dict:
+        """
+
+        Async variant of send_email. Large messages still go through the
+        resumable upload, in a worker thread.
+        """
+
+        if not self.service:
+            return {
+                "error": "Gmail service not initialized. tokens are not valid.",
+                "status": "error",
+            }
+
+        error = self._validate_email(to, subject, body, body_type, attachment_paths)
+
+        if error is not None:
+            return error
+
+        attachments_size = sum(
+            os.path.getsize(attachment_path) for attachment_path in attachment_paths or []
+        )
+
+        if attachments_size > self.SIMPLE_SEND_MAX_BYTES:
+            return await asyncio.to_thread(
+                self._send_email_resumable,
+                to,
+                subject,
+                body,
+                body_type.lower(),
+                attachment_paths,
+            )
+
+        try:
+            # קריאת הקבצים המצורפים היא IO חוסם
+            raw_message = await asyncio.to_thread(
+                self._build_raw_message,
+                to,
+                subject,
+                body,
+                body_type.lower(),
+                attachment_paths,
+            )
+
+            response = await self.async_client.send_message(raw_message)
+
+            return {"msg_id": response["id"], "status": "success"}
+
+        except Exception as e:
+            return {"error": f"An error occurred: {str(e)}", "status": "failed"}
+
+    async def search_emails_async(
+        self,
+        query: Optional[str] = None,
+        label: Literal["ALL", "INBOX", "SENT", "DRAFT", "SPAM", "TRASH"] = "INBOX",
+        max_results: Optional[int] = 10,
+        next_page_token: Optional[str] = None,
+        metadata_only: bool = True,
+    ):
+        """
+
+        Async variant of search_emails.
+        """
+
+        if not self.service:
+            return {
+                "error": "Gmail service not initialized. tokens are not valid.",
+                "status": "error",
+            }
+
+        if self.mirror is not None and self._is_mirror_page(next_page_token):
+            local_results = await asyncio.to_thread(
+                self._search_mirror, query, label, max_results, next_page_token
+            )
+
+            if local_results is not None:
+                return local_results
+
+        next_page_token, max_results, skip = self._resume_after_mirror(
+            next_page_token, max_results
+        )
+
+        search_query = self._search_query(query, label)
+
+        email_messages_ = []
+
+        fetched = 0
+
+        next_page_token_ = next_page_token
+
+        while True:
+            result = await self.async_client.list_messages(
+                search_query,
+                min(500, max_results - fetched) if max_results else 500,
+                next_page_token_,
+            )
+
+            msg_ids = [message_["id"] for message_ in result.get("messages", [])]
+
+            if max_results:
+                msg_ids = msg_ids[: max_results - fetched]
+
+            fetched += len(msg_ids)
+
+            next_page_token_ = result.get("nextPageToken")
+
+            email_messages_.extend(
+                await self.get_email_messages_details_async(msg_ids, metadata_only)
+            )
+
+            if not next_page_token_ or (max_results and fetched >= max_results):
+                break
+
+        email_messages_ = email_messages_[skip:]
+
+        return EmailMessages(
+            count=len(email_messages_),
+            messages=email_messages_,
+            next_page_token=next_page_token_,
+        )
+
+    async def get_email_message_details_async(
+        self, msg_id: str, metadata_only: bool = False
+    ) -> EmailMessage:
+        """
+
+        Async variant of get_email_message_details.
+        """
+
+        if not self.service:
+            return {
+                "error": "Gmail service not initialized. tokens are not valid.",
+                "status": "error",
+            }
+
+        cached = self.message_cache.get(msg_id, full=not metadata_only)
+        if cached:
+            return cached["message"]
+
+        try:
+            message = await self.async_client.get_message(
+                msg_id, **self._message_params(metadata_only)
+            )
+
+            return self._store_message(msg_id, message, metadata_only)
+
+        except Exception as e:
+            return self._email_message_error(msg_id, e)
+
+    async def get_email_messages_details_async(
+        self, msg_ids: List[str], metadata_only: bool = False
+    ) -> List[EmailMessage]:
+        """
+
+        Async variant of get_email_messages_details. The batch requests are sent concurrently.
+        """
+
+        if not self.service:
+            return [
+                self._email_message_error(
+                    msg_id, "Gmail service not initialized. tokens are not valid."
+                )
+                for msg_id in msg_ids
+            ]
+
+        email_messages = {}
+
+        missing = []
+
+        for index, msg_id in enumerate(msg_ids):
+            cached = self.message_cache.get(msg_id, full=not metadata_only)
+            if cached:
+                email_messages[index] = cached["message"]
+            else:
+                missing.append(index)
+
+        if missing:
+            responses = await self.async_client.batch_get_messages(
+                [msg_ids[index] for index in missing],
+                **self._message_params(metadata_only),
+            )
+
+            for index, response in zip(missing, responses):
+                msg_id = msg_ids[index]
+
+                if isinstance(response, Exception):
+                    email_messages[index] = self._email_message_error(msg_id, response)
+
+                    continue
+
+                try:
+                    email_messages[index] = self._store_message(
+                        msg_id, response, metadata_only
+                    )
+
+                except Exception as e:
+                    email_messages[index] = self._email_message_error(msg_id, e)
+
+        return [email_messages[index] for index in range(len(msg_ids))]
+
+    async def get_email_message_body_async(self, msg_id: str) -> str:
+        """
+
+        Async variant of get_email_message_body.
+        """
+
+        if not self.service:
+            return "Gmail service not initialized. tokens are not valid."
+
+        cached = self.message_cache.get(msg_id, full=True)
+        if cached:
+            return cached["message"].body
+
+        try:
+            message = await self.async_client.get_message(
+                msg_id, fields=self.BODY_FIELDS
+            )
+
+            return self._store_message(msg_id, message).body
+
+        except Exception as e:
+            return f"Error retrieving message body: {str(e)}"
+
+    async def delete_email_message_async(self, msg_id: str) -> dict:
+        """
+
+        Async variant of delete_email_message.
+        """
+
+        if not self.service:
+            return {
+                "error": "Gmail service not initialized. tokens are not valid.",
+                "status": "error",
+            }
+
+        try:
+            await self.async_client.delete_message(msg_id)
+
+            self.message_cache.invalidate(msg_id)
+
+            if self.search_index is not None:
+                self.search_index.remove(msg_id)
+
+            return {"msg_id": msg_id, "status": "success"}
+
+        except Exception as e:
+            return {"error": f"An error occurred: {str(e)}", "status": "failed"}
+
+    async def batch_delete_email_messages_async(self, msg_ids: List[str]) -> dict:
+        """
+
+        Async variant of batch_delete_email_messages.
+        """
+
+        if not self.service:
+            return {
+                "error": "Gmail service not initialized. tokens are not valid.",
+                "status": "error",
+            }
+
+        async def delete_chunk(chunk):
+            await self.async_client.batch_delete(chunk)
+
+            if self.search_index is not None:
+                self.search_index.remove(*chunk)
+
+        return await self._run_in_chunks_async(msg_ids, delete_chunk)
+
+    async def batch_modify_email_messages_async(
+        self,
+        msg_ids: List[str],
+        action: Literal["archive", "mark_read", "mark_unread", "star", "unstar"],
+    ) -> dict:
+        """
+
+        Async variant of batch_modify_email_messages.
+        """
+
+        if not self.service:
+            return {
+                "error": "Gmail service not initialized. tokens are not valid.",
+                "status": "error",
+            }
+
+        if action not in self.BULK_ACTIONS:
+            return {
+                "error": f"Unknown action '{action}'. Use one of: {', '.join(self.BULK_ACTIONS)}.",
+                "status": "failed",
+            }
+
+        async def modify_chunk(chunk):
+            labels = self.BULK_ACTIONS[action]
+
+            await self.async_client.batch_modify(
+                chunk, labels.get("addLabelIds"), labels.get("removeLabelIds")
+            )
+
+            self._index_label_change(chunk, action)
+
+        return await self._run_in_chunks_async(msg_ids, modify_chunk)
+
+    async def _run_in_chunks_async(self, msg_ids: List[str], run_chunk) -> dict:
+        """
+
+        Async variant of _run_in_chunks.
+        """
+
+        msg_ids = list(dict.fromkeys(msg_ids or []))
+
+        if not msg_ids:
+            return {
+                "error": "No message IDs were provided.",
+                "status": "missing_parameters",
+            }
+
+        chunks = []
+
+        succeeded = 0
+
+        for start in range(0, len(msg_ids), self.BULK_CHUNK_SIZE):
+            chunk = msg_ids[start : start + self.BULK_CHUNK_SIZE]
+
+            try:
+                await run_chunk(chunk)
+
+                self.message_cache.invalidate(*chunk)
+
+                succeeded += len(chunk)
+
+                chunks.append({"count": len(chunk), "status": "success"})
+
+            except Exception as e:
+                chunks.append(
+                    {
+                        "count": len(chunk),
+                        "status": "failed",
+                        "error": f"An error occurred: {str(e)}",
+                    }
+                )
+
+        return self._chunks_summary(msg_ids, chunks, succeeded)
+
+    def _http(self):
+        """
+
+        The transport for a Gmail request from the current thread.
+
+        googleapiclient requests share the service's httplib2 connection,
+        which is not thread-safe, and a pooled client is used by concurrent
+        requests (tool threads, asyncio.to_thread, the mirror sync). Every
+        thread gets its own authorized connection, kept alive for the
+        thread's next calls: the pooled client's when there is one.
+        """
+
+        if self.service_manager is not None:
+            return self.service_manager.thread_http()
+
+        http = getattr(self._local, "http", None)
+
+        if http is None:
+            base = self.service._http
+
+            http = (
+                AuthorizedHttp(base.credentials, http=build_http())
+                if isinstance(base, AuthorizedHttp)
+                else build_http()
+            )
+
+            self._local.http = http
+
+        return http
+
+    @classmethod
+    def tool_executor(cls) -> ThreadPoolExecutor:
+        """
+
+        Return the thread pool shared by the blocking tools of all users.
+        """
+
+        with cls._tool_executor_lock:
+            if cls._tool_executor is None:
+                cls._tool_executor = ThreadPoolExecutor(
+                    max_workers=cls.TOOL_THREADS,
+                    thread_name_prefix=cls.TOOL_THREAD_PREFIX,
+                )
+
+            return cls._tool_executor
+
+    @classmethod
+    def shutdown_tool_executor(cls) -> None:
+        with cls._tool_executor_lock:
+            if cls._tool_executor is not None:
+                cls._tool_executor.shutdown(wait=True)
+
+                cls._tool_executor = None
+
+    @asynccontextmanager
+    async def _user_slot(self):
+        """
+
+        Hold one of the user's USER_TOOL_CONCURRENCY slots on the running loop.
+
+        in_use counts the calls holding or waiting for the semaphore; only
+        users with no such call are evicted, so a user never gets a second
+        semaphore while the first one is still in use.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        with self._tool_executor_lock:
+            slots = GmailTools._user_slots.setdefault(loop, OrderedDict())
+
+            slot = slots.get(self.user_id)
+
+            if slot is None:
+                slot = {
+                    "semaphore": asyncio.Semaphore(self.USER_TOOL_CONCURRENCY),
+                    "in_use": 0,
+                }
+
+                slots[self.user_id] = slot
+
+                # מפנים משתמשים ישנים שאין להם קריאה פעילה או ממתינה
+                for user_id in list(slots):
+                    if len(slots) <= self.MAX_USER_SLOTS:
+                        break
+
+                    if slots[user_id]["in_use"] == 0 and user_id != self.user_id:
+                        del slots[user_id]
+            else:
+                slots.move_to_end(self.user_id)
+
+            slot["in_use"] += 1
+
+        try:
+            async with slot["semaphore"]:
+                yield
+        finally:
+            with self._tool_executor_lock:
+                slot["in_use"] -= 1
+
+    async def _run_tool(self, func, *args):
+        """
+
+        Run one tool call within the user's concurrency limit.
+
+        Coroutine functions are awaited on the event loop; blocking
+        functions run in the shared tool thread pool. Calls the model makes
+        in the same turn run side by side, up to USER_TOOL_CONCURRENCY.
+        """
+
+        async with self._user_slot():
+            if asyncio.iscoroutinefunction(func):
+                return await func(*args)
+
+            loop = asyncio.get_running_loop()
+
+            return await loop.run_in_executor(self.tool_executor(), func, *args)
+
+    def cache_stats(self) -> dict:
+        """
+
+        Hit, miss and eviction counters of the user's message cache.
+        """
+
+        return self.message_cache.stats()
+
+    def get_tools(self):
+        """
+
+        Get all available Gmail tools as a list.
+
+
+        Returns:
+
+            list: List of function tools that can be used by an agent.
+        """
+
+        if not self.service:
+            # החזר רשימה ריקה במקום dict - Agent מצפה לרשימה
+
+            print("⚠️ Gmail service not initialized. Returning empty tools list.")
+
+            return []
+
+        if self.async_client is not None and self.use_async_tools:
+            tools = self._get_async_tools()
+        else:
+            tools = self._get_sync_tools()
+
+        if self.search_index is not None:
+
+            @function_tool
+            async def search_local_emails(
+                query: str, max_results: int = 10
+            ) -> EmailMessages:
+                """Fast full-text search (Hebrew and English) over emails already fetched from this mailbox, ranked by relevance. Searches subject, sender, snippet and body. If nothing relevant is found, use search_emails."""
+
+                return await self._run_tool(self.search_local_emails, query, max_results)
+
+            tools.append(search_local_emails)
+
+        return tools
+
+    def _get_sync_tools(self) -> list:
+        """
+
+        Tools that call the blocking googleapiclient service, in the shared
+        tool thread pool so the event loop is free while they wait.
+        """
+
+        # Create wrapper functions to avoid binding issues with @function_tool
+
+        @function_tool
+        async def send_email(
+            to: Optional[str] = None,
+            subject: Optional[str] = None,
+            body: Optional[str] = None,
+            body_type: Literal["plain", "html"] = "plain",
+            attachment_paths: Optional[List[str]] = None,
+        ) -> dict:
+            """Send an email using the Gmail API. All parameters (to, subject, body) are required but should be collected from the user before calling this function."""
+
+            return await self._run_tool(
+                self.send_email, to, subject, body, body_type, attachment_paths
+            )
+
+        @function_tool
+        async def search_emails(
+            query: Optional[str] = None,
+            label: Literal["ALL", "INBOX", "SENT", "DRAFT", "SPAM", "TRASH"] = "INBOX",
+            max_results: Optional[int] = 10,
+            next_page_token: Optional[str] = None,
+        ):
+            """Search for emails in the user's mailbox using the Gmail API. Returns subject, sender, snippet, date and labels only; call get_email_message_body(msg_id) to read a message body."""
+
+            return await self._run_tool(
+                self.search_emails, query, label, max_results, next_page_token
+            )
+
+        @function_tool
+        async def get_email_message_details(msg_id: str) -> EmailMessage:
+            """Get detailed information about an email message, including its body."""
+
+            return await self._run_tool(self.get_email_message_details, msg_id)
+
+        @function_tool
+        async def get_email_message_body(msg_id: str) -> str:
+            """Get the body of an email message."""
+
+            return await self._run_tool(self.get_email_message_body, msg_id)
+
+        @function_tool
+        async def delete_email_message(msg_id: str) -> dict:
+            """Delete an email message."""
+
+            return await self._run_tool(self.delete_email_message, msg_id)
+
+        @function_tool
+        async def batch_delete_email_messages(msg_ids: List[str]) -> dict:
+            """Permanently delete many email messages in one call. Use this instead of calling delete_email_message in a loop."""
+
+            return await self._run_tool(self.batch_delete_email_messages, msg_ids)
+
+        @function_tool
+        async def batch_modify_email_messages(
+            msg_ids: List[str],
+            action: Literal["archive", "mark_read", "mark_unread", "star", "unstar"],
+        ) -> dict:
+            """Archive, mark as read/unread or star/unstar many email messages in one call."""
+
+            return await self._run_tool(
+                self.batch_modify_email_messages, msg_ids, action
+            )
+
+        return [
+            send_email,
+            search_emails,
+            get_email_message_details,
+            get_email_message_body,
+            delete_email_message,
+            batch_delete_email_messages,
+            batch_modify_email_messages,
+        ]
+
+    def _get_async_tools(self) -> list:
+        """
+
+        The same tools on the non-blocking AsyncGmailClient, so a tool call
+        does not hold up other chats served by the event loop.
+        """
 
         @function_tool
-        def get_email_message_body(msg_id: str) -> str:
+        async def send_email(
+            to: Optional[str] = None,
+            subject: Optional[str] = None,
+            body: Optional[str] = None,
+            body_type: Literal["plain", "html"] = "plain",
+            attachment_paths: Optional[List[str]] = None,
+        ) -> dict:
+            """Send an email using the Gmail API. All parameters (to, subject, body) are required but should be collected from the user before calling this function."""
+
+            return await self._run_tool(
+                self.send_email_async, to, subject, body, body_type, attachment_paths
+            )
+
+        @function_tool
+        async def search_emails(
+            query: Optional[str] = None,
+            label: Literal["ALL", "INBOX", "SENT", "DRAFT", "SPAM", "TRASH"] = "INBOX",
+            max_results: Optional[int] = 10,
+            next_page_token: Optional[str] = None,
+        ):
+            """Search for emails in the user's mailbox using the Gmail API. Returns subject, sender, snippet, date and labels only; call get_email_message_body(msg_id) to read a message body."""
+
+            return await self._run_tool(
+                self.search_emails_async, query, label, max_results, next_page_token
+            )
+
+        @function_tool
+        async def get_email_message_details(msg_id: str) -> EmailMessage:
+            """Get detailed information about an email message, including its body."""
+
+            return await self._run_tool(self.get_email_message_details_async, msg_id)
+
+        @function_tool
+        async def get_email_message_body(msg_id: str) -> str:
             """Get the body of an email message."""
 
-            return self.get_email_message_body(msg_id)
+            return await self._run_tool(self.get_email_message_body_async, msg_id)
 
         @function_tool
-        def delete_email_message(msg_id: str) -> dict:
+        async def delete_email_message(msg_id: str) -> dict:
             """Delete an email message."""
 
-            return self.delete_email_message(msg_id)
+            return await self._run_tool(self.delete_email_message_async, msg_id)
+
+        @function_tool
+        async def batch_delete_email_messages(msg_ids: List[str]) -> dict:
+            """Permanently delete many email messages in one call. Use this instead of calling delete_email_message in a loop."""
+
+            return await self._run_tool(
+                self.batch_delete_email_messages_async, msg_ids
+            )
+
+        @function_tool
+        async def batch_modify_email_messages(
+            msg_ids: List[str],
+            action: Literal["archive", "mark_read", "mark_unread", "star", "unstar"],
+        ) -> dict:
+            """Archive, mark as read/unread or star/unstar many email messages in one call."""
+
+            return await self._run_tool(
+                self.batch_modify_email_messages_async, msg_ids, action
+            )
 
         return [
             send_email,
@@ -508,4 +1923,6 @@ class GmailTools:
             get_email_message_details,
             get_email_message_body,
             delete_email_message,
+            batch_delete_email_messages,
+            batch_modify_email_messages,
         ]
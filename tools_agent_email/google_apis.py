@@ -1,9 +1,18 @@
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import build_http
 from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from dotenv import load_dotenv
 from supabase_client import supabase
+from tools_agent_email.token_store import TokenStore
+from tools_agent_email.token_refresher import RefreshingCredentials, TokenRefresher
+from tools_agent_email.async_gmail_client import AsyncGmailClient
+from threading import Lock, local
+from datetime import datetime, timezone
+import json
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
@@ -14,32 +23,57 @@ class GoogleApis:
     API_VERSION = "v1"
     SCOPES = ["https://mail.google.com/"]
 
-    # Class variable לשמירת טוקנים של כל המשתמשים (cache)
-    _tokens_cache = {}
+    # ניתן להפנות ל-token endpoint מקומי לבדיקות
+    TOKEN_URI = os.getenv("GOOGLE_TOKEN_URI", "https://oauth2.googleapis.com/token")
+
+    # כתובת בסיס חלופית ל-Gmail API, למשל שרת Gmail מקומי בבנצ'מרקים
+    ROOT_URL = os.getenv("GMAIL_API_ROOT_URL")
+
+    DISCOVERY_URL = "https://gmail.googleapis.com/$discovery/rest?version=v1"
+
+    DISCOVERY_CACHE_FILE = os.getenv(
+        "GMAIL_DISCOVERY_CACHE_FILE",
+        os.path.join(tempfile.gettempdir(), "gmail_v1_discovery.json"),
+    )
+
+    # Class variable לשמירת טוקנים של כל המשתמשים (cache, LRU חסום)
+    _tokens_cache = TokenStore()
+
+    # False אחרי שכתיבה נכשלה כי ב-user_tokens אין עמודת expiry (המיגרציה לא הורצה)
+    _expiry_column = True
+
+    # מסמך ה-discovery ופרטי ה-client נטענים פעם אחת לכל תהליך
+    _discovery_doc = None
+
+    _client_info = None
+
+    _discovery_lock = Lock()
 
     def __init__(self, user_id: str, client_secret_file="client_secret.json"):
         self.client_secret_file = client_secret_file
         self.user_id = user_id
         self.access_token = None
         self.refresh_token = None
+        self.expiry = None
+        self.creds = None
+        self.http = None
+        # httplib2 אינו thread-safe: לכל thread חיבור משלו (ראו thread_http)
+        self._local = local()
+        self._thread_https = []
+        self._thread_https_lock = Lock()
+        self._async_client = None
         # self.creds_users = GoogleApis._tokens_cache  # שימוש ב-cache משותף
+        GoogleApis.token_refresher.mark_active(self.user_id)
         self._init_service()
 
     def init_tokens(self):
         print("init_tokens")
         print("user_id: ", self.user_id)
-        # print("self.creds_users: ", self.creds_users)
-        print("_tokens_cache: ", GoogleApis._tokens_cache)
-        if (
-            GoogleApis._tokens_cache
-            and f"user_id_{self.user_id}" in GoogleApis._tokens_cache
-        ):
-            self.access_token = GoogleApis._tokens_cache[f"user_id_{self.user_id}"][
-                "access_token"
-            ]
-            self.refresh_token = GoogleApis._tokens_cache[f"user_id_{self.user_id}"][
-                "refresh_token"
-            ]
+        cached = GoogleApis._tokens_cache.get(self.user_id)
+        if cached:
+            self.access_token = cached["access_token"]
+            self.refresh_token = cached["refresh_token"]
+            self.expiry = cached["expiry"]
             print("init_tokens from creds users")
             return True
         else:
@@ -53,10 +87,10 @@ class GoogleApis:
             if tokens.data and len(tokens.data) > 0:
                 self.access_token = tokens.data[0].get("access_token")
                 self.refresh_token = tokens.data[0].get("refresh_token")
-                GoogleApis._tokens_cache[f"user_id_{self.user_id}"] = {
-                    "access_token": self.access_token,
-                    "refresh_token": self.refresh_token,
-                }
+                self.expiry = self.parse_expiry(tokens.data[0].get("expiry"))
+                GoogleApis._tokens_cache.put(
+                    self.user_id, self.access_token, self.refresh_token, self.expiry
+                )
 
                 return True
             else:
@@ -64,6 +98,23 @@ class GoogleApis:
                 self.refresh_token = None
                 return False
 
+    @classmethod
+    def update_tokens(
+        cls,
+        user_id: str,
+        access_token: str,
+        refresh_token: str | None = None,
+        expiry=None,
+    ) -> None:
+        """
+        Replace the cached tokens of a user, e.g. after re-authorization in the OAuth callback.
+        """
+        cls._tokens_cache.put(user_id, access_token, refresh_token, expiry)
+
+    @classmethod
+    def invalidate_tokens(cls, user_id: str) -> None:
+        cls._tokens_cache.invalidate(user_id)
+
     def _init_service(self) -> None:
         """
         Initialize the Gmail API service using the class tokens.
@@ -73,22 +124,6 @@ class GoogleApis:
             self.service = None
             return
         print("init_service")
-        import json
-        client_secret_json = os.getenv("GOOGLE_CLIENT_SECRET_JSON")
-        client_info = json.loads(client_secret_json)
-
-        if not client_secret_json:
-            raise Exception("GOOGLE_CLIENT_SECRET_JSON not found in env")
-        if "installed" in client_info:
-            print("installed")
-            client_id = client_info["installed"]["client_id"]
-            client_secret = client_info["installed"]["client_secret"]
-        elif "web" in client_info:
-            print("web")
-            client_id = client_info["web"]["client_id"]
-            client_secret = client_info["web"]["client_secret"]
-        else:
-            raise Exception("client_secret.json must contain either 'web' or 'installed' configuration")
         # with open(self.client_secret_file, "r") as f:
         #     client_info = json.load(f)
         #     if "installed" in client_info:
@@ -106,27 +141,275 @@ class GoogleApis:
         #         }
 
         # Create credentials from tokens עם client_id ו-client_secret
-        creds = Credentials(
-            token=self.access_token,
-            refresh_token=self.refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=client_id,
-            client_secret=client_secret,
-            scopes=self.SCOPES,
+        creds = self.build_credentials(
+            self.access_token, self.refresh_token, self.expiry, self.user_id
         )
 
         self.refresh_tokens(creds)
-        service = build(
-            self.API_NAME, self.API_VERSION, credentials=creds, static_discovery=False
-        )
+        self.creds = creds
+        # ה-transport נשמר על האובייקט כדי שחיבור ה-keep-alive ימוחזר בין בקשות
+        self.http = AuthorizedHttp(creds, http=build_http())
+        self._local.http = self.http
+        self._thread_https.append(self.http)
+        # בונים מהמסמך המשותף - בלי להוריד ולפרסר את ה-discovery בכל בקשה
+        service = build_from_document(self.discovery_document(), http=self.http)
         print("service created")
         self.service = service
 
+    def sync_credentials(self) -> bool:
+        """
+        Bring a reused client up to date with the token store before a new request.
+
+        Picks up tokens refreshed in the background or replaced after
+        re-authorization, and refreshes an expired token. A stored token
+        that is not newer than the one in memory is ignored. Returns False
+        when the user's tokens are no longer cached or the refresh token
+        changed, so the client should be rebuilt.
+        """
+        if self.creds is None:
+            return False
+        GoogleApis.token_refresher.mark_active(self.user_id)
+        cached = GoogleApis._tokens_cache.get(self.user_id)
+        if not cached or cached["refresh_token"] != self.creds.refresh_token:
+            return False
+        if cached["access_token"] != self.creds.token and self._is_newer(
+            cached["expiry"], self.creds.expiry
+        ):
+            self.creds.token = cached["access_token"]
+            self.creds.expiry = cached["expiry"]
+            self.access_token = self.creds.token
+            self.expiry = self.creds.expiry
+        self.refresh_tokens(self.creds)
+        return True
+
+    def async_client(self) -> AsyncGmailClient:
+        """
+        Return a non-blocking client that shares this client's credentials.
+        """
+        if self._async_client is None:
+            self._async_client = AsyncGmailClient(
+                self.user_id,
+                self.creds,
+                GoogleApis.token_refresher,
+                root_url=GoogleApis.ROOT_URL,
+            )
+        return self._async_client
+
+    def thread_http(self) -> AuthorizedHttp:
+        """
+        The calling thread's own authorized transport for this client.
+
+        A pooled client serves concurrent requests, and an httplib2
+        transport is not thread-safe, so every request made outside the
+        thread that built the client must pass http=thread_http(). Each
+        thread keeps its connection alive for its next requests, and all of
+        them share the credentials (and so the token refresh).
+        """
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = AuthorizedHttp(self.creds, http=build_http())
+            self._local.http = http
+            with self._thread_https_lock:
+                self._thread_https.append(http)
+        return http
+
+    def open_connections(self) -> int:
+        with self._thread_https_lock:
+            return sum(len(http.http.connections) for http in self._thread_https)
+
+    def close(self) -> None:
+        with self._thread_https_lock:
+            https, self._thread_https = self._thread_https, []
+        for http in https:
+            http.http.close()
+
+    @staticmethod
+    def _is_newer(expiry, than) -> bool:
+        if than is None:
+            return True
+        return expiry is not None and expiry > than
+
+    @staticmethod
+    def parse_expiry(value) -> datetime | None:
+        """
+        Expiry from user_tokens as a naive UTC datetime, the way google-auth keeps it.
+        """
+        if not value:
+            return None
+        if isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                return None
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    @staticmethod
+    def format_expiry(expiry: datetime | None) -> str | None:
+        return expiry.replace(tzinfo=timezone.utc).isoformat() if expiry else None
+
+    @classmethod
+    def build_credentials(
+        cls, access_token, refresh_token, expiry=None, user_id=None
+    ) -> Credentials:
+        client_id, client_secret = cls.client_credentials()
+        # כל רענון (גם אחרי 401 בתוך AuthorizedHttp) עובר דרך token_refresher
+        return RefreshingCredentials(
+            token=access_token,
+            refresh_token=refresh_token,
+            token_uri=cls.TOKEN_URI,
+            client_id=client_id,
+            client_secret=client_secret,
+            scopes=cls.SCOPES,
+            expiry=expiry,
+            user_id=user_id,
+            refresher=cls.token_refresher if user_id else None,
+        )
+
+    @classmethod
+    def client_credentials(cls) -> tuple[str, str]:
+        """
+        Return (client_id, client_secret) from GOOGLE_CLIENT_SECRET_JSON, parsed once per process.
+        """
+        if cls._client_info is None:
+            client_secret_json = os.getenv("GOOGLE_CLIENT_SECRET_JSON")
+            if not client_secret_json:
+                raise Exception("GOOGLE_CLIENT_SECRET_JSON not found in env")
+            client_info = json.loads(client_secret_json)
+            if "installed" in client_info:
+                print("installed")
+                cls._client_info = client_info["installed"]
+            elif "web" in client_info:
+                print("web")
+                cls._client_info = client_info["web"]
+            else:
+                raise Exception("client_secret.json must contain either 'web' or 'installed' configuration")
+        return cls._client_info["client_id"], cls._client_info["client_secret"]
+
+    @classmethod
+    def discovery_document(cls) -> dict:
+        """
+        Return the parsed Gmail discovery document, loaded once per process.
+        """
+        if cls._discovery_doc is None:
+            with cls._discovery_lock:
+                if cls._discovery_doc is None:
+                    doc = cls._load_discovery_document()
+                    if cls.ROOT_URL:
+                        doc["rootUrl"] = cls.ROOT_URL
+                    cls._discovery_doc = doc
+        return cls._discovery_doc
+
+    @classmethod
+    def _load_discovery_document(cls) -> dict:
+        # 1. המסמך הסטטי שמגיע עם google-api-python-client
+        doc = get_static_doc(cls.API_NAME, cls.API_VERSION)
+        if doc:
+            print("discovery document loaded from static copy")
+            return json.loads(doc)
+
+        # 2. עותק שנשמר בדיסק בהרצה קודמת
+        if os.path.exists(cls.DISCOVERY_CACHE_FILE):
+            with open(cls.DISCOVERY_CACHE_FILE, "r", encoding="utf-8") as f:
+                print("discovery document loaded from disk cache")
+                return json.load(f)
+
+        # 3. הורדה פעם אחת ושמירה בדיסק
+        response, content = build_http().request(cls.DISCOVERY_URL)
+        if response.status != 200:
+            raise Exception(f"Failed to download discovery document: {response.status}")
+        doc = json.loads(content)
+        try:
+            with open(cls.DISCOVERY_CACHE_FILE, "w", encoding="utf-8") as f:
+                json.dump(doc, f)
+        except OSError as e:
+            print(f"Could not cache discovery document: {e}")
+        print("discovery document downloaded")
+        return doc
+
     def refresh_tokens(self, creds):
         print("refresh_tokens")
-        if creds and creds.expired and creds.refresh_token:
+        # טוקן בלי expiry ידוע (למשל שורה ישנה ב-user_tokens) מחדשים, כי אי אפשר לדעת אם פג
+        if creds and creds.refresh_token and (creds.expiry is None or creds.expired):
             print("refresh token")
-            creds.refresh(Request())
+            # בקשות מקבילות של אותו משתמש ממתינות לרענון אחד
+            GoogleApis.token_refresher.refresh(self.user_id, creds)
             self.access_token = creds.token
+            self.expiry = creds.expiry
         else:
             print("creds are not expired")
+
+    @classmethod
+    def _credentials_for(cls, user_id: str, entry: dict) -> Credentials:
+        return cls.build_credentials(
+            entry["access_token"], entry["refresh_token"], entry["expiry"], user_id
+        )
+
+    @classmethod
+    def _store_refreshed_tokens(cls, user_id: str, creds) -> None:
+        cls._tokens_cache.put(user_id, creds.token, creds.refresh_token, creds.expiry)
+        cls.save_tokens(user_id, creds.token, creds.refresh_token, creds.expiry)
+
+    @staticmethod
+    def save_tokens(
+        user_id: str,
+        access_token: str,
+        refresh_token: str | None,
+        expiry: datetime | None = None,
+    ):
+        """
+        Persist refreshed tokens back to user_tokens, so other processes and restarts reuse them.
+        """
+        values = {
+            "access_token": access_token,
+            "expiry": GoogleApis.format_expiry(expiry),
+        }
+        if refresh_token:
+            values["refresh_token"] = refresh_token
+        try:
+            GoogleApis.write_user_tokens(
+                lambda row: supabase.table("user_tokens")
+                .update(row)
+                .eq("id", user_id)
+                .execute(),
+                values,
+            )
+        except Exception as e:
+            print(f"Error saving refreshed tokens for user {user_id}: {e}")
+
+    @classmethod
+    def write_user_tokens(cls, write, values: dict):
+        """
+        Run write(values) against user_tokens, leaving out expiry when the table has no such column.
+
+        The expiry column is added by supabase/migrations/20261018000000_user_tokens_expiry.sql.
+        Until it is applied, tokens are saved without it and are refreshed on first use.
+        """
+        if not cls._expiry_column:
+            return write(cls._without_expiry(values))
+        try:
+            return write(values)
+        except Exception as e:
+            if "expiry" not in values or not cls._is_missing_expiry_column(e):
+                raise
+            print("⚠️ user_tokens has no expiry column, saving tokens without it")
+            cls._expiry_column = False
+            return write(cls._without_expiry(values))
+
+    @staticmethod
+    def _without_expiry(values: dict) -> dict:
+        return {key: value for key, value in values.items() if key != "expiry"}
+
+    @staticmethod
+    def _is_missing_expiry_column(error: Exception) -> bool:
+        # PGRST204: עמודה שלא קיימת ב-schema cache של PostgREST; 42703: undefined_column
+        code = getattr(error, "code", None)
+        return code in ("PGRST204", "42703") and "expiry" in str(error)
+
+
+GoogleApis.token_refresher = TokenRefresher(
+    GoogleApis._tokens_cache,
+    GoogleApis._credentials_for,
+    GoogleApis._store_refreshed_tokens,
+)
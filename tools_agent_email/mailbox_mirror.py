@@ -0,0 +1,366 @@
+import os
+import sqlite3
+import time
+from threading import Lock
+
+from dotenv import load_dotenv
+from googleapiclient.errors import HttpError
+
+
+load_dotenv(override=True)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    msg_id TEXT NOT NULL,
+    thread_id TEXT,
+    subject TEXT,
+    sender TEXT,
+    recipients TEXT,
+    snippet TEXT,
+    date TEXT,
+    internal_date INTEGER,
+    label_ids TEXT,
+    has_attachments INTEGER,
+    PRIMARY KEY (user_id, msg_id)
+);
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (user_id, internal_date DESC);
+CREATE TABLE IF NOT EXISTS message_labels (
+    user_id TEXT NOT NULL,
+    label_id TEXT NOT NULL,
+    msg_id TEXT NOT NULL,
+    PRIMARY KEY (user_id, label_id, msg_id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id TEXT PRIMARY KEY,
+    history_id TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class MailboxMirror:
+    """
+    Local SQLite mirror of a user's message metadata.
+
+    The first sync scans the mailbox; after that only the changes since the
+    stored historyId are applied with users.history.list. When Gmail reports
+    that the historyId is too old (404) the mirror falls back to a full scan.
+
+    The full scan keeps the newest FULL_SCAN_LIMIT messages and, like
+    messages.list, leaves out spam and trash; is_complete() tells whether it
+    reached the end of the mailbox. search() never returns spam or trash.
+
+    http() returns the transport for the Gmail requests of the current
+    thread (see GmailTools._http); without it the service's own is used.
+    """
+
+    DB_PATH = os.getenv("GMAIL_MIRROR_DB", "gmail_mirror.sqlite3")
+
+    # כמה הודעות אחרונות נשמרות בסריקה המלאה
+    FULL_SCAN_LIMIT = int(os.getenv("GMAIL_MIRROR_FULL_SCAN_LIMIT", "2000"))
+
+    # לא יותר מסנכרון אחד בפרק הזמן הזה
+    SYNC_INTERVAL_SECONDS = float(os.getenv("GMAIL_MIRROR_SYNC_INTERVAL", "30"))
+
+    BATCH_SIZE = 50
+
+    METADATA_HEADERS = ["Subject", "From", "To", "Date", "Content-Type"]
+
+    METADATA_FIELDS = "id,threadId,labelIds,snippet,internalDate,payload(headers)"
+
+    _schema_lock = Lock()
+
+    def __init__(self, user_id: str, service, db_path: str | None = None, http=None):
+        self.user_id = user_id
+        self.service = service
+        self.http = http or (lambda: None)
+        self.db_path = db_path or self.DB_PATH
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self._lock = Lock()
+        with self._schema_lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+            columns = {
+                row["name"] for row in self.db.execute("PRAGMA table_info(sync_state)")
+            }
+            if "complete" not in columns:
+                # מראה מגרסה קודמת: לא ידוע אם הסריקה הגיעה לסוף התיבה
+                self.db.execute(
+                    "ALTER TABLE sync_state ADD COLUMN complete INTEGER NOT NULL DEFAULT 0"
+                )
+
+    def close(self) -> None:
+        self.db.close()
+
+    def history_id(self) -> str | None:
+        row = self.db.execute(
+            "SELECT history_id FROM sync_state WHERE user_id = ?", (self.user_id,)
+        ).fetchone()
+        return row["history_id"] if row else None
+
+    def is_complete(self) -> bool:
+        """
+        Whether the last full scan reached the end of the mailbox.
+        """
+        row = self.db.execute(
+            "SELECT complete FROM sync_state WHERE user_id = ?", (self.user_id,)
+        ).fetchone()
+        return bool(row and row["complete"])
+
+    def sync(self, force: bool = False) -> str:
+        """
+        Bring the mirror up to date.
+
+        Returns which kind of sync ran: "full", "incremental" or "skipped".
+        """
+        with self._lock:
+            state = self.db.execute(
+                "SELECT history_id, synced_at FROM sync_state WHERE user_id = ?",
+                (self.user_id,),
+            ).fetchone()
+
+            if state is None:
+                self._full_sync()
+                return "full"
+
+            if not force and time.time() - state["synced_at"] < self.SYNC_INTERVAL_SECONDS:
+                return "skipped"
+
+            try:
+                self._incremental_sync(state["history_id"])
+                return "incremental"
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                print(f"historyId expired for user {self.user_id}, running full sync")
+                self._full_sync()
+                return "full"
+
+    def _full_sync(self) -> None:
+        # ה-historyId נלקח לפני הסריקה, כך ששינויים שקרו בזמן הסריקה ייושמו בסנכרון הבא
+        profile = self.service.users().getProfile(userId="me").execute(http=self.http())
+
+        msg_ids = []
+        page_token = None
+        while len(msg_ids) < self.FULL_SCAN_LIMIT:
+            params = {
+                "userId": "me",
+                "maxResults": min(500, self.FULL_SCAN_LIMIT - len(msg_ids)),
+            }
+            if page_token:
+                params["pageToken"] = page_token
+            result = (
+                self.service.users().messages().list(**params).execute(http=self.http())
+            )
+            msg_ids.extend(m["id"] for m in result.get("messages", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+
+        messages = self._fetch_metadata(msg_ids)
+
+        with self.db:
+            self.db.execute("DELETE FROM messages WHERE user_id = ?", (self.user_id,))
+            self.db.execute(
+                "DELETE FROM message_labels WHERE user_id = ?", (self.user_id,)
+            )
+            self._upsert_messages(messages)
+            self._save_state(profile["historyId"], complete=page_token is None)
+
+    def _incremental_sync(self, history_id: str) -> None:
+        added = {}
+        deleted = set()
+        label_changes = []
+        latest_history_id = history_id
+        page_token = None
+
+        while True:
+            params = {"userId": "me", "startHistoryId": history_id}
+            if page_token:
+                params["pageToken"] = page_token
+            result = (
+                self.service.users().history().list(**params).execute(http=self.http())
+            )
+
+            for record in result.get("history", []):
+                for item in record.get("messagesAdded", []):
+                    added[item["message"]["id"]] = True
+                    deleted.discard(item["message"]["id"])
+                for item in record.get("messagesDeleted", []):
+                    added.pop(item["message"]["id"], None)
+                    deleted.add(item["message"]["id"])
+                for item in record.get("labelsAdded", []):
+                    label_changes.append((item["message"]["id"], item["labelIds"], []))
+                for item in record.get("labelsRemoved", []):
+                    label_changes.append((item["message"]["id"], [], item["labelIds"]))
+
+            latest_history_id = result.get("historyId", latest_history_id)
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+
+        messages = self._fetch_metadata(list(added))
+
+        with self.db:
+            self._upsert_messages(messages)
+            for msg_id, labels_added, labels_removed in label_changes:
+                if msg_id not in added and msg_id not in deleted:
+                    self._change_labels(msg_id, labels_added, labels_removed)
+            for msg_id in deleted:
+                self._delete_message(msg_id)
+            self._save_state(latest_history_id)
+
+    def _fetch_metadata(self, msg_ids: list[str]) -> list[dict]:
+        messages = []
+
+        def collect(request_id, response, exception):
+            # הודעה שנמחקה בין ה-history לשליפה מחזירה 404 - פשוט מדלגים
+            if exception is None:
+                messages.append(response)
+
+        for start in range(0, len(msg_ids), self.BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=collect)
+            for msg_id in msg_ids[start : start + self.BATCH_SIZE]:
+                batch.add(
+                    self.service.users()
+                    .messages()
+                    .get(
+                        userId="me",
+                        id=msg_id,
+                        format="metadata",
+                        metadataHeaders=self.METADATA_HEADERS,
+                        fields=self.METADATA_FIELDS,
+                    )
+                )
+            batch.execute(http=self.http())
+
+        return messages
+
+    def _upsert_messages(self, messages: list[dict]) -> None:
+        for message in messages:
+            headers = {
+                h["name"].lower(): h["value"]
+                for h in message.get("payload", {}).get("headers", [])
+            }
+            label_ids = message.get("labelIds", [])
+            self.db.execute(
+                """
+                INSERT OR REPLACE INTO messages (
+                    user_id, msg_id, thread_id, subject, sender, recipients,
+                    snippet, date, internal_date, label_ids, has_attachments
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    self.user_id,
+                    message["id"],
+                    message.get("threadId"),
+                    headers.get("subject", ""),
+                    headers.get("from", ""),
+                    headers.get("to", ""),
+                    message.get("snippet", ""),
+                    headers.get("date", ""),
+                    int(message.get("internalDate", 0)),
+                    ",".join(label_ids),
+                    headers.get("content-type", "")
+                    .lower()
+                    .startswith("multipart/mixed"),
+                ),
+            )
+            self.db.execute(
+                "DELETE FROM message_labels WHERE user_id = ? AND msg_id = ?",
+                (self.user_id, message["id"]),
+            )
+            self.db.executemany(
+                "INSERT INTO message_labels (user_id, label_id, msg_id) VALUES (?, ?, ?)",
+                [(self.user_id, label_id, message["id"]) for label_id in label_ids],
+            )
+
+    def _change_labels(
+        self, msg_id: str, labels_added: list[str], labels_removed: list[str]
+    ) -> None:
+        row = self.db.execute(
+            "SELECT label_ids FROM messages WHERE user_id = ? AND msg_id = ?",
+            (self.user_id, msg_id),
+        ).fetchone()
+        if row is None:
+            return
+        label_ids = [label for label in row["label_ids"].split(",") if label]
+        label_ids = [label for label in label_ids if label not in labels_removed]
+        label_ids += [label for label in labels_added if label not in label_ids]
+        self.db.execute(
+            "UPDATE messages SET label_ids = ? WHERE user_id = ? AND msg_id = ?",
+            (",".join(label_ids), self.user_id, msg_id),
+        )
+        self.db.executemany(
+            "DELETE FROM message_labels WHERE user_id = ? AND label_id = ? AND msg_id = ?",
+            [(self.user_id, label_id, msg_id) for label_id in labels_removed],
+        )
+        self.db.executemany(
+            "INSERT OR IGNORE INTO message_labels (user_id, label_id, msg_id) VALUES (?, ?, ?)",
+            [(self.user_id, label_id, msg_id) for label_id in labels_added],
+        )
+
+    def _delete_message(self, msg_id: str) -> None:
+        self.db.execute(
+            "DELETE FROM messages WHERE user_id = ? AND msg_id = ?",
+            (self.user_id, msg_id),
+        )
+        self.db.execute(
+            "DELETE FROM message_labels WHERE user_id = ? AND msg_id = ?",
+            (self.user_id, msg_id),
+        )
+
+    def _save_state(self, history_id: str, complete: bool | None = None) -> None:
+        if complete is None:
+            # סנכרון חלקי לא משנה את הכיסוי של הסריקה המלאה
+            self.db.execute(
+                "UPDATE sync_state SET history_id = ?, synced_at = ? WHERE user_id = ?",
+                (str(history_id), time.time(), self.user_id),
+            )
+            return
+        self.db.execute(
+            "INSERT OR REPLACE INTO sync_state (user_id, history_id, synced_at, complete)"
+            " VALUES (?, ?, ?, ?)",
+            (self.user_id, str(history_id), time.time(), int(complete)),
+        )
+
+    def search(
+        self,
+        label: str | None = None,
+        sender: str | None = None,
+        max_results: int | None = 10,
+        offset: int = 0,
+    ) -> list[dict]:
+        """
+        Return mirrored messages, newest first, filtered by label and/or sender.
+        """
+        sql = "SELECT m.* FROM messages m"
+        params: list = []
+        if label:
+            sql += (
+                " JOIN message_labels l ON l.user_id = m.user_id"
+                " AND l.msg_id = m.msg_id AND l.label_id = ?"
+            )
+            params.append(label.upper())
+        sql += " WHERE m.user_id = ?"
+        params.append(self.user_id)
+        # כמו messages.list בלי includeSpamTrash (history מוסיף גם הודעות spam)
+        sql += (
+            " AND NOT EXISTS (SELECT 1 FROM message_labels x WHERE x.user_id = m.user_id"
+            " AND x.msg_id = m.msg_id AND x.label_id IN ('SPAM', 'TRASH'))"
+        )
+        if sender:
+            sql += " AND m.sender LIKE ?"
+            params.append(f"%{sender}%")
+        sql += " ORDER BY m.internal_date DESC"
+        if max_results:
+            sql += " LIMIT ? OFFSET ?"
+            params += [max_results, offset]
+        elif offset:
+            sql += " LIMIT -1 OFFSET ?"
+            params.append(offset)
+        return [dict(row) for row in self.db.execute(sql, params)]
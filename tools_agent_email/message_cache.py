@@ -0,0 +1,107 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from dotenv import load_dotenv
+
+
+load_dotenv(override=True)
+
+
+class MessageCache:
+    """
+    LRU cache with TTL for Gmail messages of a single user.
+
+    Each entry keeps the parsed EmailMessage together with the raw message
+    resource, and whether the body was fetched (format=full) or only the
+    metadata. A full entry also answers metadata lookups, not the other way.
+    """
+
+    MAX_SIZE = int(os.getenv("GMAIL_MESSAGE_CACHE_SIZE", "500"))
+
+    TTL_SECONDS = float(os.getenv("GMAIL_MESSAGE_CACHE_TTL", "300"))
+
+    # מספר המשתמשים המקסימלי שנשמר להם cache בתהליך
+    MAX_USERS = int(os.getenv("GMAIL_MESSAGE_CACHE_USERS", "1000"))
+
+    _caches: "OrderedDict[str, MessageCache]" = OrderedDict()
+
+    _caches_lock = Lock()
+
+    def __init__(self, max_size: int | None = None, ttl: float | None = None):
+        self.max_size = max_size or self.MAX_SIZE
+        self.ttl = ttl if ttl is not None else self.TTL_SECONDS
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def for_user(cls, user_id: str) -> "MessageCache":
+        """
+        Return the cache shared by all GmailTools instances of this user.
+        """
+        with cls._caches_lock:
+            cache = cls._caches.get(user_id)
+            if cache is None:
+                cache = cls()
+                cls._caches[user_id] = cache
+                if len(cls._caches) > cls.MAX_USERS:
+                    cls._caches.popitem(last=False)
+            else:
+                cls._caches.move_to_end(user_id)
+            return cache
+
+    def get(self, msg_id: str, full: bool = False) -> dict | None:
+        """
+        Return the entry for msg_id, or None on a miss.
+
+        With full=True only entries that include the message body count as a hit.
+        """
+        with self._lock:
+            entry = self._entries.get(msg_id)
+            if entry is not None and entry["expires_at"] <= time.monotonic():
+                del self._entries[msg_id]
+                self.expirations += 1
+                entry = None
+            if entry is None or (full and not entry["full"]):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(msg_id)
+            self.hits += 1
+            return entry
+
+    def put(self, msg_id: str, message, raw: dict, full: bool) -> None:
+        with self._lock:
+            self._entries[msg_id] = {
+                "message": message,
+                "raw": raw,
+                "full": full,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            self._entries.move_to_end(msg_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *msg_ids: str) -> None:
+        with self._lock:
+            for msg_id in msg_ids:
+                self._entries.pop(msg_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
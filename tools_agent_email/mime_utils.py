@@ -0,0 +1,153 @@
+import base64
+import re
+from html.parser import HTMLParser
+
+
+TRUNCATED_MARKER = "\n\n[message truncated]"
+
+CHARSET = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+
+BLOCK_TAGS = {
+    "br", "p", "div", "li", "tr", "table", "blockquote",
+    "h1", "h2", "h3", "h4", "h5", "h6",
+}
+
+SKIP_TAGS = {"script", "style", "head", "title"}
+
+
+class _HtmlToText(HTMLParser):
+    def __init__(self, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.chunks: list[str] = []
+        self.length = 0
+        self.skip_depth = 0
+
+    def _append(self, text: str) -> None:
+        if self.length < self.max_chars:
+            self.chunks.append(text)
+            self.length += len(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self._append(data)
+
+
+def html_to_text(html: str, max_chars: int | None = None) -> str:
+    """
+    Convert HTML to readable plain text, dropping scripts, styles and markup.
+    """
+    parser = _HtmlToText(max_chars or len(html))
+    parser.feed(html)
+    parser.close()
+    text = "".join(parser.chunks)
+    text = re.sub(r"[ \t\r\f\v]+", " ", text)
+    text = re.sub(r"\s*\n\s*", "\n", text)
+    return text.strip()
+
+
+def decode_part_data(data: str, charset: str = "utf-8", max_bytes: int | None = None) -> tuple[str, bool]:
+    """
+    Decode the base64url body of a message part, at most max_bytes of it.
+
+    Returns the text and whether it was cut short.
+    """
+    truncated = False
+    if max_bytes is not None and len(data) * 3 // 4 > max_bytes:
+        # כל 4 תווי base64 הם 3 בתים - מפענחים רק את התחילה
+        data = data[: (max_bytes // 3) * 4]
+        truncated = True
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    try:
+        text = raw.decode(charset, errors="replace")
+    except LookupError:
+        text = raw.decode("utf-8", errors="replace")
+    if truncated:
+        # תו מרובה-בתים שנחתך באמצע
+        text = text.rstrip("\ufffd")
+    return text, truncated
+
+
+def _header(part: dict, name: str) -> str:
+    return next(
+        (
+            h["value"]
+            for h in part.get("headers", [])
+            if h["name"].lower() == name.lower()
+        ),
+        "",
+    )
+
+
+def _is_attachment(part: dict) -> bool:
+    return bool(
+        part.get("filename")
+        or part.get("body", {}).get("attachmentId")
+        or _header(part, "Content-Disposition").lower().startswith("attachment")
+    )
+
+
+def walk_parts(payload: dict):
+    """
+    Yield every leaf part of a message payload in document order, without recursion.
+    """
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get("parts")
+        if children:
+            stack.extend(reversed(children))
+        else:
+            yield part
+
+
+def has_attachments(payload: dict) -> bool:
+    return any(_is_attachment(part) for part in walk_parts(payload))
+
+
+def extract_body(payload: dict, max_chars: int, max_bytes: int) -> str:
+    """
+    Pick the best text part of a message (text/plain, otherwise text/html
+    converted to text) and decode at most max_bytes / max_chars of it.
+    Attachment payloads are never decoded.
+    """
+    html_part = None
+    chosen = None
+    for part in walk_parts(payload):
+        if _is_attachment(part) or not part.get("body", {}).get("data"):
+            continue
+        mime_type = part.get("mimeType", "").lower()
+        if mime_type == "text/plain":
+            chosen = part
+            break
+        if mime_type == "text/html" and html_part is None:
+            html_part = part
+
+    chosen = chosen or html_part
+    if chosen is None:
+        return ""
+
+    match = CHARSET.search(_header(chosen, "Content-Type"))
+    charset = match.group(1) if match else "utf-8"
+    text, truncated = decode_part_data(chosen["body"]["data"], charset, max_bytes)
+
+    if chosen["mimeType"].lower() == "text/html":
+        text = html_to_text(text, max_chars + 1)
+
+    if len(text) > max_chars:
+        text = text[:max_chars]
+        truncated = True
+
+    return text + TRUNCATED_MARKER if truncated else text
@@ -0,0 +1,83 @@
+import base64
+import mimetypes
+import os
+import uuid
+from email.mime.text import MIMEText
+from email.policy import SMTP
+from email.utils import encode_rfc2231
+
+
+# 57 בתים גולמיים = שורת base64 אחת של 76 תווים, כמו ש-email.encoders מייצר
+BASE64_LINE_BYTES = 57
+
+READ_CHUNK_BYTES = BASE64_LINE_BYTES * 1024
+
+
+def _header(name: str, value: str) -> bytes:
+    # header_store_parse דוחה CR/LF (הזרקת headers), ובכתובות מקודד רק שם התצוגה
+    return SMTP.fold_binary(*SMTP.header_store_parse(name, value))
+
+
+def _filename_param(filename: str) -> str:
+    if filename.isascii():
+        return f'filename="{filename}"'
+    return f"filename*={encode_rfc2231(filename, 'utf-8')}"
+
+
+def _write_base64(fp, path: str) -> None:
+    with open(path, "rb") as source:
+        while True:
+            chunk = source.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            for start in range(0, len(chunk), BASE64_LINE_BYTES):
+                fp.write(base64.b64encode(chunk[start : start + BASE64_LINE_BYTES]))
+                fp.write(b"\r\n")
+
+
+def write_mime_message(
+    fp,
+    to: str,
+    subject: str,
+    body: str,
+    body_type: str,
+    attachment_paths: list[str],
+) -> None:
+    """
+    Write a multipart/mixed message to the binary file object fp.
+
+    Attachments are read and base64-encoded in small chunks, so memory use
+    does not depend on their size. Raises ValueError when to or subject
+    contains a line break.
+    """
+    boundary = f"===============_{uuid.uuid4().hex}"
+
+    fp.write(b"MIME-Version: 1.0\r\n")
+    fp.write(_header("To", to))
+    fp.write(_header("Subject", subject))
+    fp.write(
+        (
+            f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n'
+            "\r\n"
+        ).encode("ascii")
+    )
+
+    fp.write(f"--{boundary}\r\n".encode("ascii"))
+    fp.write(MIMEText(body, body_type, "utf-8").as_bytes().replace(b"\n", b"\r\n"))
+    fp.write(b"\r\n")
+
+    for attachment_path in attachment_paths:
+        filename = os.path.basename(attachment_path)
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        fp.write(
+            (
+                f"--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                "Content-Transfer-Encoding: base64\r\n"
+                f"Content-Disposition: attachment; {_filename_param(filename)}\r\n"
+                "\r\n"
+            ).encode("ascii")
+        )
+        _write_base64(fp, attachment_path)
+
+    fp.write(f"--{boundary}--\r\n".encode("ascii"))
@@ -0,0 +1,254 @@
+import hashlib
+import os
+import re
+import sqlite3
+from threading import Lock
+
+from dotenv import load_dotenv
+
+
+load_dotenv(override=True)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_docs (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    msg_id TEXT NOT NULL,
+    recipients TEXT,
+    date TEXT,
+    has_attachments INTEGER,
+    star INTEGER,
+    label TEXT,
+    UNIQUE (user_id, msg_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS message_index USING fts5(
+    subject, sender, snippet, body, terms, owner,
+    tokenize = "unicode61 remove_diacritics 2"
+);
+"""
+
+# העמודות שהטקסט של השאילתה מחפש בהן (בלי owner)
+TEXT_COLUMNS = "{subject sender snippet body terms}"
+
+# ניקוד וטעמים
+NIQQUD = re.compile("[\u0591-\u05C7]")
+
+# גרש וגרשיים בתוך מילה (דו"ח, דו״ח) - מסירים כדי שהמילה לא תתפצל לשני טוקנים
+GERESH = re.compile("(?<=[\u05D0-\u05EA])[\"'\u05F3\u05F4](?=[\u05D0-\u05EA])")
+
+HEBREW_WORD = re.compile("[\u05D0-\u05EA]+")
+
+QUERY_TOKEN = re.compile(r"\w+")
+
+# אותיות שימוש שנצמדות לתחילת מילה: ו, ה, ב, כ, ל, מ, ש
+HEBREW_PREFIXES = "והבכלמש"
+
+MAX_PREFIX_LETTERS = 3
+
+
+def normalize_text(text: str) -> str:
+    return GERESH.sub("", NIQQUD.sub("", text or ""))
+
+
+def strip_hebrew_prefixes(word: str) -> list[str]:
+    """
+    Variants of a Hebrew word without its leading prefix letters,
+    e.g. "וכשהחשבונית" -> ["כשהחשבונית", "שהחשבונית", "החשבונית"].
+    """
+    variants = []
+    for _ in range(MAX_PREFIX_LETTERS):
+        if len(word) <= 3 or word[0] not in HEBREW_PREFIXES:
+            break
+        word = word[1:]
+        variants.append(word)
+    return variants
+
+
+def hebrew_terms(text: str) -> str:
+    terms = []
+    for word in HEBREW_WORD.findall(text):
+        terms.extend(strip_hebrew_prefixes(word))
+    return " ".join(terms)
+
+
+def build_match_query(query: str) -> str | None:
+    """
+    Turn free text into an FTS5 MATCH expression: every word must match
+    (as a prefix), and a Hebrew word also matches without its prefix letters.
+    """
+    clauses = []
+    for token in QUERY_TOKEN.findall(normalize_text(query)):
+        options = [token]
+        if HEBREW_WORD.fullmatch(token):
+            options += strip_hebrew_prefixes(token)
+        clauses.append(
+            "(" + " OR ".join(f'"{option}"*' for option in options) + ")"
+        )
+    return " AND ".join(clauses) if clauses else None
+
+
+class SearchIndex:
+    """
+    Local full-text index (SQLite FTS5) over the messages GmailTools has fetched.
+
+    Results are ranked with BM25; subject matches weigh the most, then sender,
+    snippet and body. Every row carries an owner token of its user, and the
+    MATCH query requires it, so ranking and LIMIT only see this user's mail.
+    """
+
+    DB_PATH = os.getenv("GMAIL_SEARCH_INDEX_DB", "gmail_search_index.sqlite3")
+
+    # משקלי BM25 לפי סדר העמודות: subject, sender, snippet, body, terms, owner
+    BM25_WEIGHTS = (10.0, 5.0, 2.0, 1.0, 1.0, 0.0)
+
+    def __init__(self, user_id: str, db_path: str | None = None):
+        self.user_id = user_id
+        # טוקן אחד ל-unicode61 (user_id יכול להכיל מקפים)
+        self.owner = "u" + hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        self.db_path = db_path or self.DB_PATH
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self._lock = Lock()
+        with self._lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            columns = {
+                row["name"] for row in self.db.execute("PRAGMA table_info(message_index)")
+            }
+            if columns and "owner" not in columns:
+                # אינדקס מגרסה קודמת, בלי owner. אי אפשר להוסיף עמודה ל-FTS5,
+                # והאינדקס נבנה מחדש מההודעות שנשלפות
+                self.db.execute("DROP TABLE message_index")
+                self.db.execute("DELETE FROM message_docs")
+            self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def add(self, message) -> None:
+        """
+        Index an EmailMessage, or refresh it if it is already indexed.
+
+        A message listed without its body keeps the body indexed earlier.
+        """
+        with self._lock, self.db:
+            self.db.execute(
+                """
+                INSERT INTO message_docs (
+                    user_id, msg_id, recipients, date, has_attachments, star, label
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, msg_id) DO UPDATE SET
+                    recipients = excluded.recipients,
+                    date = excluded.date,
+                    has_attachments = excluded.has_attachments,
+                    star = excluded.star,
+                    label = excluded.label
+                """,
+                (
+                    self.user_id,
+                    message.msg_id,
+                    message.recipients,
+                    message.date,
+                    message.has_attachments,
+                    message.star,
+                    message.label,
+                ),
+            )
+            doc_id = self.db.execute(
+                "SELECT id FROM message_docs WHERE user_id = ? AND msg_id = ?",
+                (self.user_id, message.msg_id),
+            ).fetchone()["id"]
+
+            body = message.body
+            if not body:
+                previous = self.db.execute(
+                    "SELECT body FROM message_index WHERE rowid = ?", (doc_id,)
+                ).fetchone()
+                body = previous["body"] if previous else ""
+
+            subject = normalize_text(message.subject)
+            sender = normalize_text(message.sender)
+            snippet = normalize_text(message.snippet)
+            body = normalize_text(body)
+
+            self.db.execute("DELETE FROM message_index WHERE rowid = ?", (doc_id,))
+            self.db.execute(
+                """
+                INSERT INTO message_index (
+                    rowid, subject, sender, snippet, body, terms, owner
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    doc_id,
+                    subject,
+                    sender,
+                    snippet,
+                    body,
+                    hebrew_terms(" ".join((subject, snippet, body))),
+                    self.owner,
+                ),
+            )
+
+    def remove(self, *msg_ids: str) -> None:
+        with self._lock, self.db:
+            for msg_id in msg_ids:
+                row = self.db.execute(
+                    "SELECT id FROM message_docs WHERE user_id = ? AND msg_id = ?",
+                    (self.user_id, msg_id),
+                ).fetchone()
+                if row is None:
+                    continue
+                self.db.execute("DELETE FROM message_index WHERE rowid = ?", (row["id"],))
+                self.db.execute("DELETE FROM message_docs WHERE id = ?", (row["id"],))
+
+    def change_labels(self, msg_ids, added=(), removed=()) -> None:
+        """
+        Apply a label change (e.g. a batch modify) to the indexed messages among msg_ids.
+        """
+        with self._lock, self.db:
+            for msg_id in msg_ids:
+                row = self.db.execute(
+                    "SELECT id, label FROM message_docs WHERE user_id = ? AND msg_id = ?",
+                    (self.user_id, msg_id),
+                ).fetchone()
+                if row is None:
+                    continue
+                labels = [
+                    label
+                    for label in (row["label"] or "").split(", ")
+                    if label and label not in removed
+                ]
+                labels += [label for label in added if label not in labels]
+                self.db.execute(
+                    "UPDATE message_docs SET label = ?, star = ? WHERE id = ?",
+                    (", ".join(labels), "STARRED" in labels, row["id"]),
+                )
+
+    def search(self, query: str, max_results: int = 10) -> list[dict]:
+        """
+        Return the best matching messages of this user, most relevant first.
+        """
+        match_query = build_match_query(query)
+        if not match_query:
+            return []
+
+        weights = ", ".join(str(weight) for weight in self.BM25_WEIGHTS)
+        with self._lock:
+            rows = self.db.execute(
+                f"""
+                SELECT d.msg_id, d.recipients, d.date, d.has_attachments, d.star,
+                       d.label, i.subject, i.sender, i.snippet,
+                       bm25(message_index, {weights}) AS rank
+                FROM message_index i
+                JOIN message_docs d ON d.id = i.rowid
+                WHERE message_index MATCH ?
+                ORDER BY rank
+                LIMIT ?
+                """,
+                (
+                    f'owner:"{self.owner}" AND {TEXT_COLUMNS}: ({match_query})',
+                    max_results,
+                ),
+            ).fetchall()
+        return [dict(row) for row in rows]
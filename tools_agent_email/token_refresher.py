@@ -0,0 +1,194 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+
+from dotenv import load_dotenv
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+
+load_dotenv(override=True)
+
+
+class RefreshingCredentials(Credentials):
+    """
+    Credentials whose refresh() goes through a TokenRefresher.
+
+    google-auth also refreshes on its own: AuthorizedHttp after a 401 and
+    before_request when the token has expired. With these credentials such a
+    refresh joins the user's single in-flight refresh, and the new token is
+    stored and persisted like any other.
+    """
+
+    def __init__(self, *args, user_id=None, refresher=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_id = user_id
+        self.refresher = refresher
+
+    def refresh(self, request):
+        if self.refresher is None or self.user_id is None:
+            self.refresh_from_endpoint(request)
+        else:
+            self.refresher.refresh(self.user_id, self)
+
+    def refresh_from_endpoint(self, request):
+        """
+        Call the token endpoint. Only the TokenRefresher should use this.
+        """
+        super().refresh(request)
+
+
+class TokenRefresher:
+    """
+    Refreshes Google OAuth tokens with one in-flight refresh per user.
+
+    Concurrent callers for the same user wait for the refresh that is already
+    running and share its result. A background loop renews the tokens of
+    recently active users shortly before they expire, so the refresh is
+    normally not on the request path. A token whose expiry is not known is
+    treated as due.
+
+    This is the only code that calls the token endpoint: GoogleApis builds
+    RefreshingCredentials, so the refreshes google-auth starts by itself end
+    up here as well.
+
+    credentials_for(user_id, entry) builds Credentials from a TokenStore entry,
+    and on_refreshed(user_id, creds) stores / persists a refreshed token.
+    """
+
+    # כמה זמן לפני התפוגה מחדשים ברקע
+    REFRESH_MARGIN_SECONDS = float(os.getenv("GMAIL_TOKEN_REFRESH_MARGIN", "300"))
+
+    # משתמש נחשב פעיל אם הייתה לו בקשה בחלון הזמן הזה
+    ACTIVE_WINDOW_SECONDS = float(os.getenv("GMAIL_TOKEN_ACTIVE_WINDOW", "1800"))
+
+    INTERVAL_SECONDS = float(os.getenv("GMAIL_TOKEN_REFRESH_INTERVAL", "60"))
+
+    def __init__(self, token_store, credentials_for, on_refreshed):
+        self.token_store = token_store
+        self.credentials_for = credentials_for
+        self.on_refreshed = on_refreshed
+        self._inflight: dict[str, Future] = {}
+        self._last_active: dict[str, float] = {}
+        self._lock = Lock()
+        self._task: asyncio.Task | None = None
+        self.refreshes = 0
+        self.coalesced = 0
+
+    def mark_active(self, user_id: str) -> None:
+        with self._lock:
+            self._last_active[user_id] = time.monotonic()
+
+    def refresh(self, user_id: str, creds) -> bool:
+        """
+        Refresh creds in place. Returns True if this call ran the refresh,
+        False if it waited for a refresh another caller had already started.
+        """
+        with self._lock:
+            future = self._inflight.get(user_id)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[user_id] = future
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                if not self._adopt_stored_token(user_id, creds):
+                    getattr(creds, "refresh_from_endpoint", creds.refresh)(Request())
+                    self.on_refreshed(user_id, creds)
+                future.set_result((creds.token, creds.expiry))
+                with self._lock:
+                    self.refreshes += 1
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(user_id, None)
+
+        token, expiry = future.result()
+        creds.token = token
+        creds.expiry = expiry
+        return leader
+
+    def _adopt_stored_token(self, user_id: str, creds) -> bool:
+        """
+        Use a newer token that a refresh finished just before this one started, if there is one.
+
+        A stored token without an expiry cannot be shown to be newer, so it is
+        refreshed rather than adopted. Creds without an expiry take any
+        stored token that has one.
+        """
+        entry = self.token_store.get(user_id)
+        if not entry or entry["access_token"] == creds.token:
+            return False
+        if entry["expiry"] is None:
+            return False
+        if creds.expiry is not None and entry["expiry"] <= creds.expiry:
+            return False
+        creds.token = entry["access_token"]
+        creds.expiry = entry["expiry"]
+        return not creds.expired
+
+    async def refresh_async(self, user_id: str, creds) -> bool:
+        return await asyncio.to_thread(self.refresh, user_id, creds)
+
+    def refresh_due(self) -> int:
+        """
+        Refresh the tokens of recently active users that expire within the margin,
+        or whose expiry is not known. Returns how many users were refreshed.
+        """
+        now = time.monotonic()
+        # google-auth שומר expiry כ-datetime נאיבי ב-UTC
+        deadline = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(
+            seconds=self.REFRESH_MARGIN_SECONDS
+        )
+        with self._lock:
+            active = {
+                user_id
+                for user_id, last_active in self._last_active.items()
+                if now - last_active <= self.ACTIVE_WINDOW_SECONDS
+            }
+            self._last_active = {
+                user_id: self._last_active[user_id] for user_id in active
+            }
+
+        refreshed = 0
+        for user_id, entry in self.token_store.items():
+            if user_id not in active or not entry["refresh_token"]:
+                continue
+            if entry["expiry"] is not None and entry["expiry"] > deadline:
+                continue
+            try:
+                self.refresh(user_id, self.credentials_for(user_id, entry))
+                refreshed += 1
+            except Exception as e:
+                print(f"Background token refresh failed for user {user_id}: {e}")
+        return refreshed
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.INTERVAL_SECONDS)
+            try:
+                refreshed = await asyncio.to_thread(self.refresh_due)
+                if refreshed:
+                    print(f"Background token refresh: {refreshed} users refreshed")
+            except Exception as e:
+                print(f"Background token refresh loop error: {e}")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,70 @@
+import os
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+
+from dotenv import load_dotenv
+
+
+load_dotenv(override=True)
+
+
+class TokenStore:
+    """
+    Bounded LRU store of Google OAuth tokens per user, with the access token expiry.
+
+    Entries are plain dicts: access_token, refresh_token and expiry (a naive
+    UTC datetime as google-auth uses, or None when unknown).
+    """
+
+    MAX_SIZE = int(os.getenv("GMAIL_TOKEN_CACHE_SIZE", "1000"))
+
+    def __init__(self, max_size: int | None = None):
+        self.max_size = max_size or self.MAX_SIZE
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = Lock()
+
+    def __contains__(self, user_id: str) -> bool:
+        with self._lock:
+            return user_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, user_id: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(user_id)
+            return dict(entry)
+
+    def put(
+        self,
+        user_id: str,
+        access_token: str | None,
+        refresh_token: str | None = None,
+        expiry: datetime | None = None,
+    ) -> None:
+        """
+        Store tokens for a user. A missing refresh token keeps the one stored before.
+        """
+        with self._lock:
+            previous = self._entries.get(user_id, {})
+            self._entries[user_id] = {
+                "access_token": access_token,
+                "refresh_token": refresh_token or previous.get("refresh_token"),
+                "expiry": expiry,
+            }
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def items(self) -> list[tuple[str, dict]]:
+        with self._lock:
+            return [(user_id, dict(entry)) for user_id, entry in self._entries.items()]